@@ -0,0 +1,324 @@
+"""Onde os registros ficam guardados: a planilha do Google (padrão) ou um SQLite local, atrás da mesma interface."""
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import uuid
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from dados import dias_dos_meses, novo_id, ordinais_de_datas
+from metricas import Metricas
+from planilhas import (
+    ABA_CONTROLE, ABA_RESUMOS, ABAS_DADOS, COLUNAS_CONTROLE, COLUNAS_POR_ABA, COLUNAS_RESUMOS,
+    ConexaoPlanilha, ler_abas, ler_carimbos, ler_meses, ler_meses_da_aba, ler_linhas_das_datas, localizar_linhas,
+    carimbar, gravar_datas, chave_da_linha,
+)
+
+
+class Armazenamento(ABC):
+    """Operações de leitura e gravação usadas pelo app, pelo gravador, pela sincronização e pelos resumos.
+
+    Linhas são listas de texto na ordem do cabeçalho, como na planilha; datas
+    em 'datas' e nas chaves de 'por_data' são datetime.date.
+    """
+
+    metricas = None
+
+    @abstractmethod
+    def ler_meses(self, meses):
+        """{aba: [cabecalho] + linhas} das abas de dados, só com as datas dos meses 'AAAA-MM'."""
+
+    @abstractmethod
+    def ler_meses_da_aba(self, aba, meses):
+        """[cabecalho] + linhas de uma aba de dados nos meses 'AAAA-MM', só lendo (não completa IDs)."""
+
+    @abstractmethod
+    def ler_carimbos(self):
+        """{(aba, 'AAAA-MM-DD'): carimbo} de todas as datas já gravadas."""
+
+    @abstractmethod
+    def ler_datas(self, aba, cabecalho, datas):
+        """{data: linhas} das datas pedidas; None se o cabeçalho guardado não é mais 'cabecalho'."""
+
+    @abstractmethod
+    def linhas_para_gravar(self, aba, datas, colunas):
+        """(cabecalho, {data: [(posicao, linha)]}) das datas, com o cabeçalho estendido até ter 'colunas'."""
+
+    @abstractmethod
+    def gravar_datas(self, aba, cabecalho, online_por_data, novas_por_data):
+        """Deixa guardadas as linhas de cada data iguais a 'novas_por_data'; retorna as datas alteradas."""
+
+    @abstractmethod
+    def carimbar(self, chaves):
+        """Carimbo novo para cada (aba, data); retorna {(aba, 'AAAA-MM-DD'): carimbo}."""
+
+    @abstractmethod
+    def ler_resumos(self):
+        """{mes: (assinatura, resumo em JSON)} dos resumos mensais guardados."""
+
+    @abstractmethod
+    def gravar_resumos(self, novos):
+        """Guarda {mes: (assinatura, resumo em JSON)}, substituindo os meses que já existiam."""
+
+    def fechar(self):
+        """Libera conexões e arquivos abertos; o objeto não é mais usado depois."""
+
+
+class ArmazenamentoPlanilha(Armazenamento):
+    """Google Sheets: uma aba por tipo de registro, mais as abas de controle e de resumos."""
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.metricas = conexao.metricas
+        self._lock = threading.RLock()
+        # Última leitura da aba de controle: carimbar() atualiza as linhas que já existem nela
+        self._controle = None
+        self._cabecalhos = {}
+        self._linhas_resumos = {}
+        self._proxima_linha_resumos = None
+
+    def ler_meses(self, meses):
+        return ler_meses(self.conexao, meses)
+
+    def ler_meses_da_aba(self, aba, meses):
+        return ler_meses_da_aba(self.conexao, aba, meses)
+
+    def ler_carimbos(self):
+        self.conexao.garantir_aba(ABA_CONTROLE, COLUNAS_CONTROLE)
+        self._controle = ler_abas(self.conexao, [ABA_CONTROLE])[ABA_CONTROLE]
+        return ler_carimbos(self._controle)
+
+    def ler_datas(self, aba, cabecalho, datas):
+        return ler_linhas_das_datas(self.conexao, aba, cabecalho, datas)
+
+    def linhas_para_gravar(self, aba, datas, colunas):
+        esperado = self._cabecalhos.get(aba, COLUNAS_POR_ABA[aba])
+        cabecalho, online = localizar_linhas(self.conexao, aba, esperado, datas)
+        if online is None:
+            # O cabeçalho online é outro: localiza de novo pela coluna Data certa
+            cabecalho, online = localizar_linhas(self.conexao, aba, cabecalho, datas)
+            if online is None:
+                raise RuntimeError(f"O cabeçalho da aba '{aba}' mudou durante a gravação.")
+        # Colunas que o app usa mas a planilha ainda não tem entram no final do cabeçalho
+        faltando = [c for c in dict.fromkeys(colunas) if c not in cabecalho]
+        if faltando:
+            cabecalho = cabecalho + faltando
+            self.conexao.executar(lambda: self.conexao.aba(aba).update([cabecalho], 'A1'))
+        self._cabecalhos[aba] = cabecalho
+        return cabecalho, online
+
+    def gravar_datas(self, aba, cabecalho, online_por_data, novas_por_data):
+        return gravar_datas(self.conexao, aba, cabecalho, online_por_data, novas_por_data)
+
+    def carimbar(self, chaves):
+        self.conexao.garantir_aba(ABA_CONTROLE, COLUNAS_CONTROLE)
+        if self._controle is None:
+            self.ler_carimbos()
+        return carimbar(self.conexao, self._controle, chaves)
+
+    def ler_resumos(self):
+        self.conexao.garantir_aba(ABA_RESUMOS, COLUNAS_RESUMOS)
+        valores = ler_abas(self.conexao, [ABA_RESUMOS])[ABA_RESUMOS]
+        resumos = {}
+        with self._lock:
+            for numero, linha in enumerate(valores[1:], start=2):
+                if len(linha) >= 3 and linha[0]:
+                    resumos.setdefault(linha[0], (linha[1], linha[2]))
+                    self._linhas_resumos[linha[0]] = numero
+            self._proxima_linha_resumos = max(len(valores), 1) + 1
+        return resumos
+
+    def gravar_resumos(self, novos):
+        with self._lock:
+            if self._proxima_linha_resumos is None:
+                self.ler_resumos()  # As posições dos meses já gravados vêm da leitura
+            atualizacoes, inserir = [], []
+            for mes, (assinatura, resumo) in sorted(novos.items()):
+                linha = [mes, assinatura, resumo]
+                if mes in self._linhas_resumos:
+                    numero = self._linhas_resumos[mes]
+                    atualizacoes.append({'range': f"A{numero}:C{numero}", 'values': [linha]})
+                else:
+                    self._linhas_resumos[mes] = self._proxima_linha_resumos
+                    self._proxima_linha_resumos += 1
+                    inserir.append(linha)
+            if atualizacoes:
+                self.conexao.executar(lambda: self.conexao.aba(ABA_RESUMOS).batch_update(atualizacoes))
+            if inserir:
+                self.conexao.executar(lambda: self.conexao.aba(ABA_RESUMOS).append_rows(inserir, table_range='A1'))
+
+    def fechar(self):
+        self.conexao.fechar()
+        self.metricas.fechar()
+
+
+_ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS cabecalhos (aba TEXT PRIMARY KEY, colunas TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS registros (
+    posicao INTEGER PRIMARY KEY AUTOINCREMENT,
+    aba TEXT NOT NULL,
+    dia INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    linha TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS registros_dia ON registros (aba, dia);
+DROP INDEX IF EXISTS registros_barbeiro;
+DROP INDEX IF EXISTS registros_cliente;
+DROP INDEX IF EXISTS registros_horario;
+CREATE TABLE IF NOT EXISTS controle (aba TEXT, data TEXT, carimbo TEXT, PRIMARY KEY (aba, data));
+CREATE TABLE IF NOT EXISTS resumos (mes TEXT PRIMARY KEY, assinatura TEXT, resumo TEXT);
+"""
+# Colunas de versões anteriores, copiadas da linha e nunca consultadas
+_COLUNAS_ANTIGAS = ('barbeiro', 'cliente', 'horario')
+
+
+class ArmazenamentoSQLite(Armazenamento):
+    """Arquivo SQLite local, para usar o app (e o benchmark) sem rede.
+
+    Cada registro guarda suas células em JSON, como um dicionário coluna ->
+    texto (a aba pode ganhar colunas, como na planilha), e à parte o dia
+    (ordinal) e o ID. Meses e datas são lidos por faixa no índice do dia, o
+    único da tabela.
+    """
+
+    def __init__(self, arquivo, metricas=None):
+        arquivo = Path(arquivo)
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        self.metricas = metricas or Metricas()
+        self._lock = threading.Lock()
+        self._banco = sqlite3.connect(arquivo, check_same_thread=False, isolation_level=None)
+        self._banco.execute('PRAGMA journal_mode=WAL')
+        self._banco.executescript(_ESQUEMA_SQLITE)
+        colunas = {linha[1] for linha in self._banco.execute('PRAGMA table_info(registros)')}
+        for coluna in _COLUNAS_ANTIGAS:
+            if coluna in colunas:
+                try:
+                    self._banco.execute(f'ALTER TABLE registros DROP COLUMN {coluna}')
+                except sqlite3.OperationalError:
+                    pass  # SQLite anterior ao 3.35: a coluna fica, preenchida pelo DEFAULT ''
+
+    def _consultar(self, sql, parametros=()):
+        with self._lock:
+            return self._banco.execute(sql, parametros).fetchall()
+
+    def _cabecalho(self, aba):
+        linha = self._consultar('SELECT colunas FROM cabecalhos WHERE aba = ?', (aba,))
+        return json.loads(linha[0][0]) if linha else list(COLUNAS_POR_ABA[aba])
+
+    def _linhas(self, aba, filtro, parametros):
+        """[(posicao, dia, {coluna: texto})] da aba que passam no filtro SQL, na ordem de gravação."""
+        return [
+            (posicao, dia, json.loads(linha))
+            for posicao, dia, linha in self._consultar(
+                f'SELECT posicao, dia, linha FROM registros WHERE aba = ? AND {filtro} ORDER BY posicao',
+                (aba, *parametros))
+        ]
+
+    def _das_datas(self, aba, datas):
+        ordinais = sorted({d.toordinal() for d in datas})
+        marcadores = ','.join('?' * len(ordinais))
+        return self._linhas(aba, f'dia IN ({marcadores})', ordinais) if ordinais else []
+
+    def ler_meses(self, meses):
+        return {aba: self.ler_meses_da_aba(aba, meses) for aba in ABAS_DADOS}
+
+    def ler_meses_da_aba(self, aba, meses):
+        dias = sorted(d.toordinal() for d in dias_dos_meses(meses))
+        # Meses seguidos viram uma faixa só no índice do dia
+        faixas = []
+        for dia in dias:
+            if faixas and faixas[-1][1] + 1 == dia:
+                faixas[-1][1] = dia
+            else:
+                faixas.append([dia, dia])
+        cabecalho = self._cabecalho(aba)
+        linhas = [linha for inicio, fim in faixas
+                  for _, _, linha in self._linhas(aba, 'dia BETWEEN ? AND ?', (inicio, fim))]
+        return [cabecalho] + [[linha.get(c, '') for c in cabecalho] for linha in linhas]
+
+    def ler_carimbos(self):
+        return {(aba, data): carimbo for aba, data, carimbo in self._consultar('SELECT aba, data, carimbo FROM controle')}
+
+    def ler_datas(self, aba, cabecalho, datas):
+        if list(cabecalho) != self._cabecalho(aba):
+            return None
+        por_data = {}
+        for _, dia, linha in self._das_datas(aba, datas):
+            por_data.setdefault(date.fromordinal(dia), []).append([linha.get(c, '') for c in cabecalho])
+        return por_data
+
+    def linhas_para_gravar(self, aba, datas, colunas):
+        cabecalho = self._cabecalho(aba)
+        cabecalho += [c for c in dict.fromkeys(colunas) if c not in cabecalho]
+        online = {}
+        for posicao, dia, linha in self._das_datas(aba, datas):
+            online.setdefault(date.fromordinal(dia), []).append((posicao, [linha.get(c, '') for c in cabecalho]))
+        return cabecalho, online
+
+    def gravar_datas(self, aba, cabecalho, online_por_data, novas_por_data):
+        largura = len(cabecalho)
+        alteradas = {
+            data for data, novas in novas_por_data.items()
+            if sorted(chave_da_linha(linha, largura) for linha in novas)
+            != sorted(chave_da_linha(linha, largura) for _, linha in online_por_data.get(data, []))
+        }
+        remover = [(posicao,) for data in alteradas for posicao, _ in online_por_data.get(data, [])]
+        registros = [dict(zip(cabecalho, map(str, linha))) for data in alteradas for linha in novas_por_data[data]]
+        dias = ordinais_de_datas(pd.Series([r.get('Data', '') for r in registros], dtype=object))
+        inserir = []
+        for registro, dia in zip(registros, dias):
+            registro['ID'] = registro.get('ID') or novo_id()
+            inserir.append((aba, int(dia), registro['ID'], json.dumps(registro, ensure_ascii=False)))
+        with self._lock:
+            self._banco.execute('BEGIN')
+            try:
+                self._banco.execute('INSERT OR REPLACE INTO cabecalhos (aba, colunas) VALUES (?, ?)',
+                                    (aba, json.dumps(list(cabecalho), ensure_ascii=False)))
+                self._banco.executemany('DELETE FROM registros WHERE posicao = ?', remover)
+                self._banco.executemany(
+                    'INSERT INTO registros (aba, dia, id, linha) VALUES (?, ?, ?, ?)',
+                    inserir)
+            except Exception:
+                self._banco.execute('ROLLBACK')
+                raise
+            self._banco.execute('COMMIT')
+        return alteradas
+
+    def carimbar(self, chaves):
+        novos = {}
+        for aba, data in chaves:
+            novos[(aba, data.strftime('%Y-%m-%d') if isinstance(data, date) else data)] = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._banco.executemany('INSERT OR REPLACE INTO controle (aba, data, carimbo) VALUES (?, ?, ?)',
+                                    [(aba, data, carimbo) for (aba, data), carimbo in novos.items()])
+        return novos
+
+    def ler_resumos(self):
+        return {mes: (assinatura, resumo) for mes, assinatura, resumo in
+                self._consultar('SELECT mes, assinatura, resumo FROM resumos')}
+
+    def gravar_resumos(self, novos):
+        with self._lock:
+            self._banco.executemany('INSERT OR REPLACE INTO resumos (mes, assinatura, resumo) VALUES (?, ?, ?)',
+                                    [(mes, assinatura, resumo) for mes, (assinatura, resumo) in novos.items()])
+
+    def fechar(self):
+        with self._lock:
+            self._banco.close()
+        self.metricas.fechar()
+
+
+def criar_armazenamento(tipo, pasta, sheet_id, credenciais=None, cota=None):
+    """'planilha' (Google Sheets) ou 'sqlite' (arquivo local em 'pasta'), com as métricas em pasta/sheet_id.
+
+    Quem cria guarda o objeto e chama fechar() ao descartá-lo (ver lojas_ativas).
+    """
+    metricas = Metricas(Path(pasta) / sheet_id / 'metricas.jsonl')
+    if tipo == 'planilha':
+        return ArmazenamentoPlanilha(ConexaoPlanilha(credenciais, sheet_id, metricas, cota))
+    if tipo == 'sqlite':
+        return ArmazenamentoSQLite(Path(pasta) / sheet_id / 'registros.sqlite3', metricas)
+    raise ValueError(f"Armazenamento desconhecido: {tipo!r} (use 'planilha' ou 'sqlite').")
@@ -0,0 +1,356 @@
+"""Benchmark do app contra uma planilha falsa em memória, com históricos sintéticos de vários tamanhos.
+
+Mede tempo, chamadas à API e células lidas/gravadas de cada etapa (login,
+mês aberto sob demanda, gravação, checagem de conflito e relatórios), sem
+rede nem credenciais, para pegar regressões antes de chegarem à barbearia.
+
+Uso:
+    python benchmark.py                          # 1, 3 e 10 anos de histórico
+    python benchmark.py --anos 1 5 --latencia 0.2 --json resultado.json
+    python benchmark.py --hoje 2026-03-13            # outra data de referência
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+from pathlib import Path
+
+import gspread
+from gspread.utils import a1_range_to_grid_range
+
+from armazenamento import ArmazenamentoPlanilha, ArmazenamentoSQLite
+from dados import ESQUEMA_SAIDAS, ESQUEMA_VENDAS, TabelaAgendamentos, TabelaRegistros, mes_de, meses_ao_redor, novo_id
+from gravador import Diario, Gravador
+from planilhas import (
+    ABA_AGENDAMENTOS, ABA_CONTROLE, ABA_SAIDAS, ABA_VENDAS, ABAS_DADOS, COLUNAS_CONTROLE, COLUNAS_POR_ABA,
+    ConexaoPlanilha,
+)
+from relatorios import resumo_periodo
+
+# Mesmas opções do formulário do app, com preços típicos
+SERVICOS = {"Degradê": 35, "Pezim": 15, "Barba": 20, "Social": 30, "Tradicional": 30, "Visagismo": 45, "Navalhado": 40}
+BARBEIROS = ["Aluízio", "Lucas Borges", "Erik"]
+PAGAMENTOS = ["Dinheiro", "Pix", "Cartão", "Dinheiro e Pix", "Cartão e Pix", "Cartão e Dinheiro"]
+HORARIOS = [f"{h:02d}:{m:02d}" for h in range(8, 22) for m in (0, 30)] + ["22:00"]
+SAIDAS = {"Luz": 180, "Água": 60, "Produtos": 120, "Lanche": 25, "Manutenção": 90}
+VENDAS = {"Pomada": 25, "Óleo para Barba": 30, "Shampoo": 35, "Gel": 20}
+# Data de referência fixa (uma sexta): com date.today() os números mudavam conforme
+# o dia da semana, e num domingo o dia de hoje saía vazio
+HOJE_PADRAO = date(2026, 10, 16)
+
+
+# --- Planilha falsa ---
+
+def _celulas(linhas):
+    return sum(len(linha) for linha in linhas)
+
+
+class AbaFalsa:
+    """Substituto em memória de gspread.Worksheet, só com os métodos que o app usa."""
+
+    def __init__(self, planilha, titulo, linhas, id_aba):
+        self.spreadsheet = planilha
+        self.title = titulo
+        self.id = id_aba
+        self.linhas = [list(linha) for linha in linhas]
+
+    def _escrever(self, inicio_linha, inicio_coluna, valores):
+        for i, valores_linha in enumerate(valores):
+            while len(self.linhas) <= inicio_linha + i:
+                self.linhas.append([])
+            linha = self.linhas[inicio_linha + i]
+            for j, valor in enumerate(valores_linha):
+                while len(linha) <= inicio_coluna + j:
+                    linha.append('')
+                linha[inicio_coluna + j] = '' if valor is None else str(valor)
+
+    def update(self, values, range_name='A1', **kwargs):
+        self.spreadsheet._contar('update', gravadas=_celulas(values))
+        faixa = a1_range_to_grid_range(range_name)
+        self._escrever(faixa.get('startRowIndex', 0), faixa.get('startColumnIndex', 0), values)
+
+    def batch_update(self, data, **kwargs):
+        self.spreadsheet._contar('batch_update', gravadas=sum(_celulas(d['values']) for d in data))
+        for d in data:
+            faixa = a1_range_to_grid_range(d['range'])
+            self._escrever(faixa.get('startRowIndex', 0), faixa.get('startColumnIndex', 0), d['values'])
+
+    def append_rows(self, values, **kwargs):
+        self.spreadsheet._contar('append_rows', gravadas=_celulas(values))
+        while self.linhas and not any(self.linhas[-1]):
+            self.linhas.pop()
+        self.linhas.extend(['' if v is None else str(v) for v in linha] for linha in values)
+
+
+class PlanilhaFalsa:
+    """Substituto em memória de gspread.Spreadsheet que conta chamadas e células e simula latência."""
+
+    def __init__(self, abas, latencia=0.0):
+        self.latencia = latencia
+        self._abas = {}
+        for titulo, linhas in abas.items():
+            self._abas[titulo] = AbaFalsa(self, titulo, linhas, len(self._abas))
+        self.zerar()
+
+    def zerar(self):
+        self.chamadas = Counter()
+        self.celulas_lidas = 0
+        self.celulas_gravadas = 0
+
+    def _contar(self, metodo, lidas=0, gravadas=0):
+        self.chamadas[metodo] += 1
+        self.celulas_lidas += lidas
+        self.celulas_gravadas += gravadas
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def worksheets(self):
+        self._contar('worksheets')
+        return list(self._abas.values())
+
+    def worksheet(self, titulo):
+        self._contar('worksheet')
+        if titulo not in self._abas:
+            raise gspread.exceptions.WorksheetNotFound(titulo)
+        return self._abas[titulo]
+
+    def add_worksheet(self, title, rows=100, cols=26, **kwargs):
+        self._contar('add_worksheet')
+        self._abas[title] = AbaFalsa(self, title, [], len(self._abas))
+        return self._abas[title]
+
+    def values_batch_get(self, ranges, params=None):
+        respostas, lidas = [], 0
+        for faixa in ranges:
+            titulo, _, a1 = faixa.rpartition('!') if '!' in faixa else (faixa, '', '')
+            linhas = self._abas[titulo.strip("'")].linhas
+            grade = a1_range_to_grid_range(a1) if a1 else {}
+            inicio, fim = grade.get('startRowIndex', 0), grade.get('endRowIndex', len(linhas))
+            coluna_inicio, coluna_fim = grade.get('startColumnIndex', 0), grade.get('endColumnIndex')
+            valores = [linha[coluna_inicio:coluna_fim] for linha in linhas[inicio:fim]]
+            # Como a API: sem células vazias no fim das linhas nem linhas vazias no fim da faixa
+            valores = [linha[:max((i + 1 for i, v in enumerate(linha) if v), default=0)] for linha in valores]
+            while valores and not valores[-1]:
+                valores.pop()
+            lidas += _celulas(valores)
+            respostas.append({'range': faixa, 'values': valores})
+        self._contar('values_batch_get', lidas=lidas)
+        return {'valueRanges': respostas}
+
+    def batch_update(self, body):
+        self._contar('batch_update_planilha')
+        por_id = {aba.id: aba for aba in self._abas.values()}
+        # A API aplica as exclusões na ordem: o app as manda de baixo para cima
+        for pedido in body.get('requests', []):
+            faixa = pedido['deleteDimension']['range']
+            del por_id[faixa['sheetId']].linhas[faixa['startIndex']:faixa['endIndex']]
+
+
+class ConexaoFalsa(ConexaoPlanilha):
+    """ConexaoPlanilha ligada a uma PlanilhaFalsa, sem autenticação."""
+
+    def __init__(self, planilha):
+        super().__init__({}, 'benchmark')
+        self._planilha_falsa = planilha
+
+    def _conectar(self):
+        self._spreadsheet = self._planilha_falsa
+        self._abas = {ws.title: ws for ws in self._spreadsheet.worksheets()}
+
+
+# --- Histórico sintético ---
+
+def gerar_historico(anos, fim, semente=0):
+    """Linhas (com cabeçalho) das três abas com 'anos' de movimento até 'fim' (domingos fechados)."""
+    aleatorio = random.Random(semente)
+    agendamentos = [COLUNAS_POR_ABA[ABA_AGENDAMENTOS]]
+    saidas = [COLUNAS_POR_ABA[ABA_SAIDAS]]
+    vendas = [COLUNAS_POR_ABA[ABA_VENDAS]]
+    dia = fim - timedelta(days=365 * anos - 1)
+    while dia <= fim:
+        texto = dia.strftime('%Y-%m-%d')
+        if dia.weekday() != 6:
+            for barbeiro in BARBEIROS:
+                for horario in aleatorio.sample(HORARIOS, aleatorio.randint(6, 18)):
+                    servico = aleatorio.choice(list(SERVICOS))
+                    valor = SERVICOS[servico]
+                    if aleatorio.random() < 0.3:
+                        servico, valor = f"{servico} com Barba", valor + 20
+                    pagamento = aleatorio.choice(PAGAMENTOS)
+                    valor1, valor2 = (valor / 2, valor / 2) if ' e ' in pagamento else (0, 0)
+                    agendamentos.append([texto, horario, f"Cliente {aleatorio.randint(1, 5000)}", servico, barbeiro,
+                                         pagamento, str(valor1), str(valor2), str(float(valor)), novo_id()])
+            for _ in range(aleatorio.randint(0, 2)):
+                descricao = aleatorio.choice(list(SAIDAS))
+                saidas.append([texto, descricao, str(float(SAIDAS[descricao])), novo_id()])
+            for _ in range(aleatorio.randint(0, 4)):
+                item = aleatorio.choice(list(VENDAS))
+                vendas.append([texto, item, str(float(VENDAS[item])), aleatorio.choice(BARBEIROS), novo_id()])
+        dia += timedelta(days=1)
+    return {
+        ABA_AGENDAMENTOS: agendamentos, ABA_SAIDAS: saidas, ABA_VENDAS: vendas,
+        ABA_CONTROLE: [COLUNAS_CONTROLE],
+    }
+
+
+# --- Cenários ---
+
+class CacheMemoria:
+    """Cache de resumos mensais só na memória (no lugar da aba de resumos)."""
+
+    def __init__(self):
+        self._resumos = {}
+
+    def obter(self, mes, assinatura):
+        guardado = self._resumos.get(mes)
+        return guardado[1] if guardado and guardado[0] == assinatura else None
+
+    def guardar(self, novos):
+        self._resumos.update(novos)
+
+
+def _tabelas(valores):
+    return (
+        TabelaAgendamentos.de_valores(valores[ABA_AGENDAMENTOS]),
+        TabelaRegistros.de_valores(valores[ABA_SAIDAS], ESQUEMA_SAIDAS),
+        TabelaRegistros.de_valores(valores[ABA_VENDAS], ESQUEMA_VENDAS),
+    )
+
+
+def medir(planilha, funcao):
+    """Executa funcao() e retorna (resultado, {tempo_ms, chamadas, celulas_lidas, celulas_gravadas})."""
+    planilha.zerar()
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return resultado, {
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 2),
+        'chamadas': sum(planilha.chamadas.values()),
+        'celulas_lidas': planilha.celulas_lidas,
+        'celulas_gravadas': planilha.celulas_gravadas,
+    }
+
+
+def _sqlite_com_historico(arquivo, historico):
+    """ArmazenamentoSQLite com as linhas do histórico, uma transação por aba."""
+    armazenamento = ArmazenamentoSQLite(arquivo)
+    for aba in ABAS_DADOS:
+        cabecalho, *linhas = historico[aba]
+        por_data = {}
+        for linha in linhas:
+            por_data.setdefault(date.fromisoformat(linha[0]), []).append(linha)
+        armazenamento.gravar_datas(aba, cabecalho, {}, por_data)
+    return armazenamento
+
+
+def rodar(anos, hoje, latencia, consultas, pasta, tipo='planilha'):
+    """Mede cada cenário sobre um histórico de 'anos' e retorna [(cenário, medidas)].
+
+    Com tipo 'sqlite' o histórico vai para um SQLite na pasta e a planilha
+    falsa só fica para as contagens (que ficam zeradas).
+    """
+    historico = gerar_historico(anos, hoje)
+    planilha = PlanilhaFalsa(historico, latencia)
+    if tipo == 'sqlite':
+        armazenamento = _sqlite_com_historico(Path(pasta) / f"registros_{anos}.sqlite3", historico)
+    else:
+        conexao = ConexaoFalsa(planilha)
+        conexao.spreadsheet  # Autenticação e metadados ficam fora das medidas
+        armazenamento = ArmazenamentoPlanilha(conexao)
+    resultados = []
+
+    def _login():
+        valores = armazenamento.ler_meses(meses_ao_redor(hoje, 1))
+        carimbos = armazenamento.ler_carimbos()
+        return (*_tabelas(valores), carimbos)
+
+    (ag, sai, ven, carimbos), medidas = medir(planilha, _login)
+    resultados.append(('login', medidas))
+
+    def _abrir_mes():
+        mes = mes_de(hoje.replace(day=1) - timedelta(days=200))
+        for tabela, nova in zip((ag, sai, ven), _tabelas(armazenamento.ler_meses([mes]))):
+            tabela.incorporar(nova)
+
+    resultados.append(('mês sob demanda', medir(planilha, _abrir_mes)[1]))
+
+    def _salvar():
+        diario = Diario(Path(pasta) / f"diario_{anos}.sqlite3")
+        for i, horario in enumerate(HORARIOS[:8]):
+            diario.registrar(ABA_AGENDAMENTOS, 'adicionar', {
+                'Data': hoje, 'Horário': horario, 'Cliente': f"Novo {i}", 'Serviço': 'Degradê', 'Barbeiro': 'Erik',
+                'Pagamento': 'Pix', 'Valor 1 (R$)': 0.0, 'Valor 2 (R$)': 0.0, 'Valor (R$)': 35.0, 'ID': novo_id(),
+            })
+        for registro in ag.do_dia(hoje)[:2]:
+            diario.registrar(ABA_AGENDAMENTOS, 'remover', registro)
+        Gravador(armazenamento, diario, em_segundo_plano=False).gravar_pendentes()
+
+    resultados.append(('salvar (10 operações)', medir(planilha, _salvar)[1]))
+
+    def _conflitos():
+        aleatorio = random.Random(1)
+        dias = [hoje - timedelta(days=aleatorio.randint(0, 60)) for _ in range(consultas)]
+        for dia in dias:
+            ag.horario_ocupado(dia, aleatorio.choice(HORARIOS), aleatorio.choice(BARBEIROS))
+
+    resultados.append((f"checagem de conflito (x{consultas})", medir(planilha, _conflitos)[1]))
+
+    def _relatorio_diario():
+        for tabela in (ag, sai, ven):
+            tabela.total_do_dia(hoje)
+            tabela.dataframe_do_dia(hoje)
+        ag.atendimentos_do_dia(hoje)
+
+    resultados.append(('relatório diário', medir(planilha, _relatorio_diario)[1]))
+
+    cache = CacheMemoria()
+    carregados = {mes_de(hoje), mes_de(hoje - timedelta(days=31))}
+
+    def _carregar_meses(meses):
+        faltando = sorted(set(meses) - carregados)
+        if faltando:
+            for tabela, nova in zip((ag, sai, ven), _tabelas(armazenamento.ler_meses(faltando))):
+                tabela.incorporar(nova)
+            carregados.update(faltando)
+        return []
+
+    def _relatorio_anual():
+        return resumo_periodo((ag, sai, ven), hoje - timedelta(days=364), hoje, carimbos, cache,
+                              hoje=hoje, carregar_meses=_carregar_meses)
+
+    resultados.append(('relatório de 12 meses', medir(planilha, _relatorio_anual)[1]))
+    resultados.append(('relatório de 12 meses (com resumos)', medir(planilha, _relatorio_anual)[1]))
+    return len(historico[ABA_AGENDAMENTOS]) - 1, resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--anos', type=int, nargs='+', default=[1, 3, 10], help="tamanhos do histórico, em anos")
+    parser.add_argument('--latencia', type=float, default=0.0, help="segundos somados a cada chamada à API")
+    parser.add_argument('--consultas', type=int, default=10000, help="checagens de conflito por rodada")
+    parser.add_argument('--armazenamento', choices=['planilha', 'sqlite'], default='planilha',
+                        help="onde ficam os registros durante a medição")
+    parser.add_argument('--hoje', type=date.fromisoformat, default=HOJE_PADRAO,
+                        help="data de referência, AAAA-MM-DD (padrão: %(default)s; domingos não têm movimento)")
+    parser.add_argument('--json', help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    hoje = args.hoje
+    saida = []
+    with tempfile.TemporaryDirectory() as pasta:
+        for anos in args.anos:
+            linhas, resultados = rodar(anos, hoje, args.latencia, args.consultas, pasta, args.armazenamento)
+            print(f"\n{anos} ano(s) de histórico ({linhas} agendamentos)")
+            print(f"  {'cenário':<38}{'tempo (ms)':>12}{'chamadas':>10}{'lidas':>10}{'gravadas':>10}")
+            for cenario, medidas in resultados:
+                print(f"  {cenario:<38}{medidas['tempo_ms']:>12.1f}{medidas['chamadas']:>10}"
+                      f"{medidas['celulas_lidas']:>10}{medidas['celulas_gravadas']:>10}")
+                saida.append({'anos': anos, 'hoje': hoje.isoformat(), 'agendamentos': linhas, 'cenario': cenario, **medidas})
+    if args.json:
+        Path(args.json).write_text(json.dumps(saida, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
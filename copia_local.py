@@ -0,0 +1,103 @@
+"""Cópia local das abas em Parquet, para o primeiro login do processo abrir sem esperar o Google Sheets."""
+import json
+import os
+import threading
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dados import ordinais_de_datas
+from planilhas import ABAS_DADOS
+
+
+def dataframe_de_valores(valores):
+    """Linhas da aba (primeira = cabeçalho) como DataFrame de texto, no formato guardado na cópia."""
+    if not valores:
+        return pd.DataFrame()
+    return pd.DataFrame(valores[1:], columns=valores[0], dtype=object).astype(str)
+
+
+def _dos_meses(df, meses):
+    """Só as linhas do DataFrame com datas nos meses 'AAAA-MM'."""
+    if 'Data' not in df.columns:
+        return df
+    ordinais = ordinais_de_datas(df['Data'])
+    dias = (ordinais - date(1970, 1, 1).toordinal()).astype('datetime64[D]')
+    meses_linhas = np.datetime_as_string(dias, unit='M')
+    return df[(ordinais > 0) & np.isin(meses_linhas, list(meses))].reset_index(drop=True)
+
+
+class CopiaLocal:
+    """Arquivos Parquet (um por aba) + meta.json com os carimbos, os meses guardados e a hora da última sincronização."""
+
+    def __init__(self, pasta, sheet_id):
+        self.pasta = Path(pasta) / sheet_id
+        self._lock = threading.Lock()
+        # Uma atualização por vez: cada uma lê a cópia, junta os meses novos e grava
+        self._atualizacao = threading.Lock()
+
+    def _arquivo(self, aba):
+        return self.pasta / f"{aba}.parquet"
+
+    def carregar(self, meses):
+        """Retorna ({aba: DataFrame}, carimbos, sincronizada_em, meses_presentes) só com os meses pedidos que a cópia tem.
+
+        None se não houver cópia utilizável ou se ela não tiver nenhum dos meses.
+        """
+        try:
+            meta = json.loads((self.pasta / 'meta.json').read_text(encoding='utf-8'))
+            presentes = [mes for mes in meses if mes in meta['meses']]
+            if not presentes:
+                return None
+            abas = {aba: _dos_meses(pd.read_parquet(self._arquivo(aba)), presentes) for aba in ABAS_DADOS}
+            carimbos = {tuple(chave.split('|', 1)): valor for chave, valor in meta['carimbos'].items()}
+            return abas, carimbos, datetime.fromisoformat(meta['sincronizada_em']), presentes
+        except Exception:
+            return None
+
+    def gravar(self, abas, carimbos, meses):
+        """Grava cada arquivo num temporário e troca de uma vez, para um leitor nunca ver um arquivo pela metade."""
+        with self._lock:
+            self.pasta.mkdir(parents=True, exist_ok=True)
+            for aba, df in abas.items():
+                temporario = self._arquivo(aba).with_suffix('.tmp')
+                df.to_parquet(temporario, index=False)
+                os.replace(temporario, self._arquivo(aba))
+            meta = {
+                'sincronizada_em': datetime.now().isoformat(),
+                'meses': sorted(meses),
+                'carimbos': {f"{aba}|{data}": carimbo for (aba, data), carimbo in carimbos.items()},
+            }
+            temporario = self.pasta / 'meta.tmp'
+            temporario.write_text(json.dumps(meta), encoding='utf-8')
+            os.replace(temporario, self.pasta / 'meta.json')
+
+    def atualizar_em_segundo_plano(self, valores_por_aba, carimbos, meses, manter):
+        """Troca na cópia os 'meses' pelas linhas lidas da API, sem segurar quem leu.
+
+        Só entram os meses de 'manter' (a janela do login); dos que já estavam
+        na cópia, os que saíram dela são descartados. Erros só deixam a cópia
+        como estava.
+        """
+        def _atualizar():
+            try:
+                with self._atualizacao:
+                    novos = [mes for mes in meses if mes in manter]
+                    abas = {aba: _dos_meses(dataframe_de_valores(valores_por_aba[aba]), novos) for aba in ABAS_DADOS}
+                    # Todos os carimbos lidos, não só os dos meses guardados: assinam também os resumos mensais
+                    guardados = dict(carimbos)
+                    anterior = self.carregar([mes for mes in manter if mes not in novos])
+                    if anterior is not None:
+                        abas_antigas, carimbos_antigos, _, presentes = anterior
+                        abas = {aba: pd.concat([abas_antigas[aba], df], ignore_index=True).fillna('').astype(str)
+                                for aba, df in abas.items()}
+                        # Meses mantidos seguem com os carimbos das linhas que a cópia tem deles
+                        guardados = {chave: c for chave, c in guardados.items() if chave[1][:7] not in presentes}
+                        guardados.update({chave: c for chave, c in carimbos_antigos.items() if chave[1][:7] in presentes})
+                        novos += presentes
+                    self.gravar(abas, guardados, novos)
+            except Exception:
+                pass
+        threading.Thread(target=_atualizar, daemon=True).start()
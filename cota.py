@@ -0,0 +1,138 @@
+"""Agendador das chamadas ao Google Sheets: cota por minuto, prioridade das telas e novas tentativas com espera."""
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import streamlit as st
+
+from metricas import LIMITE_POR_MINUTO, etapa_atual
+
+# Chamadas que podem sair de uma vez; o resto do minuto é reposto aos poucos.
+# Com rajada R e reposição (limite - R)/60 por segundo, nenhuma janela de 60 s passa do limite.
+RAJADA = 10
+# Tentativas de uma chamada que falhou por cota (429) ou erro temporário do servidor
+TENTATIVAS = 5
+# Espera antes da n-ésima nova tentativa: sorteada entre 0 e min(ESPERA_MAXIMA, ESPERA_INICIAL * 2**n)
+ESPERA_INICIAL = 1.0
+ESPERA_MAXIMA = 32.0
+CODIGOS_TEMPORARIOS = (500, 502, 503, 504)
+
+# Etapas que ninguém está esperando na tela: cedem a vez às chamadas das telas
+ETAPAS_EM_SEGUNDO_PLANO = frozenset({'gravação', 'sincronização', 'resumos', 'importação', 'exportação'})
+INTERATIVA, SEGUNDO_PLANO = 0, 1
+
+# Escritas que podem ser repetidas sem risco: reescrevem as mesmas células (um append repetido duplicaria linhas)
+_ESCRITAS_IDEMPOTENTES = ('values:batchUpdate', 'values:batchClear', ':clear')
+
+
+def _idempotente(metodo, endereco):
+    metodo = metodo.upper()
+    return metodo in ('GET', 'PUT') or (metodo == 'POST' and endereco.endswith(_ESCRITAS_IDEMPOTENTES))
+
+
+def _codigo(erro):
+    codigo = getattr(erro, 'code', None)
+    return codigo if isinstance(codigo, int) else getattr(getattr(erro, 'response', None), 'status_code', None)
+
+
+class Balde:
+    """Balde de fichas: até 'capacidade' chamadas seguidas e depois 'por_segundo' chamadas por segundo."""
+
+    def __init__(self, capacidade, por_segundo):
+        self.capacidade = capacidade
+        self.por_segundo = por_segundo
+        self.fichas = float(capacidade)
+        self._atualizado = time.monotonic()
+
+    def _repor(self, agora):
+        self.fichas = min(self.capacidade, self.fichas + (agora - self._atualizado) * self.por_segundo)
+        self._atualizado = agora
+
+    def espera(self, agora):
+        """Segundos até haver uma ficha (0 se já há)."""
+        self._repor(agora)
+        return 0.0 if self.fichas >= 1 else (1 - self.fichas) / self.por_segundo
+
+    def tirar(self):
+        self.fichas -= 1
+
+    def esvaziar(self):
+        """Depois de um 429 a cota já acabou do lado do Google: recomeça do zero."""
+        self.fichas = min(self.fichas, 0.0)
+
+
+class Cota:
+    """Fila única para as requisições do processo, com um balde para leituras e outro para escritas.
+
+    Quem espera é atendido por prioridade (chamadas das telas antes das de
+    segundo plano) e, dentro dela, por ordem de chegada. Falhas por cota
+    (429) são repetidas sempre; erros temporários do servidor e de rede, só
+    em chamadas idempotentes.
+    """
+
+    def __init__(self, por_minuto=LIMITE_POR_MINUTO, rajada=RAJADA):
+        taxa = (por_minuto - rajada) / 60
+        self._baldes = {'leitura': Balde(rajada, taxa), 'escrita': Balde(rajada, taxa)}
+        self._filas = {'leitura': [], 'escrita': []}
+        self._condicao = threading.Condition()
+        self._senhas = itertools.count()
+
+    def aguardar(self, tipo, prioridade=INTERATIVA):
+        """Bloqueia até a vez da chamada: há ficha no balde e ninguém mais prioritário esperando."""
+        balde, fila = self._baldes[tipo], self._filas[tipo]
+        with self._condicao:
+            senha = (prioridade, next(self._senhas))
+            heapq.heappush(fila, senha)
+            try:
+                while True:
+                    espera = balde.espera(time.monotonic())
+                    if fila[0] == senha and espera <= 0:
+                        balde.tirar()
+                        return
+                    # Quem não é o primeiro da fila espera ser avisado quando a fila andar
+                    self._condicao.wait(espera if fila[0] == senha else None)
+            finally:
+                fila.remove(senha)
+                heapq.heapify(fila)
+                self._condicao.notify_all()
+
+    def _repetir(self, erro, tipo, metodo, endereco):
+        codigo = _codigo(erro)
+        if codigo == 429:
+            with self._condicao:
+                self._baldes[tipo].esvaziar()
+            return True
+        if not _idempotente(metodo, endereco):
+            return False
+        # OSError inclui as falhas de conexão e de tempo esgotado do requests
+        return codigo in CODIGOS_TEMPORARIOS or isinstance(erro, OSError)
+
+    def controlar(self, http_client):
+        """Envolve http_client.request (por onde passa toda chamada do gspread) com a fila e as novas tentativas."""
+        if http_client is None or getattr(http_client, '_cota', None) is self:
+            return
+        original = http_client.request
+
+        def request(method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+            tipo = 'leitura' if method.upper() == 'GET' else 'escrita'
+            prioridade = SEGUNDO_PLANO if etapa_atual() in ETAPAS_EM_SEGUNDO_PLANO else INTERATIVA
+            for tentativa in range(TENTATIVAS):
+                self.aguardar(tipo, prioridade)
+                try:
+                    return original(method, endpoint, params=params, data=data, json=json, files=files, headers=headers)
+                except Exception as e:
+                    if tentativa == TENTATIVAS - 1 or not self._repetir(e, tipo, method, endpoint):
+                        raise
+                # Espera sorteada ("full jitter"): sessões que falharam juntas não voltam juntas
+                time.sleep(random.uniform(0, min(ESPERA_MAXIMA, ESPERA_INICIAL * 2 ** tentativa)))
+
+        http_client.request = request
+        http_client._cota = self
+
+
+@st.cache_resource(show_spinner=False)
+def obter_cota():
+    """Uma fila por processo: a cota do Sheets é por conta de serviço, a mesma para todas as planilhas."""
+    return Cota()
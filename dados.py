@@ -0,0 +1,601 @@
+"""Registros da sessão (agendamentos, saídas e vendas) em colunas tipadas, organizados por data."""
+import uuid
+from collections import namedtuple
+from functools import lru_cache
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+# Uma coluna do esquema: tipo e valor usado quando a aba não tem a coluna.
+# Tipos:
+#   'data'      -> número ordinal do dia (date.toordinal()); 0 quando a data é inválida
+#   'horario'   -> 'HH:MM', guardado como categoria ('9' e '9.0' viram '09:00')
+#   'centavos'  -> valor em centavos, inteiro (aceita vírgula decimal)
+#   'categoria' -> código inteiro apontando para a lista de valores distintos da coluna
+#   'texto'     -> texto livre
+Coluna = namedtuple('Coluna', ['tipo', 'padrao'], defaults=[''])
+
+# Esquema de cada aba, na ordem em que as colunas ficam na planilha
+ESQUEMA_AGENDAMENTOS = {
+    'Data': Coluna('data'),
+    'Horário': Coluna('horario'),
+    'Cliente': Coluna('texto'),
+    'Serviço': Coluna('categoria'),
+    'Barbeiro': Coluna('categoria'),
+    'Pagamento': Coluna('categoria', 'Não informado'),
+    'Valor 1 (R$)': Coluna('centavos', 0),
+    'Valor 2 (R$)': Coluna('centavos', 0),
+    'Valor (R$)': Coluna('centavos', 0),
+    'ID': Coluna('texto'),
+}
+ESQUEMA_SAIDAS = {
+    'Data': Coluna('data'),
+    'Descrição': Coluna('texto'),
+    'Valor (R$)': Coluna('centavos', 0),
+    'ID': Coluna('texto'),
+}
+ESQUEMA_VENDAS = {
+    'Data': Coluna('data'),
+    'Item': Coluna('texto'),
+    'Valor (R$)': Coluna('centavos', 0),
+    'Vendedor': Coluna('categoria'),
+    'ID': Coluna('texto'),
+}
+
+# Formatos aceitos na coluna Data, em ordem de tentativa (o app grava sempre o primeiro)
+FORMATOS_DATA = ('%Y-%m-%d', '%d/%m/%Y')
+
+# Serviços com barba contam como dois atendimentos na produtividade
+MARCA_BARBA = 'com Barba'
+
+_DTYPES = {'data': np.int32, 'horario': np.int32, 'centavos': np.int64, 'categoria': np.int32, 'texto': object}
+# Coluna somada nos totais diários mantidos pela tabela
+COLUNA_TOTAL = 'Valor (R$)'
+
+_ORDINAL_EPOCH = date(1970, 1, 1).toordinal()
+_CAPACIDADE_INICIAL = 64
+
+
+def novo_id():
+    """Identificador curto e único de um registro, gravado na coluna ID da planilha."""
+    return uuid.uuid4().hex[:12]
+
+
+def peso_atendimento(servico):
+    return 2 if MARCA_BARBA in servico else 1
+
+
+def mes_de(data):
+    """'AAAA-MM' da data: a unidade em que os registros são carregados da planilha."""
+    return data.strftime('%Y-%m')
+
+
+def meses_ao_redor(data, raio):
+    """O mês de 'data' e os 'raio' meses antes e depois dele, como 'AAAA-MM'."""
+    indice = data.year * 12 + data.month - 1
+    return [f"{i // 12:04d}-{i % 12 + 1:02d}" for i in range(indice - raio, indice + raio + 1)]
+
+
+def dias_dos_meses(meses):
+    """Todas as datas dos meses 'AAAA-MM'."""
+    dias = []
+    for mes in meses:
+        atual = datetime.strptime(mes, '%Y-%m').date()
+        while mes_de(atual) == mes:
+            dias.append(atual)
+            atual = date.fromordinal(atual.toordinal() + 1)
+    return dias
+
+
+def valor_seguro(valor):
+    try:
+        return float(valor)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _centavos(valor):
+    """Converte um valor em reais (número ou texto com vírgula) para centavos inteiros."""
+    if isinstance(valor, str):
+        valor = valor.strip().replace(',', '.')
+    valor = valor_seguro(valor)
+    return 0 if valor != valor else int(round(valor * 100))
+
+
+def _chave_data(valor):
+    """Data do registro como datetime.date (aceita texto 'AAAA-MM-DD'); None se inválida."""
+    if valor is None or valor != valor:  # NaT/NaN vindos do pandas
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    if isinstance(valor, str):
+        for formato in FORMATOS_DATA:
+            try:
+                return datetime.strptime(valor.strip(), formato).date()
+            except ValueError:
+                continue
+    return None
+
+
+def _ordinal(valor):
+    data = _chave_data(valor)
+    return data.toordinal() if data is not None else 0
+
+
+# --- Conversões vetorizadas usadas no carregamento ---
+
+def _serie_texto(serie):
+    return serie.fillna('').astype(str).str.strip()
+
+
+def ordinais_de_datas(serie):
+    """Datas em texto -> ordinais, testando FORMATOS_DATA em ordem; 0 onde nenhum formato casa."""
+    texto = _serie_texto(serie)
+    datas = pd.to_datetime(texto, format=FORMATOS_DATA[0], errors='coerce')
+    for formato in FORMATOS_DATA[1:]:
+        faltando = datas.isna()
+        if not faltando.any():
+            break
+        datas = datas.where(~faltando, pd.to_datetime(texto, format=formato, errors='coerce'))
+    dias = datas.values.astype('datetime64[D]').astype(np.int64) + _ORDINAL_EPOCH
+    return np.where(datas.isna().values, 0, dias)
+
+
+def _centavos_serie(serie):
+    valores = pd.to_numeric(_serie_texto(serie).str.replace(',', '.', regex=False), errors='coerce')
+    return (valores.fillna(0.0) * 100).round().astype(np.int64).values
+
+
+def horarios_normalizados(serie):
+    """Normaliza horários: '9', '9.0' -> '09:00' e '9:30' -> '09:30'; o resto fica como está."""
+    texto = _serie_texto(serie)
+    numerico = texto.str.fullmatch(r'\d+(\.\d+)?')
+    if numerico.any():
+        horas = pd.to_numeric(texto[numerico]).astype(np.int64).astype(str).str.zfill(2)
+        texto = texto.mask(numerico, horas + ':00')
+    curto = texto.str.fullmatch(r'\d:\d\d')
+    return texto.mask(curto, texto.str.zfill(5))
+
+
+@lru_cache(maxsize=4096)
+def horario_normalizado(valor):
+    # Poucos horários distintos: cada um passa pelo pandas uma vez só (o gravador chama isto por linha)
+    return horarios_normalizados(pd.Series([valor], dtype=object)).iloc[0]
+
+
+def _por_valores_distintos(serie, conversor):
+    """Aplica o conversor só aos valores distintos e espalha o resultado pelas linhas.
+
+    Datas, horários e valores se repetem muito no histórico, então converter
+    os distintos é bem mais barato do que converter todas as linhas.
+    """
+    codigos, distintos = pd.factorize(_serie_texto(serie))
+    convertidos = np.asarray(conversor(pd.Series(distintos, dtype=object)))
+    if not len(convertidos):
+        return np.zeros(len(serie), dtype=np.int64)
+    return convertidos[codigos]
+
+
+def _posicoes_no_eixo(categorias, eixo):
+    """Código de categoria -> posição do valor em 'eixo' (-1 se não está nele)."""
+    posicao = {valor: i for i, valor in enumerate(eixo)}
+    # O [-1] garante um array indexável mesmo sem nenhuma categoria ainda
+    return np.array([posicao.get(c, -1) for c in categorias] or [-1], dtype=np.int64)
+
+
+def _vazio(capacidade, dtype):
+    return np.full(capacidade, '', dtype=object) if dtype == object else np.zeros(capacidade, dtype=dtype)
+
+
+class TabelaRegistros:
+    """Registros de uma aba guardados em colunas tipadas e particionados por data.
+
+    Cada coluna é um array numpy que cresce por duplicação; valores monetários
+    ficam em centavos inteiros e colunas repetitivas (barbeiro, pagamento,
+    serviço...) como códigos de categoria, então nada é reconvertido a cada
+    rerun. Linhas removidas só são marcadas como inativas, o que mantém as
+    posições estáveis durante a sessão. Cada data guarda as posições das suas
+    linhas, então consultar o dia selecionado custa O(registros do dia), e
+    cada registro tem um ID único que aponta para sua posição, então remover
+    é O(1) e sempre atinge o registro certo.
+    """
+
+    def __init__(self, esquema, registros=()):
+        self.esquema = dict(esquema)
+        self._n = 0
+        self._ativos = 0
+        self._colunas = {}
+        self._vivo = np.zeros(_CAPACIDADE_INICIAL, dtype=bool)
+        self._categorias = {}
+        self._codigos = {}
+        self._por_data = {}
+        self._por_id = {}
+        # Soma em centavos da coluna 'Valor (R$)' por data, atualizada a cada inclusão/remoção
+        self._totais = {}
+        # Datas com inclusões/remoções feitas nesta sessão (a sincronização não as sobrescreve)
+        self.datas_alteradas = set()
+        for nome, coluna in self.esquema.items():
+            self._criar_coluna(nome, coluna.tipo, _CAPACIDADE_INICIAL)
+        for registro in registros:
+            self.adicionar(registro)
+
+    @classmethod
+    def de_valores(cls, valores, esquema):
+        """Monta a tabela a partir das linhas da aba (primeira linha = cabeçalho), como vêm da API."""
+        df = pd.DataFrame(valores[1:], columns=valores[0]) if valores else pd.DataFrame()
+        return cls.de_dataframe(df, esquema)
+
+    @classmethod
+    def de_dataframe(cls, df, esquema):
+        """Monta a tabela a partir de um DataFrame, convertendo cada coluna uma única vez, de forma vetorizada.
+
+        Colunas do esquema ausentes no DataFrame recebem o valor padrão do esquema.
+        """
+        esquema = dict(esquema)
+        # Colunas da planilha que o app não conhece são preservadas como texto
+        for nome in df.columns:
+            if nome:
+                esquema.setdefault(nome, Coluna('texto'))
+        tabela = cls(esquema=esquema)
+        n = len(df)
+        tabela._redimensionar(max(n, _CAPACIDADE_INICIAL))
+        for nome, coluna in esquema.items():
+            serie = df[nome].reset_index(drop=True) if nome in df.columns \
+                else pd.Series([coluna.padrao] * n, dtype=object)
+            tabela._colunas[nome][:n] = tabela._converter_serie(nome, coluna.tipo, serie)
+        # Linhas sem ID (antigas ou digitadas direto na planilha) ganham um ao entrar na tabela
+        ids = tabela._colunas['ID']
+        for i in np.flatnonzero(ids[:n] == ''):
+            ids[i] = novo_id()
+        tabela._vivo[:n] = True
+        tabela._n = n
+        tabela._ativos = n
+        tabela._construir_indices()
+        return tabela
+
+    # --- Armazenamento ---
+
+    def _criar_coluna(self, nome, tipo, capacidade):
+        self._colunas[nome] = _vazio(capacidade, _DTYPES[tipo])
+        if tipo in ('categoria', 'horario'):
+            self._categorias[nome] = []
+            self._codigos[nome] = {}
+
+    def _redimensionar(self, capacidade):
+        if capacidade <= len(self._vivo):
+            return
+        for nome, coluna in self._colunas.items():
+            nova = _vazio(capacidade, coluna.dtype)
+            nova[:self._n] = coluna[:self._n]
+            self._colunas[nome] = nova
+        vivo = np.zeros(capacidade, dtype=bool)
+        vivo[:self._n] = self._vivo[:self._n]
+        self._vivo = vivo
+
+    def _codigo(self, nome, valor):
+        valor = '' if valor is None or valor != valor else str(valor)
+        codigos = self._codigos[nome]
+        if valor not in codigos:
+            codigos[valor] = len(self._categorias[nome])
+            self._categorias[nome].append(valor)
+        return codigos[valor]
+
+    def _converter(self, nome, tipo, valor):
+        if tipo == 'data':
+            return _ordinal(valor)
+        if tipo == 'centavos':
+            return _centavos(valor)
+        if tipo == 'horario':
+            return self._codigo(nome, horario_normalizado(valor))
+        if tipo == 'categoria':
+            return self._codigo(nome, valor)
+        return '' if valor is None or valor != valor else valor
+
+    def _converter_serie(self, nome, tipo, serie):
+        if tipo == 'data':
+            return _por_valores_distintos(serie, ordinais_de_datas)
+        if tipo == 'centavos':
+            return _por_valores_distintos(serie, _centavos_serie)
+        if tipo == 'horario':
+            serie = pd.Series(_por_valores_distintos(serie, lambda s: horarios_normalizados(s).values))
+        if tipo in ('categoria', 'horario'):
+            categorias = pd.Categorical(_serie_texto(serie))
+            # Traduz os códigos do pandas para os códigos desta tabela
+            mapa = np.array([self._codigo(nome, c) for c in categorias.categories], dtype=np.int32)
+            return mapa[categorias.codes] if len(mapa) else np.zeros(len(serie), dtype=np.int32)
+        return serie.fillna('').values
+
+    def _valor(self, nome, pos):
+        tipo = self.esquema[nome].tipo
+        bruto = self._colunas[nome][pos]
+        if tipo == 'data':
+            return date.fromordinal(int(bruto)) if bruto else None
+        if tipo == 'centavos':
+            return int(bruto) / 100
+        if tipo in ('categoria', 'horario'):
+            return self._categorias[nome][bruto]
+        return bruto
+
+    def _registro(self, pos):
+        registro = {nome: self._valor(nome, pos) for nome in self.esquema}
+        return registro
+
+    # --- Índices (as subclasses estendem para manter índices extras) ---
+
+    def _construir_indices(self):
+        """Monta a partição por data de uma vez só, ordenando as datas em vez de inserir linha a linha."""
+        datas = self._colunas['Data'][:self._n]
+        ordem = np.argsort(datas, kind='stable')
+        quebras = np.flatnonzero(np.diff(datas[ordem])) + 1
+        # Posições de cada data num dicionário (ordenado por inserção), para remover em O(1)
+        self._por_data = {
+            int(datas[grupo[0]]): dict.fromkeys(grupo.tolist()) for grupo in np.split(ordem, quebras) if len(grupo)
+        }
+        self._por_id = dict(zip(self._colunas['ID'][:self._n].tolist(), range(self._n)))
+        totais = pd.Series(self._colunas[COLUNA_TOTAL][:self._n]).groupby(datas).sum()
+        self._totais = {int(d): int(total) for d, total in totais.items()}
+
+    def _indexar(self, pos):
+        ordinal = int(self._colunas['Data'][pos])
+        self._por_data.setdefault(ordinal, {})[pos] = None
+        self._por_id[self._colunas['ID'][pos]] = pos
+        self._totais[ordinal] = self._totais.get(ordinal, 0) + int(self._colunas[COLUNA_TOTAL][pos])
+
+    def _desindexar(self, pos):
+        ordinal = int(self._colunas['Data'][pos])
+        do_dia = self._por_data.get(ordinal, {})
+        do_dia.pop(pos, None)
+        if not do_dia:
+            self._por_data.pop(ordinal, None)
+            self._totais.pop(ordinal, None)
+        else:
+            self._totais[ordinal] -= int(self._colunas[COLUNA_TOTAL][pos])
+        self._por_id.pop(self._colunas['ID'][pos], None)
+
+    # --- Operações ---
+
+    def adicionar(self, registro):
+        pos = self._inserir(registro)
+        self._marcar_alterada(pos)
+        return pos
+
+    def _marcar_alterada(self, pos):
+        ordinal = int(self._colunas['Data'][pos])
+        if ordinal:
+            self.datas_alteradas.add(date.fromordinal(ordinal))
+
+    def _inserir(self, registro):
+        for nome in registro:
+            if nome and nome not in self.esquema and not nome.startswith('_'):
+                self.esquema[nome] = Coluna('texto')
+                self._criar_coluna(nome, 'texto', len(self._vivo))
+        if self._n == len(self._vivo):
+            self._redimensionar(2 * len(self._vivo))
+        if not registro.get('ID'):
+            registro = {**registro, 'ID': novo_id()}
+        pos = self._n
+        for nome, coluna in self.esquema.items():
+            self._colunas[nome][pos] = self._converter(nome, coluna.tipo, registro.get(nome, coluna.padrao))
+        self._vivo[pos] = True
+        self._n += 1
+        self._ativos += 1
+        self._indexar(pos)
+        return pos
+
+    def remover(self, registro):
+        """Remove o registro com o mesmo ID; False se ele não está (mais) na tabela."""
+        pos = self._por_id.get(registro.get('ID'))
+        if pos is None:
+            return False
+        self._marcar_alterada(pos)
+        self._excluir(pos)
+        return True
+
+    def _excluir(self, pos):
+        self._desindexar(pos)
+        self._vivo[pos] = False
+        self._ativos -= 1
+
+    def substituir_dia(self, data, registros):
+        """Troca todos os registros da data pelos recebidos (vindos da planilha; não marca a data como alterada)."""
+        for pos in list(self._posicoes(data)):
+            self._excluir(pos)
+        for registro in registros:
+            self._inserir(registro)
+
+    def incorporar(self, outra):
+        """Acrescenta os registros de 'outra', cujas datas ainda não estão nesta tabela (ex.: um mês buscado sob demanda).
+
+        Copia as colunas já convertidas de uma vez, só traduzindo os códigos de
+        categoria; nenhum valor passa de novo pelos conversores.
+        """
+        for nome, coluna in outra.esquema.items():
+            if nome not in self.esquema:
+                self.esquema[nome] = coluna
+                self._criar_coluna(nome, coluna.tipo, len(self._vivo))
+        posicoes = np.flatnonzero(outra._vivo[:outra._n])
+        inicio, fim = self._n, self._n + len(posicoes)
+        capacidade = len(self._vivo)
+        while capacidade < fim:
+            capacidade *= 2
+        self._redimensionar(capacidade)
+        for nome, coluna in self.esquema.items():
+            if nome not in outra.esquema:
+                self._colunas[nome][inicio:fim] = self._converter(nome, coluna.tipo, coluna.padrao)
+                continue
+            bruto = outra._colunas[nome][posicoes]
+            if coluna.tipo in ('categoria', 'horario'):
+                mapa = np.array([self._codigo(nome, c) for c in outra._categorias[nome]] or [0], dtype=np.int32)
+                bruto = mapa[bruto]
+            self._colunas[nome][inicio:fim] = bruto
+        self._vivo[inicio:fim] = True
+        self._n = fim
+        self._ativos += len(posicoes)
+        for pos in range(inicio, fim):
+            self._indexar(pos)
+        self.datas_alteradas |= outra.datas_alteradas
+
+    def copia(self):
+        """Tabela nova só com as linhas ativas desta (e as mesmas datas alteradas); as duas seguem independentes."""
+        nova = type(self)(esquema=self.esquema)
+        nova.incorporar(self)
+        return nova
+
+    def _posicoes(self, data):
+        return self._por_data.get(data.toordinal(), ()) if data is not None else ()
+
+    def do_dia(self, data):
+        """Registros da data como dicionários, na ordem em que foram adicionados."""
+        return [self._registro(pos) for pos in self._posicoes(data)]
+
+    def _dataframe(self, posicoes, datas):
+        """DataFrame das linhas em 'posicoes', montado coluna a coluna; 'datas' preenche a coluna Data."""
+        colunas = {}
+        for nome, coluna in self.esquema.items():
+            bruto = self._colunas[nome][posicoes]
+            if coluna.tipo == 'data':
+                colunas[nome] = datas
+            elif coluna.tipo == 'centavos':
+                colunas[nome] = bruto / 100
+            elif coluna.tipo in ('categoria', 'horario'):
+                # O [''] garante um array de objetos mesmo sem nenhuma categoria ainda
+                colunas[nome] = np.array(self._categorias[nome] or [''], dtype=object)[bruto]
+            else:
+                colunas[nome] = bruto
+        return pd.DataFrame(colunas)
+
+    def dataframe_do_dia(self, data):
+        """Registros da data num DataFrame, na ordem em que foram adicionados."""
+        posicoes = np.fromiter(self._posicoes(data), dtype=np.int64)
+        # A partição garante que todas as linhas são da mesma data
+        return self._dataframe(posicoes, [data] * len(posicoes))
+
+    def _posicoes_periodo(self, inicio, fim):
+        """Posições das linhas ativas com data entre 'inicio' e 'fim' (inclusive), por máscara sobre os arrays."""
+        ordinais = self._colunas['Data'][:self._n]
+        mascara = self._vivo[:self._n] & (ordinais >= inicio.toordinal()) & (ordinais <= fim.toordinal())
+        return np.flatnonzero(mascara)
+
+    def dataframe_periodo(self, inicio, fim):
+        """Registros com data entre 'inicio' e 'fim' (inclusive), selecionados por máscara sobre os arrays.
+
+        A coluna Data vem como datetime64, pronta para agrupar por semana/mês.
+        """
+        posicoes = self._posicoes_periodo(inicio, fim)
+        datas = pd.to_datetime(self._colunas['Data'][posicoes] - _ORDINAL_EPOCH, unit='D')
+        return self._dataframe(posicoes, datas)
+
+    def total_do_dia(self, data, coluna=COLUNA_TOTAL):
+        if coluna == COLUNA_TOTAL:
+            return self._totais.get(data.toordinal(), 0) / 100
+        posicoes = np.fromiter(self._posicoes(data), dtype=np.int64)
+        return int(self._colunas[coluna][posicoes].sum()) / 100
+
+    def __contains__(self, id_registro):
+        return id_registro in self._por_id
+
+    def data_do_id(self, id_registro):
+        """Data do registro com o ID; None se ele não está na tabela."""
+        pos = self._por_id.get(id_registro)
+        ordinal = int(self._colunas['Data'][pos]) if pos is not None else 0
+        return date.fromordinal(ordinal) if ordinal else None
+
+    def datas(self):
+        return [date.fromordinal(o) for o in self._por_data if o]
+
+    def __len__(self):
+        return self._ativos
+
+
+class TabelaAgendamentos(TabelaRegistros):
+    """TabelaRegistros com índice de ocupação por (Data, Horário, Barbeiro).
+
+    O índice é um dicionário de contagens mantido junto com a partição por
+    data, então a checagem de conflito é O(1) e não depende do histórico.
+    Os atendimentos de cada barbeiro por data são mantidos do mesmo jeito.
+    """
+
+    def __init__(self, registros=(), esquema=ESQUEMA_AGENDAMENTOS):
+        self._ocupacao = {}
+        self._atendimentos = {}
+        super().__init__(esquema, registros)
+
+    @classmethod
+    def de_valores(cls, valores, esquema=ESQUEMA_AGENDAMENTOS):
+        return super().de_valores(valores, esquema)
+
+    def _construir_indices(self):
+        super()._construir_indices()
+        contagens = pd.DataFrame({
+            'data': self._colunas['Data'][:self._n],
+            'horario': self._colunas['Horário'][:self._n],
+            'barbeiro': self._colunas['Barbeiro'][:self._n],
+        }).value_counts(sort=False)
+        horarios, barbeiros = self._categorias['Horário'], self._categorias['Barbeiro']
+        self._ocupacao = {
+            (int(d), horarios[h], barbeiros[b]): int(qtd) for (d, h, b), qtd in contagens.items()
+        }
+        # Peso calculado uma vez por serviço distinto e espalhado pelos códigos
+        pesos = np.array([peso_atendimento(s) for s in self._categorias['Serviço']] or [1], dtype=np.int64)
+        atendimentos = pd.Series(pesos[self._colunas['Serviço'][:self._n]]).groupby(
+            [self._colunas['Data'][:self._n], self._colunas['Barbeiro'][:self._n]]).sum()
+        self._atendimentos = {}
+        for (d, b), quantidade in atendimentos.items():
+            self._atendimentos.setdefault(int(d), {})[barbeiros[b]] = int(quantidade)
+
+    def _chave_horario(self, pos):
+        return (int(self._colunas['Data'][pos]),
+                self._valor('Horário', pos), self._valor('Barbeiro', pos))
+
+    def _indexar(self, pos):
+        super()._indexar(pos)
+        chave = self._chave_horario(pos)
+        self._ocupacao[chave] = self._ocupacao.get(chave, 0) + 1
+        do_dia = self._atendimentos.setdefault(chave[0], {})
+        do_dia[chave[2]] = do_dia.get(chave[2], 0) + peso_atendimento(self._valor('Serviço', pos))
+
+    def _desindexar(self, pos):
+        super()._desindexar(pos)
+        chave = self._chave_horario(pos)
+        if self._ocupacao.get(chave, 0) <= 1:
+            self._ocupacao.pop(chave, None)
+        else:
+            self._ocupacao[chave] -= 1
+        do_dia = self._atendimentos.get(chave[0], {})
+        do_dia[chave[2]] = do_dia.get(chave[2], 0) - peso_atendimento(self._valor('Serviço', pos))
+        if do_dia[chave[2]] <= 0:
+            del do_dia[chave[2]]
+        if not do_dia:
+            self._atendimentos.pop(chave[0], None)
+
+    def horario_ocupado(self, data, horario, barbeiro):
+        return (data.toordinal(), horario, barbeiro) in self._ocupacao
+
+    def horarios_livres(self, data, barbeiro, horarios):
+        """Filtra 'horarios' deixando só os que o barbeiro ainda não tem ocupados na data."""
+        ordinal = data.toordinal()
+        return [h for h in horarios if (ordinal, h, barbeiro) not in self._ocupacao]
+
+    def atendimentos_do_dia(self, data):
+        """{barbeiro: atendimentos} da data, lido direto do agregado (serviços com barba contam 2)."""
+        return dict(self._atendimentos.get(data.toordinal(), {}))
+
+    def matriz_ocupacao(self, inicio, fim, horarios, barbeiros):
+        """Array booleano dias × horários × barbeiros de [inicio, fim]: True onde há agendamento.
+
+        Montado numa passada só sobre os códigos das colunas: cada categoria de
+        Horário e de Barbeiro é traduzida uma vez para a sua posição no eixo, e
+        agendamentos fora das listas (horário fora da grade, barbeiro que saiu)
+        ficam de fora.
+        """
+        matriz = np.zeros(((fim - inicio).days + 1, len(horarios), len(barbeiros)), dtype=bool)
+        posicoes = self._posicoes_periodo(inicio, fim)
+        eixo_h = _posicoes_no_eixo(self._categorias['Horário'], horarios)[self._colunas['Horário'][posicoes]]
+        eixo_b = _posicoes_no_eixo(self._categorias['Barbeiro'], barbeiros)[self._colunas['Barbeiro'][posicoes]]
+        dentro = (eixo_h >= 0) & (eixo_b >= 0)
+        dias = self._colunas['Data'][posicoes][dentro] - inicio.toordinal()
+        matriz[dias, eixo_h[dentro], eixo_b[dentro]] = True
+        return matriz
@@ -0,0 +1,256 @@
+"""Diário local das alterações e gravação delas na planilha em segundo plano."""
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+from dados import horario_normalizado
+from planilhas import ABA_AGENDAMENTOS, COLUNAS_POR_ABA, linha_da_planilha, chave_da_linha
+
+# Depois de acordado, o gravador espera este tempo para juntar alterações próximas num só lote
+ESPERA_LOTE = 2
+# Sem ser acordado, tenta de novo (ex.: depois de uma falha de rede) a cada intervalo
+INTERVALO_NOVA_TENTATIVA = 30
+
+# Colunas que não podem se repetir numa mesma data: um barbeiro, um cliente por horário
+CHAVES_UNICAS = {ABA_AGENDAMENTOS: ('Horário', 'Barbeiro')}
+
+# 'versao' é o carimbo da (aba, data) que a sessão tinha quando fez a operação
+Operacao = namedtuple('Operacao', ['id', 'aba', 'data', 'tipo', 'registro', 'versao'])
+Conflito = namedtuple('Conflito', ['id', 'aba', 'data', 'descricao', 'registro'])
+
+
+class Diario:
+    """Operações (adicionar/remover) ainda não gravadas na planilha.
+
+    Ficam num SQLite local, então sobrevivem a um reinício do app; cada
+    operação sai do diário só depois de gravada. Operações recusadas na
+    gravação viram conflitos, guardados até alguém tomar ciência.
+    """
+
+    def __init__(self, arquivo):
+        arquivo = Path(arquivo)
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._banco = sqlite3.connect(arquivo, check_same_thread=False, isolation_level=None)
+        self._banco.execute('PRAGMA journal_mode=WAL')
+        self._banco.execute('PRAGMA synchronous=FULL')
+        self._banco.execute(
+            'CREATE TABLE IF NOT EXISTS operacoes ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, aba TEXT, data TEXT, tipo TEXT, registro TEXT, versao TEXT)'
+        )
+        self._banco.execute(
+            'CREATE TABLE IF NOT EXISTS conflitos ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, aba TEXT, data TEXT, descricao TEXT, registro TEXT)'
+        )
+        try:
+            # Diários criados antes da coluna de versão
+            self._banco.execute("ALTER TABLE operacoes ADD COLUMN versao TEXT DEFAULT ''")
+        except sqlite3.OperationalError:
+            pass
+
+    def registrar(self, aba, tipo, registro, versao=''):
+        """Acrescenta uma operação ('adicionar' ou 'remover') com o registro já no formato da planilha."""
+        self.registrar_varios(aba, tipo, [(registro, versao)])
+
+    def registrar_varios(self, aba, tipo, registros_e_versoes):
+        """Acrescenta várias operações do mesmo tipo numa só transação (ex.: uma importação)."""
+        linhas = []
+        for registro, versao in registros_e_versoes:
+            celulas = {c: v for c, v in zip(registro, linha_da_planilha(registro, list(registro))) if not c.startswith('_')}
+            linhas.append((aba, celulas.get('Data', ''), tipo, json.dumps(celulas, ensure_ascii=False), versao or ''))
+        with self._lock:
+            self._banco.execute('BEGIN')
+            try:
+                self._banco.executemany(
+                    'INSERT INTO operacoes (aba, data, tipo, registro, versao) VALUES (?, ?, ?, ?, ?)', linhas)
+            except Exception:
+                self._banco.execute('ROLLBACK')
+                raise
+            self._banco.execute('COMMIT')
+
+    def pendentes(self):
+        with self._lock:
+            linhas = self._banco.execute(
+                'SELECT id, aba, data, tipo, registro, versao FROM operacoes ORDER BY id').fetchall()
+        return [
+            Operacao(id_, aba, datetime.strptime(data, '%Y-%m-%d').date(), tipo, json.loads(registro), versao or '')
+            for id_, aba, data, tipo, registro, versao in linhas
+        ]
+
+    def datas_pendentes(self):
+        """{(aba, 'AAAA-MM-DD')} com operações ainda não gravadas."""
+        with self._lock:
+            return set(self._banco.execute('SELECT DISTINCT aba, data FROM operacoes').fetchall())
+
+    def quantidade(self):
+        with self._lock:
+            return self._banco.execute('SELECT COUNT(*) FROM operacoes').fetchone()[0]
+
+    def concluir(self, ids, conflitos=()):
+        """Tira as operações gravadas do diário e guarda os conflitos, na mesma transação."""
+        with self._lock:
+            self._banco.execute('BEGIN')
+            try:
+                self._banco.executemany('DELETE FROM operacoes WHERE id = ?', [(i,) for i in ids])
+                self._banco.executemany(
+                    'INSERT INTO conflitos (aba, data, descricao, registro) VALUES (?, ?, ?, ?)',
+                    [(op.aba, op.data.strftime('%Y-%m-%d'), descricao, json.dumps(op.registro, ensure_ascii=False))
+                     for op, descricao in conflitos],
+                )
+            except Exception:
+                self._banco.execute('ROLLBACK')
+                raise
+            self._banco.execute('COMMIT')
+
+    def conflitos(self):
+        with self._lock:
+            linhas = self._banco.execute(
+                'SELECT id, aba, data, descricao, registro FROM conflitos ORDER BY id').fetchall()
+        return [Conflito(id_, aba, data, descricao, json.loads(registro)) for id_, aba, data, descricao, registro in linhas]
+
+    def resolver_conflito(self, id_conflito):
+        with self._lock:
+            self._banco.execute('DELETE FROM conflitos WHERE id = ?', (id_conflito,))
+
+    def fechar(self):
+        with self._lock:
+            self._banco.close()
+
+
+def _chave_unica(aba, linha, cabecalho):
+    colunas = CHAVES_UNICAS.get(aba)
+    if not colunas or any(c not in cabecalho for c in colunas):
+        return None
+    valores = [linha[cabecalho.index(c)] if cabecalho.index(c) < len(linha) else '' for c in colunas]
+    return tuple(horario_normalizado(v) if c == 'Horário' else str(v).strip() for c, v in zip(colunas, valores))
+
+
+def aplicar_operacoes(aba, linhas, operacoes, cabecalho, versao_online):
+    """Aplica, em ordem, as operações de uma data às linhas online dela.
+
+    Retorna (linhas_finais, conflitos), com conflitos = [(operacao, descricao)].
+    As linhas são encontradas pelo ID, então repetir uma operação não muda o
+    resultado: um 'adicionar' cujo ID já está online (gravado numa tentativa
+    anterior) e um 'remover' cujo ID já saiu não fazem nada. Linhas ainda sem
+    ID na planilha são comparadas pelo conteúdo. Um 'adicionar' que ocupa a
+    mesma chave única de outra linha (ex.: barbeiro e horário) é recusado.
+    """
+    largura = len(cabecalho)
+    coluna_id = cabecalho.index('ID')
+    linhas = list(linhas)
+    conflitos = []
+
+    def _id(linha):
+        return linha[coluna_id] if coluna_id < len(linha) else ''
+
+    for operacao in operacoes:
+        linha = linha_da_planilha(operacao.registro, cabecalho)
+        id_registro = linha[coluna_id]
+        posicao = next((i for i, existente in enumerate(linhas) if id_registro and _id(existente) == id_registro), None)
+        if operacao.tipo == 'adicionar':
+            if posicao is not None:
+                continue
+            chave = _chave_unica(aba, linha, cabecalho)
+            if chave is not None and any(_chave_unica(aba, existente, cabecalho) == chave for existente in linhas):
+                # Versão diferente: o dia foi alterado em outro aparelho depois que esta sessão o leu
+                origem = " por outro aparelho" if operacao.versao != versao_online else ""
+                ocupado = ', '.join(f"{coluna} {valor}" for coluna, valor in zip(CHAVES_UNICAS[aba], chave))
+                conflitos.append((operacao, f"{ocupado} já estava ocupado{origem}; o registro não foi gravado."))
+                continue
+            linhas.append(linha)
+            continue
+        if posicao is None:
+            sem_id = chave_da_linha(linha[:coluna_id] + [''] + linha[coluna_id + 1:], largura)
+            posicao = next((i for i, existente in enumerate(linhas)
+                            if not _id(existente) and chave_da_linha(existente, largura) == sem_id), None)
+        if posicao is not None:
+            del linhas[posicao]
+    return linhas, conflitos
+
+
+class Gravador:
+    """Thread que esvazia o diário no armazenamento, juntando as operações por (aba, data) em gravações em lote.
+
+    O app só registra no diário e chama acordar(); nenhum rerun espera a rede.
+    Cada data gravada fica em 'versoes' ({(aba, 'AAAA-MM-DD'): (carimbo,
+    cabecalho, linhas)}), de onde as sessões trazem o resultado mesclado sem
+    reler a planilha. Com em_segundo_plano=False a thread não é criada e quem
+    usa chama gravar_pendentes() (ex.: o benchmark).
+    """
+
+    def __init__(self, armazenamento, diario, em_segundo_plano=True):
+        self.armazenamento = armazenamento
+        self.diario = diario
+        self.versoes = {}
+        self.ultima_gravacao = None
+        self.erro = None
+        self._acordado = threading.Event()
+        self._parado = threading.Event()
+        self._thread = None
+        if em_segundo_plano:
+            # Começa acordado: grava o que tiver sobrado no diário de uma execução anterior
+            self._acordado.set()
+            self._thread = threading.Thread(target=self._laco, daemon=True)
+            self._thread.start()
+
+    def acordar(self):
+        self._acordado.set()
+
+    def parar(self):
+        """Encerra a thread depois do lote em andamento; o que ficar no diário é gravado pelo próximo gravador."""
+        self._parado.set()
+        self._acordado.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _laco(self):
+        while True:
+            self._acordado.wait(INTERVALO_NOVA_TENTATIVA)
+            self._acordado.clear()
+            if self._parado.is_set():
+                return
+            if not self.diario.quantidade():
+                continue
+            time.sleep(ESPERA_LOTE)
+            try:
+                with self.armazenamento.metricas.etapa('gravação'):
+                    self.gravar_pendentes()
+                self.ultima_gravacao = datetime.now()
+                self.erro = None
+            except Exception as e:
+                self.erro = e
+
+    def gravar_pendentes(self):
+        """Grava todas as operações do diário: uma passada por aba, com todas as datas dela juntas."""
+        operacoes = self.diario.pendentes()
+        por_aba = {}
+        for operacao in operacoes:
+            por_aba.setdefault(operacao.aba, {}).setdefault(operacao.data, []).append(operacao)
+        if not por_aba:
+            return
+        carimbos = self.armazenamento.ler_carimbos()
+        for aba, por_data in por_aba.items():
+            cabecalho, novas, alteradas, conflitos = self._gravar_aba(aba, por_data, carimbos)
+            # Troca o carimbo das datas gravadas, avisando as outras cópias e sessões do que mudou
+            if alteradas:
+                novos = self.armazenamento.carimbar([(aba, data) for data in alteradas])
+                for (_, texto_data), carimbo in novos.items():
+                    data = datetime.strptime(texto_data, '%Y-%m-%d').date()
+                    self.versoes[(aba, texto_data)] = (carimbo, cabecalho, novas[data])
+            self.diario.concluir([op.id for ops in por_data.values() for op in ops], conflitos)
+
+    def _gravar_aba(self, aba, por_data, carimbos):
+        colunas = COLUNAS_POR_ABA[aba] + [c for ops in por_data.values() for op in ops for c in op.registro]
+        cabecalho, online = self.armazenamento.linhas_para_gravar(aba, por_data, colunas)
+        novas, conflitos = {}, []
+        for data, ops in por_data.items():
+            versao_online = carimbos.get((aba, data.strftime('%Y-%m-%d')), '')
+            novas[data], recusadas = aplicar_operacoes(
+                aba, [linha for _, linha in online.get(data, [])], ops, cabecalho, versao_online)
+            conflitos += recusadas
+        return cabecalho, novas, self.armazenamento.gravar_datas(aba, cabecalho, online, novas), conflitos
+
@@ -0,0 +1,499 @@
+"""Histórico de uma loja compartilhado pelas sessões: cada mês é lido uma vez por processo e cada sessão guarda só o que alterou."""
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from copia_local import dataframe_de_valores
+from dados import (
+    ESQUEMA_AGENDAMENTOS, ESQUEMA_SAIDAS, ESQUEMA_VENDAS, TabelaAgendamentos, TabelaRegistros,
+    mes_de, meses_ao_redor, ordinais_de_datas,
+)
+from planilhas import ABA_AGENDAMENTOS, ABA_SAIDAS, ABA_VENDAS, ABAS_DADOS
+
+# Meses compartilhados conferidos há mais que isto são conferidos de novo, em segundo plano
+VALIDADE = timedelta(minutes=5)
+# Depois deste tempo a conferência relê o mês inteiro, o que também traz
+# edições feitas direto na planilha (que não trocam carimbos)
+IDADE_MAXIMA = timedelta(hours=12)
+# Meses que nenhuma sessão abre há mais que isto saem da memória
+OCIOSIDADE = timedelta(minutes=30)
+
+# Aba -> (classe da tabela, esquema)
+CLASSES = {
+    ABA_AGENDAMENTOS: (TabelaAgendamentos, ESQUEMA_AGENDAMENTOS),
+    ABA_SAIDAS: (TabelaRegistros, ESQUEMA_SAIDAS),
+    ABA_VENDAS: (TabelaRegistros, ESQUEMA_VENDAS),
+}
+
+# Um mês compartilhado: {aba: tabela} somente leitura, os carimbos das datas do mês,
+# quando foi conferido com o armazenamento e quando foi lido inteiro
+Mes = namedtuple('Mes', ['tabelas', 'carimbos', 'conferido_em', 'lido_em'])
+
+
+def _meses_das_linhas(df):
+    """'AAAA-MM' de cada linha do DataFrame ('' para datas inválidas)."""
+    if 'Data' not in df.columns:
+        return np.full(len(df), '', dtype=object)
+    ordinais = ordinais_de_datas(df['Data'])
+    dias = (ordinais - date(1970, 1, 1).toordinal()).astype('datetime64[D]')
+    return np.where(ordinais > 0, np.datetime_as_string(dias, unit='M'), '')
+
+
+def _carimbos_do_mes(carimbos, mes):
+    return {chave: carimbo for chave, carimbo in carimbos.items() if chave[1][:7] == mes}
+
+
+def _com_datas_mudadas(troca, base, atual):
+    """'troca' com as datas em que 'atual' difere de 'base' copiadas de 'atual'."""
+    mudadas = [chave for chave in set(base.carimbos) | set(atual.carimbos)
+               if base.carimbos.get(chave) != atual.carimbos.get(chave)]
+    if not mudadas:
+        return troca
+    tabelas, carimbos = dict(troca.tabelas), dict(troca.carimbos)
+    for aba, texto_data in mudadas:
+        if aba not in CLASSES:
+            continue
+        if tabelas[aba] is troca.tabelas[aba]:
+            tabelas[aba] = tabelas[aba].copia()
+        data = date.fromisoformat(texto_data)
+        tabelas[aba].substituir_dia(data, atual.tabelas[aba].do_dia(data))
+        carimbos.pop((aba, texto_data), None)
+        if (aba, texto_data) in atual.carimbos:
+            carimbos[(aba, texto_data)] = atual.carimbos[(aba, texto_data)]
+    return troca._replace(tabelas=tabelas, carimbos=carimbos)
+
+
+class HistoricoCompartilhado:
+    """Meses do histórico de uma loja, lidos uma vez e usados por todas as sessões dela.
+
+    Cada mês é um Mes imutável: mudanças (gravações, conferências) montam
+    tabelas novas e trocam o Mes inteiro, então uma sessão que está lendo
+    nunca vê uma tabela pela metade. Sessões que abrem ao mesmo tempo um mês
+    ausente esperam uma única leitura. Meses com mais de 'validade' são
+    entregues como estão e conferidos numa thread (carimbos primeiro; só as
+    datas que mudaram são relidas). As gravações do gravador entram direto
+    nos meses, sem nova leitura. Operações do diário ainda não gravadas são
+    reaplicadas quando o mês é montado.
+    """
+
+    def __init__(self, armazenamento, copia_local, diario, janela, validade=VALIDADE, ociosidade=OCIOSIDADE):
+        self.armazenamento = armazenamento
+        self.copia_local = copia_local
+        self.diario = diario
+        self.janela = janela
+        self.validade = validade
+        self.ociosidade = ociosidade
+        # Muda a cada troca de meses: as sessões comparam para saber se há novidade
+        self.versao = 0
+        self.erro = None
+        self.conferindo = False
+        self._lock = threading.Lock()
+        self._leitura = threading.Lock()
+        self._meses = {}
+        self._acessos = {}
+        # Cabeçalho de cada aba na última leitura completa
+        self.cabecalhos = {}
+        # Carimbos de todas as datas (não só dos meses na memória), da última leitura
+        # com as gravações já aplicadas: assinam os resumos de meses não carregados.
+        # Sempre trocado por um dicionário novo, nunca alterado no lugar
+        self.carimbos = {}
+        # (aba, 'AAAA-MM-DD') -> carimbo da última gravação já aplicada nos meses
+        self._gravacoes_vistas = {}
+
+    def meses(self, meses):
+        """{mes: Mes} dos meses pedidos; os que não estão na memória são lidos numa chamada só."""
+        with self._lock:
+            faltando = [mes for mes in meses if mes not in self._meses]
+        if faltando:
+            with self._leitura:
+                # Outra sessão pode ter lido enquanto esta esperava
+                with self._lock:
+                    faltando = [mes for mes in faltando if mes not in self._meses]
+                if faltando:
+                    self._publicar(self._ler(faltando))
+
+        agora = datetime.now()
+        with self._lock:
+            for mes in meses:
+                self._acessos[mes] = agora
+            resultado = {mes: self._meses[mes] for mes in meses}
+            for mes in [m for m in self._meses if agora - self._acessos.get(m, agora) > self.ociosidade]:
+                del self._meses[mes]
+                self._acessos.pop(mes, None)
+            vencidos = [mes for mes, dados in self._meses.items() if agora - dados.conferido_em > self.validade]
+            if vencidos and not self.conferindo:
+                self.conferindo = True
+                threading.Thread(target=self._conferir, args=(vencidos,), daemon=True).start()
+        return resultado
+
+    def _publicar(self, novos):
+        with self._lock:
+            self._meses.update(novos)
+            self.versao += 1
+
+    def _ler(self, meses):
+        """Monta os meses a partir da cópia local (conferidos logo em seguida) ou do armazenamento."""
+        novos = {}
+        local = self.copia_local.carregar(meses)
+        # Cópia anterior à coluna ID fica de lado: a leitura normal preenche os IDs
+        if local is not None and all('ID' in local[0][aba].columns for aba in ABAS_DADOS):
+            abas, carimbos, sincronizada_em, presentes = local
+            try:
+                novos = self._montar(abas, carimbos, presentes, datetime.min, sincronizada_em)
+                # Os da cópia só valem até a conferência, que os troca pelos do armazenamento
+                self.carimbos = {**carimbos, **self.carimbos}
+                # As colunas da cópia são o cabeçalho da aba: a conferência já relê só as datas
+                for aba in ABAS_DADOS:
+                    if len(abas[aba].columns):
+                        self.cabecalhos.setdefault(aba, list(abas[aba].columns))
+            except Exception:
+                novos = {}  # Cópia ilegível: os meses vêm do armazenamento
+        faltando = [mes for mes in meses if mes not in novos]
+        if faltando:
+            novos.update(self._ler_do_armazenamento(faltando))
+        return novos
+
+    def _ler_do_armazenamento(self, meses):
+        with self._lock:
+            vistas = dict(self._gravacoes_vistas)
+        valores = self.armazenamento.ler_meses(meses)
+        carimbos = self.armazenamento.ler_carimbos()
+        with self._lock:
+            self._trocar_carimbos(carimbos, vistas)
+        self.cabecalhos.update({aba: list(valores[aba][0]) for aba in ABAS_DADOS if valores[aba]})
+        # Só os meses ao redor de hoje vão para a cópia local: são os que o login abre
+        janela = meses_ao_redor(date.today(), self.janela)
+        if any(mes in janela for mes in meses):
+            self.copia_local.atualizar_em_segundo_plano(valores, carimbos, meses, janela)
+        agora = datetime.now()
+        abas = {aba: dataframe_de_valores(valores[aba]) for aba in ABAS_DADOS}
+        return self._montar(abas, carimbos, meses, agora, agora)
+
+    def _trocar_carimbos(self, remotos, vistas):
+        """Troca self.carimbos pelos 'remotos', mantendo as gravações aplicadas depois de 'vistas' (chamar com o lock).
+
+        Essas gravações chegaram durante a leitura, então são mais novas que ela.
+        """
+        carimbos = dict(remotos)
+        for chave, carimbo in self._gravacoes_vistas.items():
+            if vistas.get(chave) != carimbo:
+                carimbos[chave] = carimbo
+        self.carimbos = carimbos
+
+    def _montar(self, abas, carimbos, meses, conferido_em, lido_em):
+        """{mes: Mes} a partir dos DataFrames das abas, com as operações pendentes do diário reaplicadas."""
+        por_mes = {mes: {} for mes in meses}
+        for aba, (classe, esquema) in CLASSES.items():
+            df = abas[aba]
+            grupos = dict(list(df.groupby(_meses_das_linhas(df), sort=False))) if len(df) else {}
+            for mes in meses:
+                por_mes[mes][aba] = classe.de_dataframe(grupos.get(mes, df.iloc[:0]), esquema)
+        for operacao in self.diario.pendentes():
+            tabelas = por_mes.get(mes_de(operacao.data))
+            if tabelas is None:
+                continue
+            tabela = tabelas[operacao.aba]
+            if operacao.tipo == 'remover':
+                tabela.remover(operacao.registro)
+            elif operacao.registro.get('ID') not in tabela:
+                tabela.adicionar(operacao.registro)
+        return {mes: Mes(tabelas, _carimbos_do_mes(carimbos, mes), conferido_em, lido_em)
+                for mes, tabelas in por_mes.items()}
+
+    def _conferir(self, meses):
+        try:
+            with self.armazenamento.metricas.etapa('sincronização'):
+                self._conferir_meses(meses)
+            self.erro = None
+        except Exception as e:
+            self.erro = e
+            # Nova tentativa só depois de outra 'validade', sem insistir a cada rerun
+            with self._lock:
+                agora = datetime.now()
+                for mes in meses:
+                    if mes in self._meses:
+                        self._meses[mes] = self._meses[mes]._replace(conferido_em=agora)
+        finally:
+            self.conferindo = False
+
+    def _conferir_meses(self, meses):
+        """Compara os carimbos dos meses com os do armazenamento e traz só o que mudou."""
+        with self._lock:
+            vistas = dict(self._gravacoes_vistas)
+        remotos = self.armazenamento.ler_carimbos()
+        agora = datetime.now()
+        with self._lock:
+            self._trocar_carimbos(remotos, vistas)
+            atuais = {mes: self._meses[mes] for mes in meses if mes in self._meses}
+        reler, mudaram = [], {}
+        for mes, dados in atuais.items():
+            if agora - dados.lido_em > IDADE_MAXIMA:
+                reler.append(mes)
+                continue
+            remotos_do_mes = _carimbos_do_mes(remotos, mes)
+            for chave in set(remotos_do_mes) | set(dados.carimbos):
+                if remotos_do_mes.get(chave) != dados.carimbos.get(chave):
+                    mudaram.setdefault(mes, set()).add(chave)
+
+        # Mês de onde cada troca partiu: o que mudar nele até a publicação entra por cima
+        trocas, bases = {}, {}
+        por_aba = {}
+        for mes, chaves in mudaram.items():
+            for aba, texto_data in chaves:
+                if aba in CLASSES:
+                    por_aba.setdefault(aba, set()).add(date.fromisoformat(texto_data))
+        linhas = {}
+        for aba, datas in por_aba.items():
+            cabecalho = self.cabecalhos.get(aba)
+            por_data = self.armazenamento.ler_datas(aba, cabecalho, datas) if cabecalho else None
+            if por_data is None:
+                # Cabeçalho desconhecido ou alterado: só uma leitura completa resolve
+                reler += [mes for mes in mudaram if mes not in reler]
+                break
+            linhas[aba] = (cabecalho, por_data, datas)
+        else:
+            pendentes = self.diario.datas_pendentes()
+            for mes, chaves in mudaram.items():
+                dados = atuais[mes]
+                tabelas, carimbos, copiadas = dict(dados.tabelas), _carimbos_do_mes(remotos, mes), set()
+                for aba, (cabecalho, por_data, datas) in linhas.items():
+                    for data in datas:
+                        texto_data = data.strftime('%Y-%m-%d')
+                        # Datas com alterações pendentes mudam de novo na gravação e chegam por ela
+                        if mes_de(data) != mes:
+                            continue
+                        if (aba, texto_data) in pendentes:
+                            # Fica com o carimbo antigo, que corresponde às linhas que a base tem
+                            carimbos[(aba, texto_data)] = dados.carimbos.get((aba, texto_data))
+                            continue
+                        if aba not in copiadas:
+                            tabelas[aba] = tabelas[aba].copia()
+                            copiadas.add(aba)
+                        tabelas[aba].substituir_dia(data, [dict(zip(cabecalho, linha)) for linha in por_data.get(data, [])])
+                trocas[mes] = dados._replace(tabelas=tabelas, conferido_em=agora,
+                                              carimbos={c: v for c, v in carimbos.items() if v is not None})
+                bases[mes] = dados
+
+        if reler:
+            with self._leitura:
+                trocas.update(self._ler_do_armazenamento(reler))
+            bases.update({mes: atuais[mes] for mes in reler})
+        with self._lock:
+            for mes in atuais:
+                if mes not in trocas and mes in self._meses:
+                    self._meses[mes] = self._meses[mes]._replace(conferido_em=agora)
+            # Gravações aplicadas enquanto a conferência lia a rede já estão marcadas
+            # como vistas e não voltam: passam do mês atual para a troca
+            for mes, troca in list(trocas.items()):
+                atual = self._meses.get(mes)
+                if atual is None:
+                    del trocas[mes]  # Saiu da memória por ociosidade
+                elif atual is not bases[mes]:
+                    trocas[mes] = _com_datas_mudadas(troca, bases[mes], atual)
+            if trocas:
+                self._meses.update(trocas)
+                self.versao += 1
+
+    def _gravacoes_novas(self, versoes, pendentes):
+        # Datas com operações pendentes ainda vão mudar: esperam a próxima gravação
+        for chave, versao in list(versoes.items()):
+            if chave not in pendentes and self._gravacoes_vistas.get(chave) != versao[0]:
+                yield chave, versao
+
+    def ha_gravacoes_novas(self, versoes, pendentes):
+        return next(self._gravacoes_novas(versoes, pendentes), None) is not None
+
+    def aplicar_gravacoes(self, versoes, pendentes):
+        """Troca nos meses compartilhados as datas gravadas pelo gravador ({(aba, 'AAAA-MM-DD'): (carimbo, cabecalho, linhas)}).
+
+        É a invalidação na gravação: o resultado já mesclado entra sem reler o
+        armazenamento. Cada gravação entra uma vez só, então uma versão mais
+        nova trazida pela conferência não é trocada de volta pela gravada.
+        """
+        with self._lock:
+            trocas, copiadas, carimbos = {}, {}, None
+            for (aba, texto_data), (carimbo, cabecalho, linhas) in self._gravacoes_novas(versoes, pendentes):
+                mes = texto_data[:7]
+                # Meses fora da memória já vêm com a gravação quando forem lidos; se uma
+                # leitura está em andamento, ela pode ter começado antes: a gravação
+                # fica para depois da leitura
+                if mes not in self._meses and self._leitura.locked():
+                    continue
+                self._gravacoes_vistas[(aba, texto_data)] = carimbo
+                carimbos = carimbos if carimbos is not None else dict(self.carimbos)
+                carimbos[(aba, texto_data)] = carimbo
+                dados = trocas.get(mes) or self._meses.get(mes)
+                if dados is None or dados.carimbos.get((aba, texto_data)) == carimbo:
+                    continue
+                if mes not in trocas:
+                    dados = trocas[mes] = dados._replace(tabelas=dict(dados.tabelas), carimbos=dict(dados.carimbos))
+                if aba not in copiadas.setdefault(mes, set()):
+                    dados.tabelas[aba] = dados.tabelas[aba].copia()
+                    copiadas[mes].add(aba)
+                data = date.fromisoformat(texto_data)
+                dados.tabelas[aba].substituir_dia(data, [dict(zip(cabecalho, linha)) for linha in linhas])
+                dados.tabelas[aba].datas_alteradas.discard(data)
+                dados.carimbos[(aba, texto_data)] = carimbo
+            if carimbos is not None:
+                self.carimbos = carimbos
+            if trocas:
+                self._meses.update(trocas)
+                self.versao += 1
+
+
+class VisaoDaSessao:
+    """Tabela de uma sessão: os meses compartilhados, somente leitura, com as datas alteradas nela por cima.
+
+    Uma data vai para a camada da sessão só quando a sessão a altera
+    (copiada da base, com o carimbo que a base tinha) e sai dela quando a
+    gravação chega aos meses compartilhados. Oferece as consultas e
+    alterações de TabelaRegistros que o app usa.
+    """
+
+    def __init__(self, aba):
+        self.aba = aba
+        classe, esquema = CLASSES[aba]
+        self._camada = classe(esquema=esquema)
+        self._meses = {}
+        # ordinal -> carimbo da base quando a data foi copiada para a camada
+        self._proprias = {}
+
+    def usar_meses(self, meses):
+        """Passa a ler dos Mes recebidos ({mes: Mes}, os meses que a sessão abriu)."""
+        self._meses = dict(meses)
+
+    def carimbos(self):
+        """Carimbos que a sessão conhece: os dos meses compartilhados e, nas datas próprias, os de quando foram copiadas."""
+        carimbos = {chave: c for dados in self._meses.values() for chave, c in dados.carimbos.items() if chave[0] == self.aba}
+        for ordinal, carimbo in self._proprias.items():
+            carimbos[(self.aba, date.fromordinal(ordinal).strftime('%Y-%m-%d'))] = carimbo
+        return carimbos
+
+    def descartar_gravadas(self, pendentes):
+        """Tira da camada as datas sem operações pendentes cuja versão nova já está nos meses compartilhados."""
+        for ordinal, carimbo in list(self._proprias.items()):
+            data = date.fromordinal(ordinal)
+            chave = (self.aba, data.strftime('%Y-%m-%d'))
+            dados = self._meses.get(mes_de(data))
+            if dados is None or chave in pendentes or dados.carimbos.get(chave, '') == carimbo:
+                continue
+            self._camada.substituir_dia(data, [])
+            self._camada.datas_alteradas.discard(data)
+            del self._proprias[ordinal]
+        # Remoções só marcam as linhas: a camada é refeita quando sobra pouco dela
+        if len(self._camada._vivo) > 4 * max(len(self._camada), 64):
+            self._camada = self._camada.copia()
+
+    def _base(self, data):
+        dados = self._meses.get(mes_de(data))
+        return dados.tabelas[self.aba] if dados is not None else None
+
+    def _tabela(self, data):
+        if data.toordinal() in self._proprias:
+            return self._camada
+        base = self._base(data)
+        return base if base is not None else self._camada
+
+    def _copiar_dia(self, data):
+        if data.toordinal() in self._proprias:
+            return
+        base = self._base(data)
+        self._camada.substituir_dia(data, base.do_dia(data) if base is not None else [])
+        dados = self._meses.get(mes_de(data))
+        texto_data = data.strftime('%Y-%m-%d')
+        self._proprias[data.toordinal()] = dados.carimbos.get((self.aba, texto_data), '') if dados is not None else ''
+
+    def _data_do_id(self, id_registro):
+        if id_registro in self._camada:
+            return self._camada.data_do_id(id_registro)
+        for dados in self._meses.values():
+            data = dados.tabelas[self.aba].data_do_id(id_registro)
+            if data is not None and data.toordinal() not in self._proprias:
+                return data
+        return None
+
+    # --- Alterações (só na camada) ---
+
+    def adicionar(self, registro):
+        self._copiar_dia(registro['Data'])
+        return self._camada.adicionar(registro)
+
+    def remover(self, registro):
+        data = self._data_do_id(registro.get('ID'))
+        if data is None:
+            return False
+        self._copiar_dia(data)
+        return self._camada.remover(registro)
+
+    def incorporar(self, outra):
+        for data in outra.datas():
+            self._copiar_dia(data)
+        self._camada.incorporar(outra)
+
+    @property
+    def datas_alteradas(self):
+        # Datas com operações pendentes reaplicadas na base também contam: ainda não estão gravadas
+        alteradas = set(self._camada.datas_alteradas)
+        for dados in self._meses.values():
+            alteradas |= {d for d in dados.tabelas[self.aba].datas_alteradas if d.toordinal() not in self._proprias}
+        return alteradas
+
+    # --- Consultas ---
+
+    def __contains__(self, id_registro):
+        return self._data_do_id(id_registro) is not None
+
+    def __len__(self):
+        sobrepostos = 0
+        for ordinal in self._proprias:
+            base = self._base(date.fromordinal(ordinal))
+            sobrepostos += len(base.do_dia(date.fromordinal(ordinal))) if base is not None else 0
+        return sum(len(dados.tabelas[self.aba]) for dados in self._meses.values()) - sobrepostos + len(self._camada)
+
+    def dataframe_do_dia(self, data):
+        return self._tabela(data).dataframe_do_dia(data)
+
+    def total_do_dia(self, data, *args, **kwargs):
+        return self._tabela(data).total_do_dia(data, *args, **kwargs)
+
+    def horario_ocupado(self, data, horario, barbeiro):
+        return self._tabela(data).horario_ocupado(data, horario, barbeiro)
+
+    def horarios_livres(self, data, barbeiro, horarios):
+        return self._tabela(data).horarios_livres(data, barbeiro, horarios)
+
+    def atendimentos_do_dia(self, data):
+        return self._tabela(data).atendimentos_do_dia(data)
+
+    def _partes(self, inicio, fim):
+        """(primeiro, último, tabela) de cada mês compartilhado que cruza [inicio, fim], em ordem."""
+        for mes in sorted(self._meses):
+            primeiro = date.fromisoformat(mes + '-01')
+            ultimo = (primeiro + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            primeiro, ultimo = max(primeiro, inicio), min(ultimo, fim)
+            if primeiro <= ultimo:
+                yield primeiro, ultimo, self._meses[mes].tabelas[self.aba]
+
+    def dataframe_periodo(self, inicio, fim):
+        proprias = [date.fromordinal(o) for o in self._proprias if inicio.toordinal() <= o <= fim.toordinal()]
+        partes = [tabela.dataframe_periodo(primeiro, ultimo) for primeiro, ultimo, tabela in self._partes(inicio, fim)]
+        if proprias:
+            excluir = pd.to_datetime(proprias)
+            partes = [df[~df['Data'].isin(excluir)] for df in partes]
+        partes.append(self._camada.dataframe_periodo(inicio, fim))
+        partes = [df for df in partes if len(df)] or partes[-1:]
+        return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0].reset_index(drop=True)
+
+    def matriz_ocupacao(self, inicio, fim, horarios, barbeiros):
+        matriz = np.zeros(((fim - inicio).days + 1, len(horarios), len(barbeiros)), dtype=bool)
+        for primeiro, ultimo, tabela in self._partes(inicio, fim):
+            a, z = (primeiro - inicio).days, (ultimo - inicio).days
+            matriz[a:z + 1] = tabela.matriz_ocupacao(primeiro, ultimo, horarios, barbeiros)
+        for ordinal in self._proprias:
+            if inicio.toordinal() <= ordinal <= fim.toordinal():
+                data = date.fromordinal(ordinal)
+                matriz[ordinal - inicio.toordinal()] = self._camada.matriz_ocupacao(data, data, horarios, barbeiros)[0]
+        return matriz
@@ -0,0 +1,160 @@
+"""Importação de registros antigos (CSV ou XLSX) em blocos e exportação de um período, alguns meses por vez."""
+import io
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+
+from dados import horarios_normalizados, mes_de, novo_id, ordinais_de_datas
+from planilhas import ABA_AGENDAMENTOS, ABA_SAIDAS, ABA_VENDAS, COLUNAS_POR_ABA
+
+# Linhas do arquivo tratadas por vez: limita a memória e o tamanho de cada lote mandado ao diário
+TAMANHO_BLOCO = 1000
+# Meses lidos do armazenamento por vez na exportação
+MESES_POR_LEITURA = 6
+# Recusas guardadas com o motivo, para mostrar (o total é sempre contado)
+MAXIMO_RECUSAS = 200
+
+# Coluna de texto que não pode ficar vazia, como nos formulários
+COLUNA_OBRIGATORIA = {ABA_AGENDAMENTOS: 'Cliente', ABA_SAIDAS: 'Descrição', ABA_VENDAS: 'Item'}
+
+
+def _texto_celula(valor):
+    """Célula do XLSX como o texto que estaria num CSV (datas em 'AAAA-MM-DD', horas em 'HH:MM')."""
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d') if valor.time() == time() else valor.strftime('%Y-%m-%d %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%Y-%m-%d')
+    if isinstance(valor, time):
+        return valor.strftime('%H:%M')
+    return str(valor)
+
+
+def _blocos_xlsx(arquivo, tamanho):
+    from openpyxl import load_workbook  # Só quem importa XLSX precisa do openpyxl
+
+    # read_only lê a planilha linha a linha, sem montar o arquivo inteiro na memória
+    livro = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        linhas = livro.active.iter_rows(values_only=True)
+        cabecalho = [_texto_celula(c).strip() for c in next(linhas, ())]
+        bloco, inicio = [], 0
+        for linha in linhas:
+            celulas = [_texto_celula(c) for c in linha[:len(cabecalho)]]
+            bloco.append(celulas + [''] * (len(cabecalho) - len(celulas)))
+            if len(bloco) == tamanho:
+                yield pd.DataFrame(bloco, columns=cabecalho, index=range(inicio, inicio + len(bloco)))
+                bloco, inicio = [], inicio + len(bloco)
+        if bloco:
+            yield pd.DataFrame(bloco, columns=cabecalho, index=range(inicio, inicio + len(bloco)))
+    finally:
+        livro.close()
+
+
+def ler_em_blocos(arquivo, nome, tamanho=TAMANHO_BLOCO):
+    """DataFrames de até 'tamanho' linhas do CSV (vírgula ou ponto e vírgula) ou XLSX, tudo como texto.
+
+    O índice de cada bloco conta as linhas de dados a partir de 0, então a
+    linha no arquivo é índice + 2 (a primeira é o cabeçalho).
+    """
+    if nome.lower().endswith('.xlsx'):
+        yield from _blocos_xlsx(arquivo, tamanho)
+        return
+    leitor = pd.read_csv(arquivo, sep=None, engine='python', dtype=str, keep_default_na=False,
+                         encoding='utf-8-sig', chunksize=tamanho)
+    for bloco in leitor:
+        yield bloco.rename(columns=str.strip)
+
+
+def _reais(serie):
+    """Valores em reais ('35', '35,00', 'R$ 35.00') -> float; vazios e inválidos viram 0."""
+    texto = serie.str.replace('R$', '', regex=False).str.strip().str.replace(',', '.', regex=False)
+    return pd.to_numeric(texto, errors='coerce').fillna(0.0)
+
+
+def preparar_bloco(aba, bloco):
+    """Aplica ao bloco as regras dos formulários; retorna (válidas, [(linha do arquivo, motivo)]).
+
+    As válidas saem com as colunas da aba, Data em 'AAAA-MM-DD', Horário
+    normalizado, valores em float (Valor (R$) = Valor 1 + Valor 2 quando só
+    eles vierem) e um ID para as linhas que não trazem um.
+    """
+    df = pd.DataFrame({
+        coluna: bloco[coluna].fillna('').astype(str).str.strip() if coluna in bloco.columns else ''
+        for coluna in COLUNAS_POR_ABA[aba]
+    }, index=bloco.index)
+    ordinais = ordinais_de_datas(df['Data'])
+    df['Data'] = [date.fromordinal(int(o)).isoformat() if o else '' for o in ordinais]
+    df['Valor (R$)'] = _reais(df['Valor (R$)'])
+    if aba == ABA_AGENDAMENTOS:
+        df['Valor 1 (R$)'] = _reais(df['Valor 1 (R$)'])
+        df['Valor 2 (R$)'] = _reais(df['Valor 2 (R$)'])
+        df['Valor (R$)'] = df['Valor (R$)'].where(df['Valor (R$)'] > 0, df['Valor 1 (R$)'] + df['Valor 2 (R$)'])
+        df['Horário'] = horarios_normalizados(df['Horário'])
+        df['Pagamento'] = df['Pagamento'].replace('', 'Não informado')
+
+    obrigatoria = COLUNA_OBRIGATORIA[aba]
+    # Em ordem de prioridade: cada linha recusada leva só o primeiro motivo
+    regras = [
+        (ordinais == 0, "data inválida"),
+        (df[obrigatoria] == '', f"'{obrigatoria}' vazio"),
+    ]
+    if aba == ABA_AGENDAMENTOS:
+        regras += [
+            (~df['Horário'].str.fullmatch(r'\d\d:\d\d'), "horário inválido"),
+            (df['Barbeiro'] == '', "'Barbeiro' vazio"),
+        ]
+    regras.append((df['Valor (R$)'] <= 0, "o valor deve ser maior que zero"))
+    motivos = np.select([np.asarray(mascara, dtype=bool) for mascara, _ in regras], [m for _, m in regras], '')
+    recusadas = [(int(i) + 2, str(motivo)) for i, motivo in zip(df.index, motivos) if motivo]
+
+    validas = df[motivos == ''].copy()
+    sem_id = validas['ID'] == ''
+    validas.loc[sem_id, 'ID'] = [novo_id() for _ in range(int(sem_id.sum()))]
+    return validas, recusadas
+
+
+def separar_conflitos(aba, validas, tabela):
+    """Tira das válidas as que já estão na tabela da sessão ou que se repetem no bloco.
+
+    Use depois de trazer para a tabela os meses das linhas, para que a
+    checagem de agendamento_existe valha para o mês inteiro.
+    """
+    motivos = pd.Series('', index=validas.index)
+    motivos[[id_registro in tabela for id_registro in validas['ID']]] = "registro já existente (mesmo ID)"
+    motivos[validas['ID'].duplicated() & (motivos == '')] = "ID repetido no arquivo"
+    if aba == ABA_AGENDAMENTOS:
+        chaves = validas[['Data', 'Horário', 'Barbeiro']]
+        ocupado = [tabela.horario_ocupado(date.fromisoformat(d), h, b) for d, h, b in chaves.itertuples(index=False)]
+        motivos[np.array(ocupado, dtype=bool) & (motivos == '')] = "o barbeiro já possui um agendamento neste horário"
+        motivos[chaves.duplicated() & (motivos == '')] = "horário do barbeiro repetido no arquivo"
+    recusadas = [(int(i) + 2, motivo) for i, motivo in motivos.items() if motivo]
+    return validas[motivos == ''], recusadas
+
+
+def exportar_csv(armazenamento, aba, inicio, fim):
+    """Bytes do CSV (';', UTF-8 com BOM, como o Excel abre) da aba entre 'inicio' e 'fim'.
+
+    Os meses são lidos do armazenamento MESES_POR_LEITURA por vez e já
+    convertidos em texto, então o histórico do período não fica todo na
+    memória, só o CSV (que o st.download_button guarda inteiro de qualquer jeito).
+    """
+    meses = sorted({mes_de(inicio + timedelta(days=n)) for n in range((fim - inicio).days + 1)})
+    saida = io.BytesIO()
+    texto = io.TextIOWrapper(saida, encoding='utf-8-sig', newline='')
+    colunas = None
+    for i in range(0, len(meses), MESES_POR_LEITURA):
+        # Etapa de segundo plano: na fila da cota, as leituras das telas passam na frente
+        with armazenamento.metricas.etapa('exportação'):
+            valores = armazenamento.ler_meses_da_aba(aba, meses[i:i + MESES_POR_LEITURA])
+        df = pd.DataFrame(valores[1:], columns=valores[0]) if valores else pd.DataFrame()
+        if colunas is None:
+            colunas = list(df.columns) or list(COLUNAS_POR_ABA[aba])
+        ordinais = ordinais_de_datas(df['Data']) if 'Data' in df.columns else np.zeros(len(df), dtype=np.int64)
+        no_periodo = (ordinais >= inicio.toordinal()) & (ordinais <= fim.toordinal())
+        df = df[no_periodo].assign(_ordinal=ordinais[no_periodo]).sort_values('_ordinal', kind='stable')
+        df.reindex(columns=colunas, fill_value='').to_csv(texto, sep=';', index=False, header=i == 0)
+    texto.flush()
+    return texto.detach().getvalue()
@@ -0,0 +1,57 @@
+"""Lojas atendidas pelo app: cada uma com a sua planilha, os seus usuários e a sua equipe.
+
+Módulo leve (sem pandas nem gspread): a tela de login usa antes dos imports pesados.
+"""
+from collections import namedtuple
+
+# Como a loja aparece no título; usado quando o secrets.toml não tem a seção [lojas]
+NOME_PADRAO = "Barbearia Lucas Borges"
+
+Loja = namedtuple('Loja', ['id', 'nome', 'sheet_id', 'usuarios', 'administradores', 'barbeiros', 'vendedores'])
+
+
+def ler_lojas(secrets, tipo, usuarios, administradores, barbeiros, vendedores):
+    """{id: Loja} a partir da seção [lojas] do secrets.toml.
+
+    Cada [lojas.<id>] traz nome, sheet_id, usuarios (tabela usuário = senha)
+    e, opcionais, administradores, barbeiros e vendedores; o que faltar vem
+    dos padrões passados. Sem a seção, o app atende uma loja só, com o
+    'sheet_id' da raiz do secrets.toml e os padrões, como antes. Usuários e
+    planilhas não podem se repetir entre lojas: o login escolhe a loja pelo
+    usuário e os arquivos locais ficam numa pasta por planilha.
+    """
+    configuradas = secrets.get("lojas")
+    if not configuradas:
+        # Sem planilha (armazenamento 'sqlite') os arquivos ficam em pasta_cache/local
+        sheet_id = secrets["sheet_id"] if tipo == "planilha" else secrets.get("sheet_id", "local")
+        configuradas = {"principal": {"nome": NOME_PADRAO, "sheet_id": sheet_id, "usuarios": usuarios}}
+
+    lojas, dono_do_usuario, dono_da_planilha = {}, {}, {}
+    for id_loja, config in configuradas.items():
+        sheet_id = config["sheet_id"] if tipo == "planilha" else config.get("sheet_id", id_loja)
+        loja = Loja(
+            id=id_loja,
+            nome=config.get("nome", NOME_PADRAO),
+            sheet_id=sheet_id,
+            usuarios=dict(config.get("usuarios", {})),
+            administradores=frozenset(config.get("administradores", administradores)),
+            barbeiros=list(config.get("barbeiros", barbeiros)),
+            vendedores=list(config.get("vendedores", vendedores)),
+        )
+        for usuario in loja.usuarios:
+            if usuario in dono_do_usuario:
+                raise ValueError(f"O usuário {usuario!r} está nas lojas {dono_do_usuario[usuario]!r} e {id_loja!r}.")
+            dono_do_usuario[usuario] = id_loja
+        if sheet_id in dono_da_planilha:
+            raise ValueError(f"As lojas {dono_da_planilha[sheet_id]!r} e {id_loja!r} usam a mesma planilha.")
+        dono_da_planilha[sheet_id] = id_loja
+        lojas[id_loja] = loja
+    return lojas
+
+
+def loja_do_login(lojas, usuario, senha):
+    """A Loja do usuário se a senha confere; None caso contrário."""
+    for loja in lojas.values():
+        if usuario in loja.usuarios and loja.usuarios[usuario] == senha:
+            return loja
+    return None
@@ -0,0 +1,137 @@
+"""Conexões e caches de cada loja em uso, num LRU limitado: lojas sem uso recente são fechadas."""
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import streamlit as st
+
+from armazenamento import criar_armazenamento
+from copia_local import CopiaLocal
+from cota import obter_cota
+from gravador import Diario, Gravador
+from historico import HistoricoCompartilhado
+from ocupacao import MatrizesMensais
+from relatorios import ResumosMensais
+
+# Lojas abertas ao mesmo tempo por processo (ajustável com 'maximo_lojas_ativas' no secrets.toml)
+MAXIMO_LOJAS_ATIVAS = 8
+# Uma loja só é fechada pelo LRU depois de passar este tempo (em segundos) sem nenhum rerun
+# completo de suas sessões: quem ainda usa os recursos dela nunca os vê fechados
+OCIOSIDADE_LOJA = 15 * 60
+# Meses antes e depois do atual abertos no login e guardados na cópia local ('meses_janela' no secrets.toml)
+MESES_JANELA = 1
+
+
+class RecursosDaLoja:
+    """Tudo o que o processo mantém aberto para uma loja, compartilhado pelas sessões dela.
+
+    O armazenamento (conexão com a planilha ou o SQLite) com as métricas, a
+    cópia local, o diário com o gravador, o histórico compartilhado e os
+    caches de resumos e de matrizes de ocupação. Tudo fica em pasta/sheet_id, então fechar e abrir de novo
+    retoma do disco: o diário guarda as alterações que ainda não foram gravadas.
+    """
+
+    def __init__(self, loja, tipo, pasta, credenciais, cota, janela=MESES_JANELA):
+        self.loja = loja
+        self.armazenamento = criar_armazenamento(tipo, pasta, loja.sheet_id, credenciais, cota)
+        self.metricas = self.armazenamento.metricas
+        self.copia_local = CopiaLocal(pasta, loja.sheet_id)
+        self.gravador = Gravador(self.armazenamento, Diario(Path(pasta) / loja.sheet_id / 'diario.sqlite3'))
+        self.historico = HistoricoCompartilhado(self.armazenamento, self.copia_local, self.gravador.diario, janela)
+        self.resumos = ResumosMensais(self.armazenamento)
+        self.matrizes = MatrizesMensais()
+        self.usada_em = time.monotonic()
+        self.fechada = threading.Event()
+
+    def fechar(self):
+        """Para o gravador (depois do lote em andamento) e fecha o diário e o armazenamento."""
+        try:
+            self.gravador.parar()
+            self.gravador.diario.fechar()
+            self.armazenamento.fechar()
+        finally:
+            self.fechada.set()
+
+
+class LojasAtivas:
+    """LRU de RecursosDaLoja: cada obter() põe a loja no fim da fila e as que passam de 'maximo' são fechadas.
+
+    Memória e conexões crescem com as lojas em uso, não com as configuradas.
+    Só sai da fila uma loja sem obter() nem manter() há mais de 'ociosidade'
+    segundos; enquanto todas estiverem em uso, o limite é ultrapassado. Uma loja que
+    sai e volta logo espera o fechamento anterior terminar, para nunca haver
+    dois gravadores no mesmo diário.
+    """
+
+    def __init__(self, tipo, pasta, credenciais=None, maximo=MAXIMO_LOJAS_ATIVAS, cota=None, janela=MESES_JANELA,
+                 ociosidade=OCIOSIDADE_LOJA):
+        self.tipo = tipo
+        self.pasta = pasta
+        self.maximo = maximo
+        self.ociosidade = ociosidade
+        self.janela = janela
+        self._credenciais = credenciais
+        self._cota = cota
+        self._lock = threading.Lock()
+        self._ativas = OrderedDict()
+        self._fechando = {}
+
+    def obter(self, loja):
+        with self._lock:
+            recursos = self._ativas.get(loja.id)
+            if recursos is not None:
+                recursos.usada_em = time.monotonic()
+                self._ativas.move_to_end(loja.id)
+                return recursos
+            anterior = self._fechando.get(loja.id)
+        if anterior is not None:
+            anterior.fechada.wait()
+        with self._lock:
+            # Outra sessão pode ter aberto a loja enquanto esta esperava
+            recursos = self._ativas.get(loja.id)
+            if recursos is None:
+                recursos = RecursosDaLoja(loja, self.tipo, self.pasta, self._credenciais, self._cota, self.janela)
+                self._ativas[loja.id] = recursos
+            recursos.usada_em = time.monotonic()
+            self._ativas.move_to_end(loja.id)
+            saindo = []
+            while len(self._ativas) > self.maximo:
+                # A primeira da fila é a de uso mais antigo: se ela ainda está em uso, todas estão
+                if time.monotonic() - next(iter(self._ativas.values())).usada_em < self.ociosidade:
+                    break
+                _, antiga = self._ativas.popitem(last=False)
+                self._fechando[antiga.loja.id] = antiga
+                saindo.append(antiga)
+        for antiga in saindo:
+            threading.Thread(target=self._fechar, args=(antiga,), daemon=True).start()
+        return recursos
+
+    def manter(self, recursos):
+        """Marca a loja como em uso sem reabri-la; False se ela já saiu da fila (os recursos não valem mais)."""
+        with self._lock:
+            if self._ativas.get(recursos.loja.id) is not recursos:
+                return False
+            recursos.usada_em = time.monotonic()
+            return True
+
+    def _fechar(self, recursos):
+        try:
+            recursos.fechar()
+        except Exception:
+            pass  # Arquivos e conexões são liberados de qualquer forma quando o objeto sai da memória
+        finally:
+            with self._lock:
+                if self._fechando.get(recursos.loja.id) is recursos:
+                    del self._fechando[recursos.loja.id]
+
+    def ativas(self):
+        """Ids das lojas abertas, da menos para a mais recente."""
+        with self._lock:
+            return list(self._ativas)
+
+
+@st.cache_resource(show_spinner=False)
+def obter_lojas_ativas(tipo, pasta, maximo=MAXIMO_LOJAS_ATIVAS, janela=MESES_JANELA):
+    """Um LRU por processo; a conta de serviço (e a fila da cota dela) é a mesma para todas as lojas."""
+    return LojasAtivas(tipo, pasta, st.secrets.get("gcp_service_account"), maximo, obter_cota(), janela)
@@ -0,0 +1,185 @@
+"""Tempo e volume de cada chamada ao Google Sheets e de cada etapa do app, para o painel de administração."""
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+# Cota padrão da API do Sheets por usuário (a conta de serviço): leituras e escritas por minuto, separadas
+LIMITE_POR_MINUTO = 60
+# Medidas guardadas na memória para o painel; o arquivo JSONL guarda as demais
+CAPACIDADE = 20000
+# Tamanho do arquivo JSONL que o faz ser trocado: o anterior fica como .1 (só um é mantido)
+TAMANHO_MAXIMO_ARQUIVO = 20 * 1024 * 1024
+
+# Operações da API reconhecidas no fim do endereço (…/values:batchGet, …/A1:append, …:batchUpdate)
+_OPERACOES = ('batchGet', 'batchUpdate', 'batchClear', 'append', 'clear')
+
+# tipo: 'api' (uma requisição HTTP) ou 'etapa' (um trecho do app medido com Metricas.etapa)
+Medida = namedtuple('Medida', ['momento', 'tipo', 'etapa', 'nome', 'duracao_ms', 'linhas', 'celulas', 'erro'])
+
+_etapa_atual = ContextVar('etapa_atual', default='sem etapa')
+
+
+def etapa_atual():
+    """Nome da etapa em curso nesta thread (o agendador da cota decide a prioridade por ele)."""
+    return _etapa_atual.get()
+
+
+def _operacao(metodo, endereco):
+    """Nome curto da chamada, ex.: 'GET batchGet', 'POST append', 'GET metadados'."""
+    caminho = endereco.split('/spreadsheets/', 1)[-1]
+    for operacao in _OPERACOES:
+        if caminho.endswith(':' + operacao):
+            return f"{metodo.upper()} {operacao}"
+    return f"{metodo.upper()} {'values' if '/values/' in caminho else 'metadados'}"
+
+
+def _contar_valores(corpo):
+    """(linhas, células) das faixas de valores de um corpo de requisição ou de resposta."""
+    faixas = corpo.get('valueRanges') or corpo.get('data') or [corpo]
+    valores = [faixa.get('values') or [] for faixa in faixas if isinstance(faixa, dict)]
+    return sum(len(v) for v in valores), sum(len(linha) for v in valores for linha in v)
+
+
+class Metricas:
+    """Medidas recentes na memória (para o painel) e acrescentadas a um arquivo JSONL (para análise).
+
+    O arquivo fica aberto entre as medidas e, passando de
+    TAMANHO_MAXIMO_ARQUIVO, é renomeado para .1 e recomeçado. É compartilhada por todas as sessões e threads do processo. A etapa em
+    curso fica num ContextVar, então cada chamada à API é atribuída à ação
+    que a causou (login, gravação, sincronização...).
+    """
+
+    def __init__(self, arquivo=None):
+        self.arquivo = Path(arquivo) if arquivo else None
+        self._lock = threading.Lock()
+        self._medidas = deque(maxlen=CAPACIDADE)
+        self._saida = None
+
+    def registrar(self, tipo, nome, duracao_ms, linhas=0, celulas=0, erro=''):
+        medida = Medida(datetime.now().isoformat(timespec='milliseconds'), tipo, _etapa_atual.get(), nome,
+                        round(duracao_ms, 1), linhas, celulas, erro)
+        with self._lock:
+            self._medidas.append(medida)
+            if self.arquivo is not None:
+                try:
+                    self._gravar((json.dumps(medida._asdict(), ensure_ascii=False) + '\n').encode('utf-8'))
+                except OSError:
+                    pass  # Sem disco o painel continua funcionando com as medidas da memória
+
+    def _gravar(self, linha):
+        """Acrescenta a linha ao arquivo, abrindo-o na primeira vez e trocando-o quando fica grande (chamar com o lock)."""
+        if self._saida is None:
+            self.arquivo.parent.mkdir(parents=True, exist_ok=True)
+            self._saida = self.arquivo.open('ab')
+        elif self._saida.tell() > TAMANHO_MAXIMO_ARQUIVO:
+            self._saida.close()
+            self._saida = None
+            os.replace(self.arquivo, self.arquivo.with_name(self.arquivo.name + '.1'))
+            self._saida = self.arquivo.open('ab')
+        self._saida.write(linha)
+        self._saida.flush()
+
+    def fechar(self):
+        with self._lock:
+            if self._saida is not None:
+                self._saida.close()
+                self._saida = None
+
+    @contextmanager
+    def etapa(self, nome):
+        """Mede o bloco e atribui a ele as chamadas à API feitas dentro dele (na mesma thread)."""
+        token = _etapa_atual.set(nome)
+        inicio = time.perf_counter()
+        erro = ''
+        try:
+            yield
+        except Exception as e:
+            erro = type(e).__name__
+            raise
+        finally:
+            _etapa_atual.reset(token)
+            self.registrar('etapa', nome, (time.perf_counter() - inicio) * 1000, erro=erro)
+
+    def instrumentar(self, http_client):
+        """Envolve http_client.request (por onde passa toda chamada do gspread) para medir cada requisição."""
+        if http_client is None or getattr(http_client, '_metricas', None) is self:
+            return
+        original = http_client.request
+
+        def request(method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+            inicio = time.perf_counter()
+            linhas, celulas = _contar_valores(json) if isinstance(json, dict) else (0, 0)
+            erro = ''
+            try:
+                resposta = original(method, endpoint, params=params, data=data, json=json, files=files, headers=headers)
+                if method.lower() == 'get' and '/values' in endpoint:
+                    # Converte uma vez só: o gspread recebe o mesmo resultado em vez de converter de novo
+                    valores = resposta.json()
+                    resposta.json = lambda **kwargs: valores
+                    linhas, celulas = _contar_valores(valores)
+                return resposta
+            except Exception as e:
+                erro = str(getattr(e, 'code', '') or type(e).__name__)
+                raise
+            finally:
+                self.registrar('api', _operacao(method, endpoint), (time.perf_counter() - inicio) * 1000,
+                               linhas, celulas, erro)
+
+        http_client.request = request
+        http_client._metricas = self
+
+    def medidas(self):
+        with self._lock:
+            return pd.DataFrame(list(self._medidas), columns=Medida._fields)
+
+    def chamadas_por_minuto(self, agora=None):
+        """{'leituras': n, 'escritas': n} no último minuto, para comparar com LIMITE_POR_MINUTO."""
+        limite = ((agora or datetime.now()) - timedelta(minutes=1)).isoformat(timespec='milliseconds')
+        with self._lock:
+            recentes = [m.nome for m in self._medidas if m.tipo == 'api' and m.momento >= limite]
+        leituras = sum(nome.startswith('GET') for nome in recentes)
+        return {'leituras': leituras, 'escritas': len(recentes) - leituras}
+
+    def exportar_jsonl(self):
+        with self._lock:
+            return ''.join(json.dumps(m._asdict(), ensure_ascii=False) + '\n' for m in self._medidas)
+
+
+def resumo_da_api(df):
+    """Por etapa: chamadas, leituras, escritas, linhas, células, tempo médio e p95 e erros."""
+    api = df[df['tipo'] == 'api']
+    if api.empty:
+        return pd.DataFrame()
+    grupos = api.assign(leitura=api['nome'].str.startswith('GET'), falhou=api['erro'] != '').groupby('etapa')
+    return pd.DataFrame({
+        'Chamadas': grupos.size(),
+        'Leituras': grupos['leitura'].sum(),
+        'Escritas': grupos.size() - grupos['leitura'].sum(),
+        'Linhas': grupos['linhas'].sum(),
+        'Células': grupos['celulas'].sum(),
+        'Média (ms)': grupos['duracao_ms'].mean().round(0),
+        'p95 (ms)': grupos['duracao_ms'].quantile(0.95).round(0),
+        'Erros': grupos['falhou'].sum(),
+    }).sort_values('Chamadas', ascending=False)
+
+
+def resumo_das_etapas(df):
+    """Por etapa do app: execuções, tempo médio, p95 e máximo."""
+    etapas = df[df['tipo'] == 'etapa']
+    if etapas.empty:
+        return pd.DataFrame()
+    grupos = etapas.groupby('nome')['duracao_ms']
+    return pd.DataFrame({
+        'Execuções': grupos.size(),
+        'Média (ms)': grupos.mean().round(1),
+        'p95 (ms)': grupos.quantile(0.95).round(1),
+        'Máximo (ms)': grupos.max(),
+    }).sort_values('Média (ms)', ascending=False)
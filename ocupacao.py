@@ -0,0 +1,158 @@
+"""Ocupação da agenda por dia, horário e barbeiro: mapas de calor, taxas de uso e horários de pico."""
+import calendar
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from planilhas import ABA_AGENDAMENTOS
+from relatorios import assinatura_do_mes, meses_do_intervalo
+
+DIAS_DA_SEMANA = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+# Horários ocupados em pelo menos esta fração dos dias de expediente contam como lotados; até a outra, como ociosos
+LIMITE_LOTADO = 0.8
+LIMITE_OCIOSO = 0.2
+# Matrizes de meses fechados guardadas por processo (cada uma tem poucos KB)
+MAXIMO_MESES_GUARDADOS = 240
+
+
+class MatrizesMensais:
+    """Matrizes de ocupação de meses fechados, na memória do processo.
+
+    A chave leva a assinatura dos carimbos do mês, então uma gravação naquele
+    mês a invalida, como nos resumos mensais. As matrizes são somente leitura:
+    várias sessões usam o mesmo array.
+    """
+
+    def __init__(self, maximo=MAXIMO_MESES_GUARDADOS):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._matrizes = OrderedDict()
+
+    def obter(self, chave):
+        with self._lock:
+            matriz = self._matrizes.get(chave)
+            if matriz is not None:
+                self._matrizes.move_to_end(chave)
+            return matriz
+
+    def guardar(self, chave, matriz):
+        matriz.flags.writeable = False
+        with self._lock:
+            self._matrizes[chave] = matriz
+            self._matrizes.move_to_end(chave)
+            while len(self._matrizes) > self.maximo:
+                self._matrizes.popitem(last=False)
+
+
+def ocupacao_periodo(tabela, inicio, fim, horarios, barbeiros, carimbos, cache, hoje=None, carregar_meses=None):
+    """Matriz dias × horários × barbeiros de [inicio, fim] a partir da tabela de agendamentos.
+
+    Meses já fechados e sem alterações desta sessão vêm inteiros do cache
+    quando a assinatura confere (e são recortados no intervalo); os demais
+    são montados da tabela. 'carregar_meses', se dado, recebe antes os meses
+    que precisam ser lidos da tabela e retorna os que não conseguiu trazer:
+    esses são montados como estiverem, mas não vão para o cache.
+    """
+    hoje = hoje or date.today()
+    alteradas = {d.strftime('%Y-%m') for d in tabela.datas_alteradas}
+    eixos = (tuple(horarios), tuple(barbeiros))
+
+    def _chave(mes):
+        do_mes = {chave: carimbo for chave, carimbo in carimbos.items() if chave[0] == ABA_AGENDAMENTOS}
+        return (mes, assinatura_do_mes(do_mes, mes), *eixos)
+
+    partes, lidos, falharam = [], [], set()
+    for primeiro, ultimo, mes in meses_do_intervalo(inicio, fim):
+        fechado = ultimo < hoje.replace(day=1) and mes not in alteradas
+        guardada = cache.obter(_chave(mes)) if fechado else None
+        if guardada is None:
+            lidos.append(mes)
+        partes.append((primeiro, ultimo, mes, fechado, guardada))
+    if lidos and carregar_meses is not None:
+        falharam = set(carregar_meses(lidos))
+
+    matrizes = []
+    for primeiro, ultimo, mes, fechado, guardada in partes:
+        if fechado and guardada is None and mes not in falharam:
+            dia_1 = primeiro.replace(day=1)
+            guardada = tabela.matriz_ocupacao(
+                dia_1, dia_1.replace(day=calendar.monthrange(dia_1.year, dia_1.month)[1]), horarios, barbeiros)
+            # Chave refeita depois da leitura, que pode ter trazido os carimbos do mês
+            cache.guardar(_chave(mes), guardada)
+        if guardada is not None:
+            matrizes.append(guardada[primeiro.day - 1:ultimo.day])
+        else:
+            matrizes.append(tabela.matriz_ocupacao(primeiro, ultimo, horarios, barbeiros))
+    return np.concatenate(matrizes) if matrizes else np.zeros((0, len(horarios), len(barbeiros)), dtype=bool)
+
+
+def dias_de_expediente(matriz):
+    """Dias com pelo menos um agendamento de qualquer barbeiro (os demais não contam nas taxas)."""
+    return matriz.any(axis=(1, 2))
+
+
+def taxas_por_horario(matriz):
+    """Horários × barbeiros: fração dos dias de expediente em que o horário estava ocupado."""
+    abertos = dias_de_expediente(matriz)
+    if not abertos.any():
+        return np.zeros(matriz.shape[1:])
+    return matriz[abertos].sum(axis=0) / abertos.sum()
+
+
+def taxas_por_dia_da_semana(matriz, inicio, barbeiro=None):
+    """Dias da semana × horários: fração ocupada, de um barbeiro (posição no eixo) ou da equipe toda."""
+    abertos = dias_de_expediente(matriz)
+    ocupado = matriz[abertos, :, barbeiro] if barbeiro is not None else matriz[abertos].mean(axis=2)
+    semana = (inicio.weekday() + np.flatnonzero(abertos)) % 7
+    # Uma matriz de indicadores (dia × dia da semana) soma todos os dias de uma vez
+    indicador = np.eye(7)[semana]
+    dias = indicador.sum(axis=0)
+    return (indicador.T @ ocupado) / np.maximum(dias, 1)[:, None]
+
+
+def utilizacao_por_barbeiro(matriz, barbeiros):
+    """DataFrame com agendamentos e fração da grade ocupada de cada barbeiro nos dias de expediente."""
+    abertos = dias_de_expediente(matriz)
+    ocupados = matriz[abertos].sum(axis=(0, 1))
+    grade = max(int(abertos.sum()) * matriz.shape[1], 1)
+    return pd.DataFrame({"Barbeiro": list(barbeiros), "Agendamentos": ocupados, "Ocupação": ocupados / grade})
+
+
+def horarios_de_pico(taxas, horarios, quantidade=5):
+    """Os 'quantidade' horários mais ocupados, pela média entre os barbeiros."""
+    media = taxas.mean(axis=1) if taxas.size else np.zeros(len(horarios))
+    ordem = np.argsort(-media, kind='stable')[:quantidade]
+    return pd.DataFrame({"Horário": np.asarray(horarios)[ordem], "Ocupação": media[ordem]})
+
+
+def horarios_cronicos(taxas, horarios, barbeiros):
+    """(lotados, ociosos): DataFrames de (Barbeiro, Horário, Ocupação) acima de LIMITE_LOTADO e até LIMITE_OCIOSO."""
+    df = _tabela_longa(taxas, list(horarios), "Horário", list(barbeiros), "Barbeiro")
+    df = df[["Barbeiro", "Horário", "Ocupação"]]
+    lotados = df[df["Ocupação"] >= LIMITE_LOTADO].sort_values("Ocupação", ascending=False, kind='stable')
+    ociosos = df[df["Ocupação"] <= LIMITE_OCIOSO].sort_values("Ocupação", kind='stable')
+    return lotados, ociosos
+
+
+def _tabela_longa(taxas, linhas, nome_linhas, colunas, nome_colunas):
+    return pd.DataFrame({
+        nome_linhas: np.repeat(linhas, len(colunas)),
+        nome_colunas: np.tile(colunas, len(linhas)),
+        "Ocupação": taxas.ravel(),
+    })
+
+
+def mapa_de_calor(taxas, linhas, nome_linhas, colunas, nome_colunas):
+    """Gráfico Altair de 'taxas' (linhas × colunas) com a ocupação em cores de 0 a 100%."""
+    df = _tabela_longa(taxas, list(linhas), nome_linhas, list(colunas), nome_colunas)
+    return alt.Chart(df).mark_rect().encode(
+        x=alt.X(f"{nome_colunas}:O", sort=list(colunas)),
+        y=alt.Y(f"{nome_linhas}:O", sort=list(linhas)),
+        color=alt.Color("Ocupação:Q", scale=alt.Scale(domain=[0, 1], scheme="orangered"),
+                        legend=alt.Legend(format="%")),
+        tooltip=[nome_linhas, nome_colunas, alt.Tooltip("Ocupação:Q", format=".0%")],
+    )
@@ -0,0 +1,474 @@
+"""Acesso ao Google Sheets compartilhado entre reruns e sessões do Streamlit."""
+import math
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import gspread
+import numpy as np
+import pandas as pd
+from gspread.utils import absolute_range_name, fill_gaps, rowcol_to_a1
+
+from cota import Cota
+from metricas import Metricas
+from dados import ESQUEMA_AGENDAMENTOS, ESQUEMA_SAIDAS, ESQUEMA_VENDAS, dias_dos_meses, novo_id, ordinais_de_datas
+
+# Abas usadas pelo app
+ABA_AGENDAMENTOS = 'Agendamentos'
+ABA_SAIDAS = 'Saidas'
+ABA_VENDAS = 'Vendas'
+
+# Cabeçalho de cada aba, na ordem em que as colunas são criadas
+COLUNAS_AGENDAMENTOS = list(ESQUEMA_AGENDAMENTOS)
+COLUNAS_SAIDAS = list(ESQUEMA_SAIDAS)
+COLUNAS_VENDAS = list(ESQUEMA_VENDAS)
+
+ABAS_DADOS = (ABA_AGENDAMENTOS, ABA_SAIDAS, ABA_VENDAS)
+COLUNAS_POR_ABA = {
+    ABA_AGENDAMENTOS: COLUNAS_AGENDAMENTOS,
+    ABA_SAIDAS: COLUNAS_SAIDAS,
+    ABA_VENDAS: COLUNAS_VENDAS,
+}
+
+# Aba de controle: um carimbo por (aba, data), trocado a cada salvamento daquela data.
+# Permite descobrir quais datas mudaram lendo só esta aba pequena.
+ABA_CONTROLE = '_Controle'
+COLUNAS_CONTROLE = ['Aba', 'Data', 'Carimbo']
+
+# Aba de resumos: um resumo (JSON) por mês fechado, com a assinatura dos carimbos daquele mês
+ABA_RESUMOS = '_Resumos'
+COLUNAS_RESUMOS = ['Mês', 'Assinatura', 'Resumo']
+
+# Linhas por requisição de acréscimo (append)
+LINHAS_POR_APPEND = 5000
+
+# Códigos de erro da API que indicam token inválido/expirado
+CODIGOS_ERRO_AUTENTICACAO = (401, 403)
+
+
+class ConexaoPlanilha:
+    """Cliente autenticado, planilha e abas guardados uma única vez por processo.
+
+    Nenhuma chamada à API é feita na criação: a autenticação e a leitura dos
+    metadados acontecem no primeiro uso e ficam em cache até um erro de
+    autenticação forçar a reconexão.
+    """
+
+    # Renova o token um pouco antes de expirar, para não falhar no meio de um salvamento
+    MARGEM_RENOVACAO = timedelta(minutes=5)
+
+    def __init__(self, credenciais, sheet_id, metricas=None, cota=None):
+        self._credenciais = dict(credenciais)
+        self.sheet_id = sheet_id
+        # Toda requisição do cliente passa pelas métricas (tempo, células, erros de cota)
+        self.metricas = metricas or Metricas()
+        # ... e pela fila da cota, que espera a vez e repete falhas temporárias
+        self.cota = cota or Cota()
+        self._lock = threading.RLock()
+        self._criacao = threading.Lock()
+        self._client = None
+        self._spreadsheet = None
+        self._abas = {}
+
+    def _conectar(self):
+        self._client = gspread.service_account_from_dict(self._credenciais)
+        http_client = getattr(self._client, 'http_client', None)
+        self.metricas.instrumentar(http_client)
+        # A fila fica por fora das métricas: cada tentativa é medida, a espera na fila não
+        self.cota.controlar(http_client)
+        self._spreadsheet = self._client.open_by_key(self.sheet_id)
+        # Uma única leitura de metadados traz todas as abas de uma vez
+        self._abas = {ws.title: ws for ws in self._spreadsheet.worksheets()}
+
+    def _renovar_token_se_preciso(self):
+        http_client = getattr(self._client, 'http_client', None)
+        credenciais = getattr(http_client, 'auth', None) or getattr(self._client, 'auth', None)
+        expiracao = getattr(credenciais, 'expiry', None)
+        if expiracao is None:
+            return  # Token ainda não emitido: o gspread obtém na primeira requisição
+        # O google-auth guarda 'expiry' como UTC sem fuso horário
+        agora = datetime.now(timezone.utc).replace(tzinfo=None)
+        if expiracao - agora < self.MARGEM_RENOVACAO:
+            http_client.login()
+
+    def invalidar(self):
+        """Descarta cliente e abas; a próxima chamada autentica de novo."""
+        with self._lock:
+            self._client = None
+            self._spreadsheet = None
+            self._abas = {}
+
+    def fechar(self):
+        """Fecha a sessão HTTP do cliente (as conexões abertas com o Google) e descarta o cliente."""
+        with self._lock:
+            sessao = getattr(getattr(self._client, 'http_client', None), 'session', None)
+            if sessao is not None:
+                sessao.close()
+            self.invalidar()
+
+    @property
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                self._conectar()
+            else:
+                self._renovar_token_se_preciso()
+            return self._spreadsheet
+
+    def aba(self, titulo):
+        """Retorna o handle da aba, buscando os metadados só se ainda não estiver em cache."""
+        spreadsheet = self.spreadsheet
+        with self._lock:
+            ws = self._abas.get(titulo)
+        if ws is None:
+            # A busca vai à rede e pode esperar na fila da cota: fora do lock, para não
+            # travar as outras sessões da loja enquanto isso
+            ws = self._guardar_aba(spreadsheet, titulo, spreadsheet.worksheet(titulo))
+        return ws
+
+    def garantir_aba(self, titulo, cabecalho):
+        """Cria a aba com o cabeçalho se ela ainda não existir (sem chamadas se já estiver em cache)."""
+        spreadsheet = self.spreadsheet
+        with self._lock:
+            ws = self._abas.get(titulo)
+        if ws is not None:
+            return ws
+        try:
+            return self._guardar_aba(spreadsheet, titulo, spreadsheet.worksheet(titulo))
+        except gspread.exceptions.WorksheetNotFound:
+            pass
+        # Só a criação é serializada (com um lock próprio), para duas sessões não criarem a mesma aba
+        with self._criacao:
+            with self._lock:
+                ws = self._abas.get(titulo)
+            if ws is None:
+                ws = spreadsheet.add_worksheet(titulo, rows=100, cols=len(cabecalho))
+                ws.update([cabecalho], 'A1')
+                ws = self._guardar_aba(spreadsheet, titulo, ws)
+            return ws
+
+    def _guardar_aba(self, spreadsheet, titulo, ws):
+        """Guarda o handle buscado fora do lock, a menos que a conexão tenha sido refeita nesse meio-tempo."""
+        with self._lock:
+            if self._spreadsheet is not spreadsheet:
+                return ws
+            return self._abas.setdefault(titulo, ws)
+
+    def executar(self, operacao):
+        """Executa operacao() e, se o token tiver sido rejeitado, reconecta e tenta uma vez mais.
+
+        A operação deve obter as abas via self.aba(...) para receber os handles novos na repetição.
+        """
+        try:
+            return operacao()
+        except gspread.exceptions.APIError as e:
+            if getattr(e, 'code', None) not in CODIGOS_ERRO_AUTENTICACAO:
+                raise
+        except Exception as e:
+            # google.auth.exceptions.RefreshError e afins
+            if 'RefreshError' not in type(e).__name__:
+                raise
+        self.invalidar()
+        return operacao()
+
+
+# --- Leitura em lote ---
+
+def ler_abas(conexao, titulos=ABAS_DADOS):
+    """Lê todas as abas pedidas numa única requisição values:batchGet.
+
+    Retorna {titulo: linhas}, no mesmo formato de get_all_values() (linhas com
+    a mesma largura). Se o lote for recusado pela API, as abas são lidas em
+    paralelo, uma requisição por aba.
+    """
+    titulos = list(titulos)
+
+    def _ler():
+        try:
+            resposta = conexao.spreadsheet.values_batch_get([absolute_range_name(t) for t in titulos])
+            faixas = [faixa.get('values', []) for faixa in resposta.get('valueRanges', [])]
+        except gspread.exceptions.APIError as e:
+            if getattr(e, 'code', None) in CODIGOS_ERRO_AUTENTICACAO:
+                raise
+            with ThreadPoolExecutor(max_workers=len(titulos)) as pool:
+                faixas = list(pool.map(lambda t: conexao.aba(t).get_all_values(), titulos))
+        # A API omite células vazias no fim das linhas; completa como o get_all_values faz
+        return {t: fill_gaps(valores) if valores else [] for t, valores in zip(titulos, faixas)}
+
+    return conexao.executar(_ler)
+
+
+def _faixa(titulo, inicio, fim, ultima_coluna):
+    return absolute_range_name(titulo, f"A{inicio}:{ultima_coluna}{fim}")
+
+
+def _letra_coluna(numero):
+    return rowcol_to_a1(1, numero).rstrip('1')
+
+
+def localizar_linhas(conexao, titulo, cabecalho_esperado, datas):
+    """Busca só as linhas de 'titulo' cujas datas estão em 'datas', com o número de cada uma.
+
+    Faz duas leituras pequenas: cabeçalho + coluna Data (para localizar as
+    linhas) e, depois, apenas os blocos de linhas encontrados. Retorna
+    (cabecalho_online, {data: [(numero, linha)]}), com as datas como
+    datetime.date. Se o cabeçalho online não for 'cabecalho_esperado', a coluna
+    lida pode não ser a Data: volta (cabecalho_online, None) para o chamador
+    decidir se tenta de novo com o cabeçalho certo.
+    """
+    return localizar_linhas_abas(conexao, {titulo: (cabecalho_esperado, datas)})[titulo]
+
+
+def localizar_linhas_abas(conexao, pedidos):
+    """localizar_linhas de várias abas ({titulo: (cabecalho_esperado, datas)}) com as mesmas duas leituras.
+
+    Retorna {titulo: (cabecalho_online, {data: [(numero, linha)]} ou None)}.
+    """
+    pedidos = {titulo: (list(esperado), {d.toordinal(): d for d in datas}) for titulo, (esperado, datas) in pedidos.items()}
+
+    def _ler():
+        spreadsheet = conexao.spreadsheet
+        faixas = []
+        for titulo, (esperado, _) in pedidos.items():
+            letra_data = _letra_coluna(esperado.index('Data') + 1 if 'Data' in esperado else 1)
+            faixas += [absolute_range_name(titulo, '1:1'), absolute_range_name(titulo, f"{letra_data}2:{letra_data}")]
+        resposta = spreadsheet.values_batch_get(faixas)['valueRanges']
+        resultado, blocos = {}, []
+        for i, (titulo, (esperado, ordinais)) in enumerate(pedidos.items()):
+            cabecalho_faixa, coluna_faixa = resposta[2 * i], resposta[2 * i + 1]
+            cabecalho = (cabecalho_faixa.get('values') or [[]])[0]
+            if cabecalho != esperado:
+                resultado[titulo] = (cabecalho, None)
+                continue
+            resultado[titulo] = (cabecalho, {})
+            if 'Data' not in cabecalho:
+                continue  # aba vazia ou sem datas: nenhuma linha a localizar
+            datas_online = [linha[0] if linha else '' for linha in coluna_faixa.get('values', [])]
+            encontrados = ordinais_de_datas(pd.Series(datas_online, dtype=object))
+            linhas = [int(i) + 2 for i in np.flatnonzero(np.isin(encontrados, list(ordinais)))]
+            blocos += [(titulo, inicio, fim, encontrados) for inicio, fim in sorted(_blocos_contiguos(linhas))]
+        if not blocos:
+            return resultado
+        resposta = spreadsheet.values_batch_get([
+            _faixa(titulo, inicio, fim, _letra_coluna(len(resultado[titulo][0]))) for titulo, inicio, fim, _ in blocos
+        ])
+        for (titulo, inicio, fim, encontrados), faixa in zip(blocos, resposta.get('valueRanges', [])):
+            cabecalho, por_data = resultado[titulo]
+            ordinais = pedidos[titulo][1]
+            valores = fill_gaps(faixa.get('values', []), rows=fim - inicio + 1, cols=len(cabecalho))
+            for numero, linha in zip(range(inicio, fim + 1), valores):
+                por_data.setdefault(ordinais[int(encontrados[numero - 2])], []).append((numero, linha))
+        return resultado
+
+    return conexao.executar(_ler)
+
+
+def ler_meses(conexao, meses):
+    """Linhas das abas de dados com datas nos meses 'AAAA-MM', como {aba: [cabecalho] + linhas}.
+
+    Cada mês é uma faixa de linhas das abas, localizada pela coluna Data: só
+    as linhas dele são baixadas, então memória e tempo acompanham os meses
+    pedidos, não o histórico inteiro. Linhas sem ID ganham um na planilha.
+    """
+    datas = dias_dos_meses(meses)
+    localizadas = localizar_linhas_abas(conexao, {aba: (COLUNAS_POR_ABA[aba], datas) for aba in ABAS_DADOS})
+    # Abas com cabeçalho diferente do padrão: localiza de novo pela coluna Data certa
+    refazer = {aba: (cabecalho, datas) for aba, (cabecalho, por_data) in localizadas.items() if por_data is None and cabecalho}
+    if refazer:
+        localizadas.update(localizar_linhas_abas(conexao, refazer))
+    valores = {}
+    for aba, (cabecalho, por_data) in localizadas.items():
+        if por_data is None and cabecalho:
+            raise RuntimeError(f"O cabeçalho da aba '{aba}' mudou durante a leitura.")
+        numeradas = sorted((linha for linhas in (por_data or {}).values() for linha in linhas), key=lambda n: n[0])
+        garantir_ids(conexao, aba, cabecalho, numeradas)
+        valores[aba] = [cabecalho] + [linha for _, linha in numeradas] if cabecalho else []
+    return valores
+
+
+def ler_meses_da_aba(conexao, titulo, meses):
+    """Como ler_meses, mas de uma aba só ([cabecalho] + linhas) e sem gravar nada: linhas sem ID ficam como estão."""
+    datas = dias_dos_meses(meses)
+    cabecalho, por_data = localizar_linhas(conexao, titulo, COLUNAS_POR_ABA[titulo], datas)
+    if por_data is None and cabecalho:
+        cabecalho, por_data = localizar_linhas(conexao, titulo, cabecalho, datas)
+        if por_data is None:
+            raise RuntimeError(f"O cabeçalho da aba '{titulo}' mudou durante a leitura.")
+    numeradas = sorted((linha for linhas in (por_data or {}).values() for linha in linhas), key=lambda n: n[0])
+    return [cabecalho] + [linha for _, linha in numeradas] if cabecalho else []
+
+
+def ler_linhas_das_datas(conexao, titulo, cabecalho_esperado, datas):
+    """Como localizar_linhas, mas só {data: [linhas]}; None se o cabeçalho online mudou."""
+    if 'Data' not in cabecalho_esperado:
+        return None
+    _, por_data = localizar_linhas(conexao, titulo, cabecalho_esperado, datas)
+    if por_data is None:
+        return None
+    return {data: [linha for _, linha in linhas] for data, linhas in por_data.items()}
+
+
+def garantir_ids(conexao, titulo, cabecalho, numeradas):
+    """Dá um ID às linhas [(numero, linha)] que ainda não têm (antigas ou digitadas direto na planilha).
+
+    Altera cabeçalho e linhas no lugar e grava só as células que faltavam,
+    numa única requisição (criando a coluna no fim do cabeçalho, se preciso).
+    Sem linhas faltando, não faz nenhuma chamada.
+    """
+    if not cabecalho:
+        return
+    criar_coluna = 'ID' not in cabecalho
+    if criar_coluna:
+        cabecalho.append('ID')
+        for _, linha in numeradas:
+            linha.append('')
+    coluna = cabecalho.index('ID')
+    # Linhas totalmente vazias não viram registros, então não ganham ID
+    faltando = {numero: linha for numero, linha in numeradas if not linha[coluna] and any(linha)}
+    if not faltando and not criar_coluna:
+        return
+    for linha in faltando.values():
+        linha[coluna] = novo_id()
+    letra = _letra_coluna(coluna + 1)
+    atualizacoes = [{'range': f"{letra}1", 'values': [['ID']]}] if criar_coluna else []
+    for inicio, fim in sorted(_blocos_contiguos(faltando)):
+        atualizacoes.append({
+            'range': f"{letra}{inicio}:{letra}{fim}",
+            'values': [[faltando[numero][coluna]] for numero in range(inicio, fim + 1)],
+        })
+    conexao.executar(lambda: conexao.aba(titulo).batch_update(atualizacoes))
+
+
+# --- Carimbos por data ---
+
+def ler_carimbos(valores_controle):
+    """{(aba, 'AAAA-MM-DD'): carimbo} a partir das linhas da aba de controle."""
+    carimbos = {}
+    for linha in valores_controle[1:]:
+        if len(linha) >= 3 and linha[0]:
+            carimbos[(linha[0], linha[1])] = linha[2]
+    return carimbos
+
+
+def carimbar(conexao, valores_controle, chaves):
+    """Grava um carimbo novo para cada (aba, data) em 'chaves'; retorna {chave: carimbo}.
+
+    Linhas já existentes são atualizadas num único batch_update e as novas
+    entram num único append (a aba de controle já deve existir).
+    """
+    posicoes = {(linha[0], linha[1]): i + 1 for i, linha in enumerate(valores_controle) if len(linha) >= 2}
+    novos = {}
+    atualizacoes, inserir = [], []
+    for aba, data in chaves:
+        chave = (aba, data.strftime('%Y-%m-%d') if isinstance(data, date) else data)
+        novos[chave] = uuid.uuid4().hex[:12]
+        linha = [chave[0], chave[1], novos[chave]]
+        if chave in posicoes and posicoes[chave] > 1:
+            atualizacoes.append({'range': f"A{posicoes[chave]}:C{posicoes[chave]}", 'values': [linha]})
+        else:
+            inserir.append(linha)
+    if atualizacoes:
+        conexao.executar(lambda: conexao.aba(ABA_CONTROLE).batch_update(atualizacoes))
+    if inserir:
+        conexao.executar(lambda: conexao.aba(ABA_CONTROLE).append_rows(inserir, table_range='A1'))
+    return novos
+
+
+# --- Escrita por data (delta) ---
+
+def _celula(valor):
+    """Converte o valor do app no formato gravado na planilha."""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and math.isnan(valor):
+        return ''
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime('%Y-%m-%d')
+    return valor
+
+
+def _chave_celula(valor):
+    """Forma normalizada para comparar o que está online com o que está no app ('35,00' == 35.0)."""
+    texto = str(_celula(valor)).strip()
+    try:
+        return f"{float(texto.replace(',', '.')):.2f}"
+    except ValueError:
+        return texto
+
+
+def chave_da_linha(linha, largura):
+    """Linha normalizada para comparação, completada com vazios até 'largura' colunas."""
+    chave = tuple(_chave_celula(v) for v in linha)
+    return chave + ('',) * (largura - len(chave))
+
+
+def linha_da_planilha(registro, cabecalho):
+    """Células do registro na ordem do cabeçalho, no formato gravado na planilha."""
+    return [_celula(registro.get(c, '')) for c in cabecalho]
+
+
+def _blocos_contiguos(numeros):
+    """Agrupa números de linha em intervalos contíguos (inicio, fim), do maior para o menor."""
+    blocos = []
+    for n in sorted(numeros, reverse=True):
+        if blocos and blocos[-1][0] == n + 1:
+            blocos[-1][0] = n
+        else:
+            blocos.append([n, n])
+    return blocos
+
+
+def gravar_datas(conexao, titulo, cabecalho, online_por_data, novas_por_data):
+    """Deixa online as linhas de cada data iguais a 'novas_por_data' ({data: [linhas]}).
+
+    'online_por_data' ({data: [(numero, linha)]}) diz onde estão hoje as linhas
+    dessas datas. Linhas idênticas ficam onde estão, as que mudaram reaproveitam
+    posições livres, as que sobram são apagadas e o resto é acrescentado. Todas
+    as datas vão juntas: um batch_update, uma remoção em lote e um append, e as
+    outras datas nunca são reescritas. Cada escrita passa por conexao.executar,
+    como as leituras: um token expirado reconecta e repete só aquela escrita.
+    Retorna o conjunto de datas alteradas.
+    """
+    largura = len(cabecalho)
+    atualizacoes, inserir, remover = [], [], []
+    alteradas = set()
+    for data, novas in novas_por_data.items():
+        livres = {}
+        for pos, linha in online_por_data.get(data, []):
+            livres.setdefault(chave_da_linha(linha, largura), []).append(pos)
+        pendentes = []
+        for linha in novas:
+            chave = chave_da_linha(linha, largura)
+            if livres.get(chave):
+                livres[chave].pop()
+            else:
+                pendentes.append(linha)
+        sobrando = sorted(pos for lista in livres.values() for pos in lista)
+        if pendentes or sobrando:
+            alteradas.add(data)
+        # As linhas que mudaram reaproveitam as posições das que saíram
+        reaproveitadas = list(zip(sobrando, pendentes))
+        atualizacoes += reaproveitadas
+        inserir += pendentes[len(reaproveitadas):]
+        remover += sobrando[len(reaproveitadas):]
+
+    ultima_coluna = _letra_coluna(largura)
+    if atualizacoes:
+        conexao.executar(lambda: conexao.aba(titulo).batch_update([
+            {'range': f"A{pos}:{ultima_coluna}{pos}", 'values': [linha]}
+            for pos, linha in atualizacoes
+        ]))
+    if remover:
+        # De baixo para cima, para a remoção de um bloco não deslocar os seguintes
+        conexao.executar(lambda: conexao.spreadsheet.batch_update({'requests': [
+            {'deleteDimension': {'range': {
+                'sheetId': conexao.aba(titulo).id, 'dimension': 'ROWS', 'startIndex': inicio - 1, 'endIndex': fim
+            }}}
+            for inicio, fim in _blocos_contiguos(remover)
+        ]}))
+    # Acréscimos grandes (ex.: uma importação) vão em lotes, para cada requisição ficar num tamanho razoável
+    for inicio in range(0, len(inserir), LINHAS_POR_APPEND):
+        lote = inserir[inicio:inicio + LINHAS_POR_APPEND]
+        conexao.executar(lambda: conexao.aba(titulo).append_rows(lote, table_range='A1'))
+    return alteradas
@@ -1,264 +1,8 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime, date
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import json
-
-st.set_page_config(
-    page_title="Registro Financeiro - Barbearia Lucas Borges",
-    page_icon="💈" 
-)
-
-# --- CONFIGURAÇÕES ---
-USUARIOS = {
-    "lb": "cn",
-}
-# --- Configuração do Google Sheets ---
-try:
-    credentials_dict = dict(st.secrets["gcp_service_account"])
-    
-    # A linha abaixo substitui toda a lógica de autenticação antiga
-    client = gspread.service_account_from_dict(credentials_dict)
-
-    # O resto do código permanece o mesmo
-    SHEET_ID = st.secrets["sheet_id"] # Assumindo que você moveu para a raiz do secrets.toml
-    spreadsheet = client.open_by_key(SHEET_ID)
-
-    ws_agendamentos = spreadsheet.worksheet('Agendamentos')
-    ws_saidas = spreadsheet.worksheet('Saidas')
-    ws_vendas = spreadsheet.worksheet('Vendas')
-
-except Exception as e:
-    st.error(f"Erro ao conectar com Google Sheets. Verifique suas credenciais e ID da planilha no .streamlit/secrets.toml: {e}")
-    st.stop() # Interrompe a execução se não conseguir conectar
-
-def carregar_dados():
-    try:
-        # --- Carregar Agendamentos ---
-        # Tenta obter todos os valores, incluindo a primeira linha (cabeçalhos)
-        all_values_agendamentos = ws_agendamentos.get_all_values()
-        if not all_values_agendamentos: # Se a aba está completamente vazia
-            df_ag = pd.DataFrame(columns=['Data', 'Horário', 'Cliente', 'Serviço', 'Barbeiro', 'Pagamento', 'Valor (R$)'])
-        else:
-            # A primeira linha são os cabeçalhos
-            headers_ag = all_values_agendamentos[0]
-            # O restante são os dados
-            data_ag = all_values_agendamentos[1:]
-            
-            df_ag = pd.DataFrame(data_ag, columns=headers_ag)
-            df_ag['Pagamento'] = df_ag.get('Pagamento', 'Não informado')
-            
-            # Garantir que todas as colunas esperadas existam
-            expected_ag_cols = ['Data', 'Horário', 'Cliente', 'Serviço', 'Barbeiro', 'Pagamento', 'Valor 1 (R$)', 'Valor 2 (R$)', 'Valor (R$)']
-            for col in expected_ag_cols:
-                if col not in df_ag.columns:
-                    df_ag[col] = '' # Adiciona a coluna vazia se estiver faltando
-            # <<< CORREÇÃO: Converter todas as colunas de valor para numérico, tratando vírgulas >>>
-            valor_cols_ag = ['Valor (R$)', 'Valor 1 (R$)', 'Valor 2 (R$)']
-            for col in valor_cols_ag:
-                if col in df_ag.columns:
-                    # Substitui vírgula por ponto e converte para numérico
-                    df_ag[col] = df_ag[col].astype(str).str.replace(',', '.', regex=False).str.strip()
-                    df_ag[col] = pd.to_numeric(df_ag[col], errors='coerce').fillna(0.0)
-
-        if 'Data' in df_ag.columns:
-            df_ag['Data'] = df_ag['Data'].astype(str)
-            df_ag['Data'] = pd.to_datetime(df_ag['Data'], errors='coerce').dt.date
-        
-        # O erro 'Horário' é tratado aqui. Com a leitura de 'all_values', deve funcionar.
-        if 'Horário' in df_ag.columns:
-            df_ag['Horário'] = df_ag['Horário'].astype(str).apply(
-                lambda x: x if ':' in x else (f"{int(float(x)):02d}:00" if x.replace('.', '', 1).isdigit() else x)
-            )
-        else: # Se por algum motivo 'Horário' ainda não aparecer, isso vai alertar.
-            st.warning("Aviso: Coluna 'Horário' não foi encontrada na aba 'Agendamentos' após o carregamento. Verifique sua planilha.")
-            # Para evitar erro, podemos adicionar uma coluna vazia, se não tiver sido adicionada já.
-            if 'Horário' not in df_ag.columns:
-                df_ag['Horário'] = ''
-
-
-        # --- Carregar Saídas ---
-        all_values_saidas = ws_saidas.get_all_values()
-        if not all_values_saidas:
-            df_sai = pd.DataFrame(columns=['Data', 'Descrição', 'Valor (R$)'])
-        else:
-            headers_sai = all_values_saidas[0]
-            data_sai = all_values_saidas[1:]
-            df_sai = pd.DataFrame(data_sai, columns=headers_sai)
-            # <<< CORREÇÃO: Substitui vírgula por ponto antes de converter para número >>>
-            if 'Valor (R$)' in df_sai.columns:
-                df_sai['Valor (R$)'] = df_sai['Valor (R$)'].astype(str).str.replace(',', '.', regex=False).str.strip()
-                df_sai['Valor (R$)'] = pd.to_numeric(df_sai['Valor (R$)'], errors='coerce').fillna(0.0)
-            expected_sai_cols = ['Data', 'Descrição', 'Valor (R$)']
-            for col in expected_sai_cols:
-                if col not in df_sai.columns:
-                    df_sai[col] = ''
-
-        if 'Data' in df_sai.columns:
-            df_sai['Data'] = df_sai['Data'].astype(str)
-            df_sai['Data'] = pd.to_datetime(df_sai['Data'], errors='coerce').dt.date
-
-
-        # --- Carregar Vendas ---
-        all_values_vendas = ws_vendas.get_all_values()
-        if not all_values_vendas:
-            df_ven = pd.DataFrame(columns=['Data', 'Item', 'Valor (R$)'])
-        else:
-            headers_ven = all_values_vendas[0]
-            data_ven = all_values_vendas[1:]
-            df_ven = pd.DataFrame(data_ven, columns=headers_ven)
-            # <<< CORREÇÃO: Substitui vírgula por ponto antes de converter para número >>>
-            if 'Valor (R$)' in df_ven.columns:
-                df_ven['Valor (R$)'] = df_ven['Valor (R$)'].astype(str).str.replace(',', '.', regex=False).str.strip()
-                df_ven['Valor (R$)'] = pd.to_numeric(df_ven['Valor (R$)'], errors='coerce').fillna(0.0)
-            expected_ven_cols = ['Data', 'Item', 'Valor (R$)']
-            for col in expected_ven_cols:
-                if col not in df_ven.columns:
-                    df_ven[col] = ''
-
-        if 'Data' in df_ven.columns:
-            df_ven['Data'] = df_ven['Data'].astype(str)
-            df_ven['Data'] = pd.to_datetime(df_ven['Data'], errors='coerce').dt.date
-            
-        return df_ag, df_sai, df_ven
-    
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error("Planilha Google não encontrada. Verifique o ID no .streamlit/secrets.toml.")
-        return None, None, None
-    except gspread.exceptions.APIError as e:
-        st.error(f"Erro da API Google Sheets: {e}. Verifique as permissões da conta de serviço e se as APIs estão ativadas.")
-        return None, None, None
-    except Exception as e:
-        st.error(f"Erro inesperado ao carregar dados do Google Sheets: {e}")
-        return None, None, None
-
-def salvar_dados(agendamentos, saidas, vendas, data_selecionada):
-    try:
-        # --- PARTE 1: VERIFICAÇÕES DE SEGURANÇA INICIAIS (MANTIDAS) ---
-        df_ag_local_full = pd.DataFrame(agendamentos)
-        df_sai_local_full = pd.DataFrame(saidas)
-        df_ven_local_full = pd.DataFrame(vendas)
-
-        # Travas de segurança originais
-        if df_ag_local_full.empty and len(ws_agendamentos.get_all_values()) > 1:
-            st.sidebar.error("SALVAMENTO CANCELADO (AG): O app não tem dados, mas a planilha online sim. Operação bloqueada.")
-            return
-        if df_sai_local_full.empty and len(ws_saidas.get_all_values()) > 1:
-            st.sidebar.error("SALVAMENTO CANCELADO (SA): O app não tem dados, mas a planilha online sim. Operação bloqueada.")
-            return
-        if df_ven_local_full.empty and len(ws_vendas.get_all_values()) > 1:
-            st.sidebar.error("SALVAMENTO CANCELADO (VE): O app não tem dados, mas a planilha online sim. Operação bloqueada.")
-            return
-
-        # --- PARTE 2: LÓGICA DE ATUALIZAÇÃO SEGURA POR DATA (MAIS ROBUSTA) ---
-        with st.spinner("Salvando dados de forma segura..."):
-            
-            # --- Processamento de AGENDAMENTOS ---
-            dados_online_ag = ws_agendamentos.get_all_records()
-            df_online_ag = pd.DataFrame(dados_online_ag)
-            df_outros_dias_ag = pd.DataFrame()
-            if not df_online_ag.empty and 'Data' in df_online_ag.columns:
-                df_online_ag['Data_formatada'] = pd.to_datetime(df_online_ag['Data'], errors='coerce').dt.date
-                df_outros_dias_ag = df_online_ag[df_online_ag['Data_formatada'] != data_selecionada].copy()
-                df_outros_dias_ag.drop(columns=['Data_formatada'], inplace=True, errors='ignore')
-            
-            # CORREÇÃO: Inicializa um DataFrame vazio e só filtra se for seguro fazer isso
-            df_dia_atual_ag = pd.DataFrame()
-            if not df_ag_local_full.empty and 'Data' in df_ag_local_full.columns:
-                df_dia_atual_ag = df_ag_local_full[df_ag_local_full['Data'] == data_selecionada].copy()
-
-            df_final_ag = pd.concat([df_outros_dias_ag, df_dia_atual_ag], ignore_index=True)
-            if 'Data' in df_final_ag.columns and not df_final_ag.empty:
-                df_final_ag['Data'] = pd.to_datetime(df_final_ag['Data']).dt.strftime('%Y-%m-%d')
-
-            # --- Processamento de SAÍDAS ---
-            dados_online_sai = ws_saidas.get_all_records()
-            df_online_sai = pd.DataFrame(dados_online_sai)
-            df_outros_dias_sai = pd.DataFrame()
-            if not df_online_sai.empty and 'Data' in df_online_sai.columns:
-                df_online_sai['Data_formatada'] = pd.to_datetime(df_online_sai['Data'], errors='coerce').dt.date
-                df_outros_dias_sai = df_online_sai[df_online_sai['Data_formatada'] != data_selecionada].copy()
-                df_outros_dias_sai.drop(columns=['Data_formatada'], inplace=True, errors='ignore')
-            
-            df_dia_atual_sai = pd.DataFrame()
-            if not df_sai_local_full.empty and 'Data' in df_sai_local_full.columns:
-                df_dia_atual_sai = df_sai_local_full[df_sai_local_full['Data'] == data_selecionada].copy()
-
-            df_final_sai = pd.concat([df_outros_dias_sai, df_dia_atual_sai], ignore_index=True)
-            if 'Data' in df_final_sai.columns and not df_final_sai.empty:
-                df_final_sai['Data'] = pd.to_datetime(df_final_sai['Data']).dt.strftime('%Y-%m-%d')
-
-            # --- Processamento de VENDAS ---
-            dados_online_ven = ws_vendas.get_all_records()
-            df_online_ven = pd.DataFrame(dados_online_ven)
-            df_outros_dias_ven = pd.DataFrame()
-            if not df_online_ven.empty and 'Data' in df_online_ven.columns:
-                df_online_ven['Data_formatada'] = pd.to_datetime(df_online_ven['Data'], errors='coerce').dt.date
-                df_outros_dias_ven = df_online_ven[df_online_ven['Data_formatada'] != data_selecionada].copy()
-                df_outros_dias_ven.drop(columns=['Data_formatada'], inplace=True, errors='ignore')
-
-            df_dia_atual_ven = pd.DataFrame()
-            if not df_ven_local_full.empty and 'Data' in df_ven_local_full.columns:
-                df_dia_atual_ven = df_ven_local_full[df_ven_local_full['Data'] == data_selecionada].copy()
-
-            df_final_ven = pd.concat([df_outros_dias_ven, df_dia_atual_ven], ignore_index=True)
-            if 'Data' in df_final_ven.columns and not df_final_ven.empty:
-                df_final_ven['Data'] = pd.to_datetime(df_final_ven['Data']).dt.strftime('%Y-%m-%d')
-
-            # --- PARTE 3: ATUALIZAÇÃO DAS PLANILHAS ---
-            # (Esta parte permanece a mesma)
-            ws_agendamentos.clear()
-            if not df_final_ag.empty:
-                ws_agendamentos.update([df_final_ag.columns.values.tolist()] + df_final_ag.fillna("").values.tolist())
-            else:
-                ws_agendamentos.update([['Data', 'Horário', 'Cliente', 'Serviço', 'Barbeiro', 'Pagamento', 'Valor 1 (R$)', 'Valor 2 (R$)', 'Valor (R$)']])
-
-            ws_saidas.clear()
-            if not df_final_sai.empty:
-                ws_saidas.update([df_final_sai.columns.values.tolist()] + df_final_sai.fillna("").values.tolist())
-            else:
-                ws_saidas.update([['Data', 'Descrição', 'Valor (R$)']])
-
-            ws_vendas.clear()
-            if not df_final_ven.empty:
-                ws_vendas.update([df_final_ven.columns.values.tolist()] + df_final_ven.fillna("").values.tolist())
-            else:
-                ws_vendas.update([['Data', 'Item', 'Valor (R$)', 'Vendedor']])
-                
-            st.sidebar.success("Dados salvos no Google Sheets com sucesso!")
-
-    except gspread.exceptions.APIError as e:
-        st.sidebar.error(f"Erro de API do Google: {e}. Verifique as permissões da planilha.")
-    except Exception as e:
-        st.sidebar.error(f"Ocorreu um erro inesperado ao salvar: {e}")
-        
-def gerar_horarios(inicio_hora, fim_hora, intervalo_min):
-    horarios = []
-    current = datetime(1, 1, 1, inicio_hora, 0)
-    end = datetime(1, 1, 1, fim_hora, 0)
-    while current <= end:
-        horarios.append(current.strftime('%H:%M'))
-        current += pd.Timedelta(minutes=intervalo_min)
-    return horarios
-
-# Versão CORRIGIDA
-def agendamento_existe(agendamentos, data, horario, barbeiro):
-    """Verifica se já existe um agendamento para o mesmo barbeiro no mesmo dia e horário."""
-    for ag in agendamentos:
-        # Garante que a comparação de datas funcione corretamente
-        ag_data = ag.get("Data")
-        if isinstance(ag_data, str):
-            try:
-                ag_data = datetime.strptime(ag_data, '%Y-%m-%d').date()
-            except ValueError:
-                continue # Pula registros com formato de data inválido
-
-        if (ag_data == data and
-            ag.get("Horário") == horario and
-            ag.get("Barbeiro") == barbeiro):
-            return True # Conflito encontrado!
-    return False # Horário livre  
+import importlib
+import threading
+from datetime import datetime, date, timedelta
+from lojas import ler_lojas, loja_do_login
 
 # --- CONFIG PÁGINA ---
 st.set_page_config(
@@ -274,21 +18,45 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- ESTADOS INICIAIS ---
-if 'logged_in' not in st.session_state:
-    st.session_state.logged_in = False
-if 'agendamentos' not in st.session_state:
-    st.session_state.agendamentos = []
-if 'saidas' not in st.session_state:
-    st.session_state.saidas = []
-if 'vendas' not in st.session_state:
-    st.session_state.vendas = []
-if 'dados_carregados' not in st.session_state:
-    st.session_state.dados_carregados = False
+# --- CONFIGURAÇÕES ---
+# Padrões de cada loja; sem a seção [lojas] no secrets.toml, valem para a loja única
+USUARIOS = {
+    "lb": "cn",
+}
+# Usuários que veem o painel de uso da API na barra lateral
+ADMINISTRADORES = {"lb"}
+BARBEIROS = ["Aluízio", "Lucas Borges", "Erik"]
+VENDEDORES = ["Lucas Borges", "Aluízio", "Erik", "Maria"]
+# Módulos pesados do app (pandas, gspread, numpy...): só são usados depois do login
+MODULOS_DO_APP = ('pandas', 'gspread', 'dados', 'planilhas', 'metricas', 'armazenamento',
+                  'copia_local', 'gravador', 'historico', 'relatorios', 'importacao', 'ocupacao', 'lojas_ativas')
+
+@st.cache_resource(show_spinner=False)
+def importar_em_segundo_plano():
+    """Importa os módulos do app numa thread (uma vez por processo) enquanto a tela de login está aberta."""
+    def _importar():
+        for modulo in MODULOS_DO_APP:
+            try:
+                importlib.import_module(modulo)
+            except Exception:
+                return  # O import normal, depois do login, mostra o erro
+    threading.Thread(target=_importar, daemon=True).start()
+
+# --- LOJAS ---
+# Cada login leva à loja do usuário: a planilha, a equipe e os administradores dela
+try:
+    LOJAS = ler_lojas(st.secrets, st.secrets.get("armazenamento", "planilha"),
+                      USUARIOS, ADMINISTRADORES, BARBEIROS, VENDEDORES)
+except Exception as e:
+    st.error(f"Configuração das lojas inválida no .streamlit/secrets.toml: {e}")
+    st.stop()
 
 # --- LOGIN ---
-# --- LOGIN ---
-if not st.session_state.logged_in:
+# Desenhado antes de qualquer import pesado ou conexão: a tela aparece na hora e
+# uma falha na planilha não impede ninguém de entrar (o login abre pela cópia local).
+# Uma loja tirada da configuração desconecta quem estava nela.
+if not st.session_state.get('logged_in', False) or st.session_state.get('loja') not in LOJAS:
+    importar_em_segundo_plano()
     login_col1, login_col2, login_col3 = st.columns([1, 1, 1])
     with login_col2:
         st.markdown("<h1 style='text-align: center;'>Acesso Restrito</h1>", unsafe_allow_html=True)
@@ -312,67 +80,354 @@ if not st.session_state.logged_in:
         login_button = st.button("Entrar")
 
         if login_button:
-            if username in USUARIOS and USUARIOS[username] == password:
-                # Mostra uma mensagem enquanto carrega
-                with st.spinner("Conectando e carregando dados..."):
-                    df_ag, df_sai, df_ven = carregar_dados()
-
-                # --- VERIFICAÇÃO CRÍTICA ---
-                # Verifica se os dados foram realmente carregados
-                if df_ag is not None and df_sai is not None and df_ven is not None:
-                    # Se o carregamento foi bem-sucedido, prossiga
-                    st.session_state.logged_in = True
-                    st.session_state.dados_carregados = True
-
-                    st.session_state.agendamentos = df_ag.to_dict('records')
-                    st.session_state.saidas = df_sai.to_dict('records')
-                    st.session_state.vendas = df_ven.to_dict('records')
-
-                    for agendamento in st.session_state.agendamentos:
-                        if "Pagamento" not in agendamento:
-                            agendamento["Pagamento"] = "Não informado"
-
-                    st.success("Login e carregamento de dados bem-sucedidos!")
-                    st.rerun()
-                else:
-                    # Se o carregamento falhou, exibe o erro e NÃO faz login
-                    st.error("Falha ao carregar os dados da planilha. Verifique a conexão e tente novamente.")
-                    # Não altera 'logged_in' ou 'dados_carregados'
-
+            loja = loja_do_login(LOJAS, username, password)
+            if loja is not None:
+                st.session_state.usuario = username
+                st.session_state.loja = loja.id
+                # Os dados são carregados no próximo rerun, já com a página principal na tela
+                st.session_state.logged_in = True
+                st.session_state.dados_carregados = False
+                st.rerun()
             else:
                 st.error("Usuário ou senha incorretos.")
+    st.stop()
+
+# --- MÓDULOS DO APP ---
+import pandas as pd
+import gspread
+from planilhas import ABA_AGENDAMENTOS, ABA_SAIDAS, ABA_VENDAS, ABAS_DADOS
+from dados import (
+    TabelaRegistros, TabelaAgendamentos, ESQUEMA_AGENDAMENTOS, ESQUEMA_SAIDAS, ESQUEMA_VENDAS,
+    novo_id, mes_de, meses_ao_redor,
+)
+from historico import VisaoDaSessao
+from lojas_ativas import MAXIMO_LOJAS_ATIVAS, MESES_JANELA, obter_lojas_ativas
+from relatorios import resumo_periodo
+from metricas import LIMITE_POR_MINUTO, resumo_da_api, resumo_das_etapas
+from importacao import MAXIMO_RECUSAS, exportar_csv, ler_em_blocos, preparar_bloco, separar_conflitos
+from ocupacao import (DIAS_DA_SEMANA, horarios_cronicos, horarios_de_pico, mapa_de_calor, ocupacao_periodo,
+                      taxas_por_dia_da_semana, taxas_por_horario, utilizacao_por_barbeiro)
+
+# --- Configuração do Google Sheets ---
+try:
+    # 'planilha' (Google Sheets) ou 'sqlite' (arquivo local na pasta de cache, sem rede)
+    TIPO_ARMAZENAMENTO = st.secrets.get("armazenamento", "planilha")
+    PASTA_CACHE = st.secrets.get("pasta_cache", ".cache_registro")
+    LOJA = LOJAS[st.session_state.loja]
+    # Meses carregados no login, antes e depois do atual; os demais são buscados quando abertos
+    MESES_JANELA = int(st.secrets.get("meses_janela", MESES_JANELA))
+    # Recursos das lojas em uso, num LRU do processo: as sem uso recente são fechadas
+    lojas_ativas = obter_lojas_ativas(TIPO_ARMAZENAMENTO, PASTA_CACHE,
+                                      int(st.secrets.get("maximo_lojas_ativas", MAXIMO_LOJAS_ATIVAS)), MESES_JANELA)
+    recursos = lojas_ativas.obter(LOJA)
+    # Armazenamento da loja (na planilha, a conexão autentica na primeira leitura)
+    armazenamento = recursos.armazenamento
+    # Tempo de cada chamada à planilha e de cada etapa da tela, para o painel de administração
+    metricas = recursos.metricas
+    # Histórico da loja lido uma vez para todas as sessões; cada sessão guarda só as suas alterações por cima
+    historico = recursos.historico
+    # Alterações vão para um diário local e são gravadas na planilha em segundo plano
+    gravador = recursos.gravador
+    # Resumos de meses fechados, compartilhados pelas sessões da loja e guardados na planilha
+    resumos_mensais = recursos.resumos
+    # Matrizes de ocupação de meses fechados, compartilhadas pelas sessões da loja
+    matrizes_ocupacao = recursos.matrizes
+
+except Exception as e:
+    st.error(f"Erro ao conectar com Google Sheets. Verifique suas credenciais e ID da planilha no .streamlit/secrets.toml: {e}")
+    st.stop() # Interrompe a execução se não conseguir conectar
+
+# Aba da planilha -> (chave em st.session_state, classe da tabela, esquema)
+TABELAS = {
+    ABA_AGENDAMENTOS: ('agendamentos', TabelaAgendamentos, ESQUEMA_AGENDAMENTOS),
+    ABA_SAIDAS: ('saidas', TabelaRegistros, ESQUEMA_SAIDAS),
+    ABA_VENDAS: ('vendas', TabelaRegistros, ESQUEMA_VENDAS),
+}
+
+def atualizar_sessao():
+    """Aponta as tabelas da sessão para os meses compartilhados atuais, já com as gravações novas.
+
+    As datas desta sessão que já foram gravadas saem da camada dela e os
+    carimbos que a sessão conhece são refeitos a partir dos meses.
+    """
+    pendentes = gravador.diario.datas_pendentes()
+    historico.aplicar_gravacoes(gravador.versoes, pendentes)
+    meses = historico.meses(sorted(st.session_state.meses_carregados))
+    # Os de meses não carregados também entram: assinam os resumos mensais guardados
+    carimbos = dict(historico.carimbos)
+    for chave, _, _ in TABELAS.values():
+        visao = st.session_state[chave]
+        visao.usar_meses(meses)
+        visao.descartar_gravadas(pendentes)
+        carimbos.update(visao.carimbos())
+    st.session_state.carimbos = carimbos
+    st.session_state.versao_historico = historico.versao
+
+def carregar_historico():
+    """atualizar_sessao() com as mensagens de erro da leitura; False se o armazenamento não respondeu."""
+    try:
+        atualizar_sessao()
+        return True
+    except gspread.exceptions.SpreadsheetNotFound:
+        st.error("Planilha Google não encontrada. Verifique o ID no .streamlit/secrets.toml.")
+    except gspread.exceptions.APIError as e:
+        st.error(f"Erro da API Google Sheets: {e}. Verifique as permissões da conta de serviço e se as APIs estão ativadas.")
+    except Exception as e:
+        st.error(f"Erro inesperado ao carregar dados do Google Sheets: {e}")
+    return False
+
+def registrar_operacao(aba, tipo, registro):
+    """Anota a alteração no diário local e acorda o gravador; o rerun não espera a planilha.
+
+    A operação leva o carimbo que a sessão conhece da (aba, data): na gravação,
+    um carimbo diferente indica que outro aparelho alterou o mesmo dia.
+    """
+    registrar_operacoes(aba, tipo, [registro])
+
+def registrar_operacoes(aba, tipo, registros):
+    """Como registrar_operacao, para vários registros numa só transação do diário."""
+    gravador.diario.registrar_varios(aba, tipo, [
+        (registro, st.session_state.carimbos.get((aba, registro['Data'].strftime('%Y-%m-%d')), ''))
+        for registro in registros
+    ])
+    gravador.acordar()
+
+def mostrar_conflitos():
+    """Avisa das operações recusadas na gravação e as tira da tela até alguém tomar ciência."""
+    for conflito in gravador.diario.conflitos():
+        # O registro recusado nunca chegou à planilha: some também da tabela desta sessão
+        st.session_state[TABELAS[conflito.aba][0]].remover(conflito.registro)
+        data_conflito = datetime.strptime(conflito.data, '%Y-%m-%d').strftime('%d/%m/%Y')
+        descricao = conflito.registro.get('Cliente') or conflito.registro.get('Descrição') or conflito.registro.get('Item', '')
+        st.sidebar.error(f"⚠️ Conflito em {conflito.aba} ({data_conflito}) – {descricao}: {conflito.descricao}")
+        if st.sidebar.button("Entendi", key=f"conflito_{conflito.id}"):
+            gravador.diario.resolver_conflito(conflito.id)
+            st.rerun()
+
+def carregar_meses(meses):
+    """Abre na sessão meses ainda não carregados nela: da memória do processo ou, se nenhuma sessão os abriu, da planilha.
+
+    Retorna os meses que não puderam ser trazidos (lista vazia se deu tudo certo).
+    """
+    faltando = sorted(set(meses) - st.session_state.meses_carregados)
+    if not faltando:
+        return []
+    try:
+        with st.spinner("Buscando registros de " + ", ".join(faltando) + "..."), metricas.etapa('mês sob demanda'):
+            historico.meses(faltando)
+    except Exception as e:
+        st.error(f"Não foi possível buscar os registros de {', '.join(faltando)} na planilha: {e}")
+        return faltando
+    st.session_state.meses_carregados.update(faltando)
+    meses = historico.meses(sorted(st.session_state.meses_carregados))
+    for chave, _, _ in TABELAS.values():
+        st.session_state[chave].usar_meses(meses)
+    # Atualizado no lugar: resumos e ocupação refazem as chaves com este dicionário depois de chamar esta função
+    st.session_state.carimbos.update(
+        {chave: carimbo for mes in faltando for chave, carimbo in meses[mes].carimbos.items()})
+    return []
+
+def importar_arquivo(aba, arquivo):
+    """Importa um CSV/XLSX da aba em blocos; retorna (aceitas, recusadas, [(linha, motivo)]).
+
+    Cada bloco passa pelas regras dos formulários, traz para a sessão os
+    meses das suas datas (para checar conflitos como agendamento_existe),
+    entra na camada da sessão e vai ao diário numa transação só; o gravador
+    junta tudo em poucas gravações em lote.
+    """
+    chave, classe, esquema = TABELAS[aba]
+    aceitas, total_recusadas, motivos = 0, 0, []
+    progresso = st.progress(0.0, text="Importando...")
+    with metricas.etapa('importação'):
+        for bloco in ler_em_blocos(arquivo, arquivo.name):
+            validas, recusadas = preparar_bloco(aba, bloco)
+            carregar_meses(sorted({texto[:7] for texto in validas['Data']}))
+            tabela = st.session_state[chave]
+            validas, conflitos = separar_conflitos(aba, validas, tabela)
+            recusadas += conflitos
+            if len(validas):
+                nova = classe.de_dataframe(validas, esquema)
+                datas = [date.fromisoformat(texto) for texto in validas['Data']]
+                nova.datas_alteradas.update(datas)
+                tabela.incorporar(nova)
+                registrar_operacoes(aba, 'adicionar', [
+                    {**registro, 'Data': data} for registro, data in zip(validas.to_dict('records'), datas)])
+            aceitas += len(validas)
+            total_recusadas += len(recusadas)
+            motivos += recusadas[:MAXIMO_RECUSAS - len(motivos)]
+            # O tamanho do arquivo enviado dá o progresso sem precisar contar as linhas antes
+            progresso.progress(min(arquivo.tell() / max(arquivo.size, 1), 1.0),
+                               text=f"{aceitas} linha(s) importada(s), {total_recusadas} recusada(s)...")
+    progresso.empty()
+    return aceitas, total_recusadas, sorted(motivos)
+
+def painel_administracao():
+    """Uso da API por etapa, chamadas do último minuto contra a cota e tempo de cada etapa da tela."""
+    with st.sidebar.expander("📊 Uso da API (admin)"):
+        por_minuto = metricas.chamadas_por_minuto()
+        for tipo in ('leituras', 'escritas'):
+            usadas = por_minuto[tipo]
+            st.progress(min(usadas / LIMITE_POR_MINUTO, 1.0),
+                        text=f"{tipo.capitalize()} no último minuto: {usadas}/{LIMITE_POR_MINUTO}")
+        # O expander roda a cada rerun mesmo fechado: as tabelas só são montadas a pedido
+        if st.toggle("Detalhar por etapa", key="detalhar_metricas"):
+            medidas = metricas.medidas()
+            st.caption("Chamadas à planilha por etapa")
+            st.dataframe(resumo_da_api(medidas))
+            st.caption("Tempo das etapas")
+            st.dataframe(resumo_das_etapas(medidas))
+        # O JSONL só é montado no clique
+        st.download_button("Exportar medidas (JSONL)", metricas.exportar_jsonl,
+                           file_name="metricas.jsonl", mime="application/jsonl")
+
+def formatar_reais(valores, traco_se_zero=False):
+    """Valores em 'R$ 0.00' de uma vez só; com 'traco_se_zero', valores zerados viram '-'."""
+    texto = "R$ " + valores.map("{:.2f}".format)
+    return texto.where(valores > 0, "-") if traco_se_zero else texto
+
+def grade_com_exclusao(nome, aba, tabela, registros, exibicao):
+    """Mostra 'exibicao' num único st.dataframe com seleção de linhas e um botão que exclui as selecionadas.
+
+    'registros' é o DataFrame do dia (com a coluna ID) na mesma ordem de 'exibicao'.
+    """
+    # A chave muda junto com as linhas do dia, para a seleção nunca apontar para a linha errada
+    chave = f"grade_{nome}_{hash(tuple(registros['ID']))}"
+    evento = st.dataframe(exibicao, key=chave, on_select="rerun", selection_mode="multi-row", hide_index=True)
+    selecionadas = evento.selection.rows
+    if st.button(f"🗑️ Excluir selecionado(s) ({len(selecionadas)})", key=f"excluir_{nome}", disabled=not selecionadas):
+        for registro in registros.iloc[selecionadas].to_dict('records'):
+            if tabela.remover(registro):
+                registrar_operacao(aba, 'remover', registro)
+        st.toast(f"{len(selecionadas)} registro(s) removido(s)!")
+        st.rerun()
+
+def gerar_horarios(inicio_hora, fim_hora, intervalo_min):
+    horarios = []
+    current = datetime(1, 1, 1, inicio_hora, 0)
+    end = datetime(1, 1, 1, fim_hora, 0)
+    while current <= end:
+        horarios.append(current.strftime('%H:%M'))
+        current += pd.Timedelta(minutes=intervalo_min)
+    return horarios
+
+# Versão CORRIGIDA
+def agendamento_existe(agendamentos, data, horario, barbeiro):
+    """Verifica se já existe um agendamento para o mesmo barbeiro no mesmo dia e horário."""
+    # Consulta direta no índice de ocupação (datas em texto já são convertidas no índice)
+    return agendamentos.horario_ocupado(data, horario, barbeiro)
+
+# --- ESTADOS INICIAIS ---
+if 'dados_carregados' not in st.session_state:
+    st.session_state.dados_carregados = False
+if 'carimbos' not in st.session_state:
+    st.session_state.carimbos = {}
+if 'meses_carregados' not in st.session_state:
+    st.session_state.meses_carregados = set()
+
+# --- CARREGAMENTO DOS DADOS ---
+# O título vai para a tela antes da leitura, que roda logo depois do primeiro desenho
+st.title(f"Registro Diário da {LOJA.nome}")
+if not st.session_state.dados_carregados:
+    # Cada login começa sem alterações próprias: as tabelas da sessão são só
+    # visões dos meses compartilhados, que guardam à parte as datas alteradas nela
+    for aba, (chave, _, _) in TABELAS.items():
+        st.session_state[chave] = VisaoDaSessao(aba)
+    st.session_state.meses_carregados = set(meses_ao_redor(date.today(), MESES_JANELA))
+    with metricas.etapa('login'):
+        # Meses já abertos por outra sessão vêm da memória; no primeiro login do
+        # processo, da cópia local (conferida em segundo plano) ou da planilha
+        with st.spinner("Conectando e carregando dados..."):
+            carregado = carregar_historico()
+
+    # --- VERIFICAÇÃO CRÍTICA ---
+    # Verifica se os dados foram realmente carregados
+    if not carregado:
+        st.error("Falha ao carregar os dados da planilha. Verifique a conexão e tente novamente.")
+        col_tentar, col_sair = st.columns([1, 5])
+        col_tentar.button("Tentar novamente")
+        if col_sair.button("Sair 🔒", key="sair_falha"):
+            st.session_state.logged_in = False
+            st.rerun()
+        st.stop()
+    if 'Horário' not in historico.cabecalhos.get(ABA_AGENDAMENTOS, ['Horário']):
+        # A coluna é criada vazia pelo esquema, mas isso costuma indicar um cabeçalho alterado.
+        st.warning("Aviso: Coluna 'Horário' não foi encontrada na aba 'Agendamentos' após o carregamento. Verifique sua planilha.")
+    st.session_state.dados_carregados = True
+
+# --- PÁGINA PRINCIPAL ---
+# Toda a página medida como uma etapa: aparece no painel de administração
+with metricas.etapa('página'):
+    # --- HISTÓRICO COMPARTILHADO, GRAVAÇÕES DE OUTRAS SESSÕES E CONFLITOS ---
+    if not carregar_historico():
+        st.stop()
+    if historico.erro is not None:
+        st.sidebar.warning(f"Não foi possível conferir a planilha agora; mostrando a última leitura. ({historico.erro})")
+    mostrar_conflitos()
 
-# ... o restante do código ...
-else:
     # --- SIDEBAR ---
-    st.title("Registro Diário da Barbearia Lucas Borges")
     data_selecionada = st.date_input("Selecione a data", value=datetime.today().date(), format="DD/MM/YYYY")
+    # Uma data fora dos meses carregados traz o mês dela da planilha antes de mostrar o dia
+    carregar_meses([mes_de(data_selecionada)])
     st.sidebar.title("Painel de Controle")
     st.sidebar.markdown("---")
+    # Cada alteração já fica no diário local; o botão só antecipa a gravação na planilha
     if st.sidebar.button("Salvar Agendamentos 📂", type="primary"):
-        salvar_dados(st.session_state.agendamentos, st.session_state.saidas, st.session_state.vendas, data_selecionada)
+        gravador.acordar()
     st.sidebar.markdown("---")
-    st.sidebar.info("Lembre-se de salvar suas alterações antes de sair.")
+
+    @st.fragment(run_every=3)
+    def situacao_gravacao():
+        # Cada passada conta como uso, então a loja de uma aba aberta não é fechada. Se
+        # ela ficou ociosa e o LRU a fechou, não reabre a cada 3s: a próxima interação faz isso
+        if not lojas_ativas.manter(recursos):
+            st.caption("💤 Conexão pausada por inatividade; qualquer ação na tela a retoma.")
+            return
+        # Meses compartilhados trocados (conferência, gravações de outras sessões) ou
+        # conflitos novos: um rerun completo atualiza a tela
+        if historico.versao != st.session_state.versao_historico:
+            st.rerun()
+        conflito_novo = any(c.registro.get('ID') in st.session_state[TABELAS[c.aba][0]] for c in gravador.diario.conflitos())
+        if conflito_novo or historico.ha_gravacoes_novas(gravador.versoes, gravador.diario.datas_pendentes()):
+            st.rerun()
+        pendentes = gravador.diario.quantidade()
+        if gravador.erro is not None:
+            st.warning(f"Não foi possível gravar na planilha agora; {pendentes} alteração(ões) guardada(s) no aparelho para nova tentativa. ({gravador.erro})")
+        elif pendentes:
+            st.info(f"⏳ {pendentes} alteração(ões) aguardando gravação na planilha...")
+        elif gravador.ultima_gravacao is not None:
+            st.success(f"✅ Tudo gravado na planilha (última gravação às {gravador.ultima_gravacao.strftime('%H:%M:%S')}).")
+        else:
+            st.success("✅ Nenhuma alteração pendente.")
+    with st.sidebar:
+        situacao_gravacao()
+    if st.session_state.get('usuario') in LOJA.administradores:
+        painel_administracao()
     if st.sidebar.button("Sair 🔒"):
         st.session_state.logged_in = False
         st.session_state.dados_carregados = False
+        st.session_state.pop('usuario', None)
+        st.session_state.pop('loja', None)
         st.rerun()
 
     # --- TÍTULO E ENTRADAS ---
     st.markdown("---")
     opcoes_servicos = ["Degradê", "Pezim", "Barba", "Social", "Tradicional", "Visagismo", "Navalhado"]
     opcoes_pagamento = ["Dinheiro", "Pix", "Cartão", "Dinheiro e Pix", "Cartão e Pix", "Cartão e Dinheiro"]
-    opcoes_barbeiros = ["Aluízio", "Lucas Borges", "Erik"]
+    opcoes_barbeiros = LOJA.barbeiros
     horarios_disponiveis = gerar_horarios(8, 22, 30)
 
     # --- TABS ---
-    tab1, tab2, tab3 = st.tabs(["🗓️ Agendamentos", "💸 Saídas", "💼 Vendas"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["🗓️ Agendamentos", "💸 Saídas", "💼 Vendas", "📈 Relatórios", "🗂️ Importar/Exportar"])
 
     # --- AGENDAMENTOS ---
-    with tab1:
+    with tab1, metricas.etapa('aba agendamentos'):
         st.header(f"Agendamentos - {data_selecionada.strftime('%d/%m/%Y')}")
 
         with st.expander("➕ Registrar Novo Agendamento"):
+            # O barbeiro fica fora do formulário para que a lista de horários se atualize ao trocar
+            barbeiro = st.selectbox("Barbeiro", options=opcoes_barbeiros, key="barbeiro_agendamento")
+            horarios_livres = st.session_state.agendamentos.horarios_livres(data_selecionada, barbeiro, horarios_disponiveis)
+
             # A chave 'form_agendamento_key' ajuda a preservar o estado
             with st.form("form_agendamento", clear_on_submit=True):
                 col1, col2, col3 = st.columns(3)
@@ -381,8 +436,8 @@ else:
                     tipo_servico = st.selectbox("Tipo de Serviço", options=opcoes_servicos)
                     opcao_barba = st.selectbox("Barba", options=["Sem Barba", "Com Barba"])
                 with col2:
-                    horario = st.selectbox("Horário", options=horarios_disponiveis)
-                    barbeiro = st.selectbox("Barbeiro", options=opcoes_barbeiros)
+                    horario = st.selectbox("Horário", options=horarios_livres,
+                                           placeholder="Nenhum horário livre para este barbeiro")
                 with col3:
                     pagamento = st.selectbox("Forma de Pagamento", options=opcoes_pagamento)
                     
@@ -412,6 +467,8 @@ else:
 
                     if not nome_cliente.strip():
                         st.error("O nome do cliente não pode estar vazio.")
+                    elif horario is None:
+                        st.warning("Este barbeiro não tem horários livres nesta data.")
                     elif valor_final <= 0:
                         st.error("O valor total deve ser maior que zero.")
                     elif agendamento_existe(st.session_state.agendamentos, data_selecionada, horario, barbeiro):
@@ -423,13 +480,15 @@ else:
                         else:
                             servico_final = tipo_servico
                         
-                        st.session_state.agendamentos.append({
+                        novo_agendamento = {
                             "Data": data_selecionada, "Horário": horario, "Cliente": nome_cliente.strip(),
                             "Serviço": servico_final, "Barbeiro": barbeiro, "Pagamento": pagamento,
                             "Valor 1 (R$)": valor1_lido if pagamento_combinado else 0.0,
                             "Valor 2 (R$)": valor2_lido if pagamento_combinado else 0.0,
-                            "Valor (R$)": valor_final
-                        })
+                            "Valor (R$)": valor_final, "ID": novo_id()
+                        }
+                        st.session_state.agendamentos.adicionar(novo_agendamento)
+                        registrar_operacao(ABA_AGENDAMENTOS, 'adicionar', novo_agendamento)
                         st.success(f"Agendamento para {nome_cliente} às {horario} registrado!")
 
                     # CORREÇÃO: Deleta as chaves para resetar os campos de valor
@@ -441,92 +500,30 @@ else:
             
             st.markdown("---")
 
-            agendamentos_do_dia = [
-                ag for ag in st.session_state.agendamentos
-                if ag ["Data"] == data_selecionada
-            ]
-            # Na linha 157
-            if agendamentos_do_dia:
+            agendamentos_do_dia = st.session_state.agendamentos.dataframe_do_dia(data_selecionada)
+            if not agendamentos_do_dia.empty:
                 st.subheader(f"Agendamentos para {data_selecionada.strftime('%d/%m/%Y')}")
 
-                agendamentos_para_mostrar = sorted(agendamentos_do_dia, key=lambda x: datetime.strptime(x['Horário'], "%H:%M"))
-
- 
-        
-        # Iterar sobre os agendamentos e adicionar um botão de exclusão
-                (col_idx, col_horario, col_cliente, col_servico, col_barbeiro, col_pagamento, 
-                 col_v1, col_v2, col_valor, col_acao) = st.columns([0.4, 1.0, 1.6, 1.5, 1.2, 1.2, 0.8, 0.8, 0.8, 0.8])
-                with col_idx: st.markdown("**#**")
-                with col_horario: st.markdown("**Horário**")
-                with col_cliente: st.markdown("**Cliente**")
-                with col_servico: st.markdown("**Serviço**")
-                with col_barbeiro: st.markdown("**Barbeiro**")
-                with col_pagamento: st.markdown("**Pagamento**")
-                with col_v1: st.markdown("**Valor 1**")
-                with col_v2: st.markdown("**Valor 2**")
-                with col_valor: st.markdown("**Total**")
-                with col_acao: st.markdown("**Excluir**")
-        
-                for i, agendamento in enumerate(agendamentos_para_mostrar):
-                    (col_idx, col_horario, col_cliente, col_servico, col_barbeiro, col_pagamento, 
-                     col_v1, col_v2, col_valor, col_acao) = st.columns([0.4, 1.0, 1.6, 1.5, 1.2, 1.2, 0.8, 0.8, 0.8, 0.8])
-                    with col_idx:
-                        st.write(i + 1) # Número da linha
-                    with col_horario:
-                        st.write(agendamento.get("Horário", ""))
-                    with col_cliente:
-                        st.write(agendamento.get("Cliente", ""))
-                    with col_servico:
-                        st.write(agendamento.get("Serviço", ""))
-                    with col_barbeiro:
-                        st.write(agendamento.get("Barbeiro", ""))
-                    with col_pagamento:
-                        st.write(agendamento.get("Pagamento", ""))
-                    with col_v1:
-                        try:
-                            valor1 = float(agendamento.get('Valor 1 (R$)', 0) or 0)
-                            if valor1 > 0:
-                                st.write(f"R$ {valor1:.2f}")
-                            else:
-                                st.write("-") # Mostra um traço se não for pagamento combinado
-                        except (ValueError, TypeError):
-                            st.write("-")
-                    with col_v2:
-                        try:
-                            valor2 = float(agendamento.get('Valor 2 (R$)', 0) or 0)
-                            if valor2 > 0:
-                                st.write(f"R$ {valor2:.2f}")
-                            else:
-                                st.write("-")
-                        except (ValueError, TypeError):
-                            st.write("-")
-
-                    with col_valor:
-                        try:
-                            valor = float(agendamento.get('Valor (R$)', 0) or 0)
-                        except (ValueError, TypeError):
-                            valor = 0.0  # valor padrão caso esteja vazio ou inválido
-                        st.write(f"R$ {valor:.2f}")
-                    with col_acao:
-                        if st.button("🗑️", key=f"delete_ag_{i}_{agendamento['Cliente']}_{agendamento['Horário']}"):
-                            # Precisamos encontrar o item original em st.session_state.agendamentos para remover
-                            # já que agendamentos_para_mostrar é uma cópia filtrada
-                            original_index_to_remove = None
-                            for idx, original_ag in enumerate(st.session_state.agendamentos):
-                                if original_ag == agendamento:
-                                    original_index_to_remove = idx
-                                    break
-                            
-                            if original_index_to_remove is not None:
-                                st.session_state.agendamentos.pop(original_index_to_remove)
-                                st.success(f"Agendamento de {agendamento['Cliente']} às {agendamento['Horário']} removido!")
-                                st.rerun()
+                agendamentos_para_mostrar = agendamentos_do_dia.sort_values(
+                    'Horário', key=lambda horarios: horarios.str.zfill(5), kind='stable')
+
+                # Uma única grade para o dia inteiro; a exclusão é feita pelas linhas selecionadas
+                grade_com_exclusao("ag", ABA_AGENDAMENTOS, st.session_state.agendamentos, agendamentos_para_mostrar, pd.DataFrame({
+                    "#": range(1, len(agendamentos_para_mostrar) + 1),
+                    "Horário": agendamentos_para_mostrar["Horário"].values,
+                    "Cliente": agendamentos_para_mostrar["Cliente"].values,
+                    "Serviço": agendamentos_para_mostrar["Serviço"].values,
+                    "Barbeiro": agendamentos_para_mostrar["Barbeiro"].values,
+                    "Pagamento": agendamentos_para_mostrar["Pagamento"].values,
+                    # Mostra um traço se não for pagamento combinado
+                    "Valor 1": formatar_reais(agendamentos_para_mostrar["Valor 1 (R$)"], traco_se_zero=True).values,
+                    "Valor 2": formatar_reais(agendamentos_para_mostrar["Valor 2 (R$)"], traco_se_zero=True).values,
+                    "Total": formatar_reais(agendamentos_para_mostrar["Valor (R$)"]).values,
+                }))
             else:
                 st.info("Nenhum agendamento registrado para esta data")
 
-                        
-                
-    with tab2:
+    with tab2, metricas.etapa('aba saídas'):
         st.header(f"Saídas - {data_selecionada.strftime('%d/%m/%Y')}")
 
         with st.expander("➕ Registrar Nova Saída"):
@@ -543,57 +540,36 @@ else:
                     elif valor_saida <= 0:
                         st.error("O valor da saída deve ser maior que zero.")
                     else:
-                        st.session_state.saidas.append({
-                            "Data": data_selecionada, "Descrição": descricao_saida.strip(), "Valor (R$)": valor_saida
-                        })
+                        nova_saida = {
+                            "Data": data_selecionada, "Descrição": descricao_saida.strip(), "Valor (R$)": valor_saida, "ID": novo_id()
+                        }
+                        st.session_state.saidas.adicionar(nova_saida)
+                        registrar_operacao(ABA_SAIDAS, 'adicionar', nova_saida)
                         st.success(f"Saída de R$ {valor_saida:.2f} registrada!")
         st.markdown("---")
 
         # Exibir saídas do dia
-        saidas_do_dia = [
-            s for s in st.session_state.saidas
-            if s["Data"] == data_selecionada
-        ]
-        if saidas_do_dia:
-           st.subheader(f"Saídas para {data_selecionada.strftime('%d/%m/%Y')}")
-           saidas_para_mostrar = list(saidas_do_dia) 
-           col_idx, col_data, col_descricao, col_valor_saida, col_acao_saida = st.columns([0.5, 1, 3, 1, 0.7])
-           with col_idx: st.markdown("**#**")
-           with col_data: st.markdown("**Data**")
-           with col_descricao: st.markdown("**Descrição**")
-           with col_valor_saida: st.markdown("**Valor (R$)**")
-           with col_acao_saida: st.markdown("**Excluir**")
-           for i, saida in enumerate(saidas_para_mostrar):
-                col_idx, col_data, col_descricao, col_valor_saida, col_acao_saida = st.columns([0.5, 1, 3, 1, 0.7])
-                with col_idx:
-                    st.write(i + 1)
-                with col_data:
-                    st.write(saida["Data"].strftime('%d/%m/%Y')) # Formata a data para exibição
-                with col_descricao:
-                    st.write(saida["Descrição"])
-                with col_valor_saida:
-                    try:
-                        valor_saida = float(str(saida.get('Valor (R$)', 0)).strip().replace(',', '.'))
-                    except (ValueError, TypeError):
-                        valor_saida = 0.0
-                    st.write(f"R$ {valor_saida:.2f}")
-                with col_acao_saida:
-                    if st.button("🗑️", key=f"delete_saida_{i}_{saida['Descrição']}_{saida['Data']}"):
-                        st.session_state.saidas.remove(saida)
-                        st.success(f"Saída '{saida['Descrição']}' de R$ {valor_saida:.2f} removida!")
-                        st.rerun() # Recarregar a página para atualizar a tabela
+        saidas_do_dia = st.session_state.saidas.dataframe_do_dia(data_selecionada)
+        if not saidas_do_dia.empty:
+            st.subheader(f"Saídas para {data_selecionada.strftime('%d/%m/%Y')}")
+            grade_com_exclusao("saida", ABA_SAIDAS, st.session_state.saidas, saidas_do_dia, pd.DataFrame({
+                "#": range(1, len(saidas_do_dia) + 1),
+                "Data": data_selecionada.strftime('%d/%m/%Y'),
+                "Descrição": saidas_do_dia["Descrição"].values,
+                "Valor (R$)": formatar_reais(saidas_do_dia["Valor (R$)"]).values,
+            }))
         else:
             st.info("Nenhuma saída registrada para esta data.")
 
     # --- VENDAS ---
-    with tab3:
+    with tab3, metricas.etapa('aba vendas'):
         st.header(f"Vendas - {data_selecionada.strftime('%d/%m/%Y')}")
 
         with st.expander("➕ Registrar Nova Venda"):
             with st.form("form_venda", clear_on_submit=True):
                 item_venda = st.text_input("Item Vendido")
                 valor_venda = st.number_input("Valor da Venda (R$)", value=None, min_value=0.0, format="%.2f", placeholder="Digite o valor")
-                vendedor = st.selectbox("Vendedor Responsável", ["Lucas Borges", "Aluízio", "Erik", "Maria"], key="vendedor")
+                vendedor = st.selectbox("Vendedor Responsável", LOJA.vendedores, key="vendedor")
                 registrar_venda = st.form_submit_button("Registrar Venda")
 
                 if registrar_venda:
@@ -603,119 +579,176 @@ else:
                     elif valor_venda <= 0:
                         st.error("O valor da venda deve ser maior que zero.")
                     else:
-                        st.session_state.vendas.append({
-                            "Data": data_selecionada, "Item": item_venda.strip(), "Valor (R$)": valor_venda, "Vendedor": vendedor
-                        })
+                        nova_venda = {
+                            "Data": data_selecionada, "Item": item_venda.strip(), "Valor (R$)": valor_venda, "Vendedor": vendedor, "ID": novo_id()
+                        }
+                        st.session_state.vendas.adicionar(nova_venda)
+                        registrar_operacao(ABA_VENDAS, 'adicionar', nova_venda)
                         st.success(f"Venda de {item_venda} por R$ {valor_venda:.2f} registrada!")
 
         st.markdown("---")
 
         # Exibir vendas do dia
-        vendas_do_dia = [
-            v for v in st.session_state.vendas
-            if v["Data"] == data_selecionada
-        ]
-        if vendas_do_dia:
+        vendas_do_dia = st.session_state.vendas.dataframe_do_dia(data_selecionada)
+        if not vendas_do_dia.empty:
             st.subheader(f"Vendas para {data_selecionada.strftime('%d/%m/%Y')}")
-
-            vendas_para_mostrar = list(vendas_do_dia) # Criar uma cópia para iterar
-
-            # Cabeçalho da "tabela" manual para Vendas
-            col_idx, col_data, col_item, col_valor_venda, col_vendedor_header, col_acao_venda = st.columns([0.5, 1, 2, 1, 1, 0.7])
-            with col_idx: st.markdown("**#**")
-            with col_data: st.markdown("**Data**")
-            with col_item: st.markdown("**Item**")
-            with col_valor_venda: st.markdown("**Valor (R$)**")
-            with col_vendedor_header: st.markdown("**Vendedor**")
-            with col_acao_venda: st.markdown("**Excluir**")
-
-            # Iterar sobre as vendas e adicionar um botão de exclusão
-            for i, venda in enumerate(vendas_para_mostrar):
-                col_idx, col_data, col_item, col_valor_venda, col_vendedor, col_acao_venda = st.columns([0.5, 1, 2, 1, 1, 0.7])
-                
-                with col_idx:
-                    st.write(i + 1)
-                with col_data:
-                    st.write(venda["Data"].strftime('%d/%m/%Y')) # Formata a data para exibição
-                with col_item:
-                    st.write(venda["Item"])
-                with col_vendedor:
-                    st.write(venda.get("Vendedor", "-"))
-                with col_valor_venda:
-                    try:
-                        valor_venda = float(str(venda.get('Valor (R$)', 0)).strip().replace(',', '.'))
-                    except (ValueError, TypeError):
-                        valor_venda = 0.0
-                    st.write(f"R$ {valor_venda:.2f}")
-                with col_acao_venda:
-                    if st.button("🗑️", key=f"delete_venda_{i}_{venda['Item']}_{venda['Data']}"):
-                        st.session_state.vendas.remove(venda)
-                        st.success(f"Venda '{venda['Item']}' de R$ {valor_venda:.2f} removida!")
-                        st.rerun()
+            grade_com_exclusao("venda", ABA_VENDAS, st.session_state.vendas, vendas_do_dia, pd.DataFrame({
+                "#": range(1, len(vendas_do_dia) + 1),
+                "Data": data_selecionada.strftime('%d/%m/%Y'),
+                "Item": vendas_do_dia["Item"].values,
+                "Valor (R$)": formatar_reais(vendas_do_dia["Valor (R$)"]).values,
+                "Vendedor": vendas_do_dia["Vendedor"].replace('', '-').values,
+            }))
         else:
             st.info("Nenhuma venda registrada para esta data.")
 
-    # --- RESUMO FINANCEIRO ---
-    st.markdown("---")
-    st.header("📊 Relatório Diário")
-    ag = st.session_state.agendamentos
-    sai = st.session_state.saidas
-    ven = st.session_state.vendas
-
-    servicos_lucas = 0
-    servicos_aluizio = 0
-    servicos_erik = 0 # Novo contador para o Erik
-
-# Itera sobre todos os agendamentos registrados na sessão
-    for agendamento in ag:
-        if agendamento.get("Data") == data_selecionada:
-            servico = agendamento.get("Serviço", "")
-            barbeiro = agendamento.get("Barbeiro")
-        
-            contagem = 2 if "com Barba" in servico else 1
-        
-        # Adiciona a contagem ao total do barbeiro correspondente
-            if barbeiro == "Lucas Borges":
-                servicos_lucas += contagem
-            elif barbeiro == "Aluízio":
-                servicos_aluizio += contagem
-            elif barbeiro == "Erik": # Adicionada a condição para o Erik
-                servicos_erik += contagem
-
-
-    def valor_seguro(valor):
-        try:
-            return float(valor)
-        except (ValueError, TypeError):
-            return 0.0
-        
-    total_ag = sum(valor_seguro(reg.get("Valor (R$)", 0)) for reg in ag if reg.get("Data") == data_selecionada)
-    total_sai = sum(valor_seguro(reg.get("Valor (R$)", 0)) for reg in sai if reg.get("Data") == data_selecionada)
-    total_ven = sum(valor_seguro(reg.get("Valor (R$)", 0)) for reg in ven if reg.get("Data") == data_selecionada)
-    
-    lucro = total_ag + total_ven - total_sai
-
-    st.subheader("Financeiro")
-    col1, col2, col3, col4 = st.columns(4)
-    col1.metric("💼 Agendamentos", f"R$ {total_ag:.2f}")
-    col2.metric("💼 Vendas", f"R$ {total_ven:.2f}")
-    col3.metric("💸 Saídas", f"R$ {total_sai:.2f}")
-    col4.metric("📈 Lucro Líquido", f"R$ {lucro:.2f}")
+    # --- RELATÓRIOS POR PERÍODO ---
+    with tab4, metricas.etapa('aba relatórios'):
+        periodo = st.radio("Período", ["Semana", "Mês", "Ano", "Personalizado"], horizontal=True, key="periodo_relatorio")
+        if periodo == "Semana":
+            inicio = data_selecionada - timedelta(days=data_selecionada.weekday())
+            fim = inicio + timedelta(days=6)
+        elif periodo == "Mês":
+            inicio = data_selecionada.replace(day=1)
+            fim = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        elif periodo == "Ano":
+            inicio, fim = date(data_selecionada.year, 1, 1), date(data_selecionada.year, 12, 31)
+        else:
+            intervalo = st.date_input("Intervalo", value=(data_selecionada.replace(day=1), data_selecionada),
+                                      format="DD/MM/YYYY", key="intervalo_relatorio")
+            inicio, fim = intervalo if len(intervalo) == 2 else (intervalo[0], intervalo[0])
+
+        st.header(f"Relatório de {inicio.strftime('%d/%m/%Y')} a {fim.strftime('%d/%m/%Y')}")
+        resumo = resumo_periodo(
+            (st.session_state.agendamentos, st.session_state.saidas, st.session_state.vendas),
+            inicio, fim, st.session_state.carimbos, resumos_mensais, carregar_meses=carregar_meses,
+        )
+        lucro_periodo = resumo['agendamentos'] + resumo['vendas'] - resumo['saidas']
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("💼 Agendamentos", f"R$ {resumo['agendamentos']:.2f}")
+        col2.metric("💼 Vendas", f"R$ {resumo['vendas']:.2f}")
+        col3.metric("💸 Saídas", f"R$ {resumo['saidas']:.2f}")
+        col4.metric("📈 Lucro Líquido", f"R$ {lucro_periodo:.2f}")
+
+        col_prod, col_pag = st.columns(2)
+        with col_prod:
+            st.subheader("Produtividade")
+            if resumo['atendimentos']:
+                st.dataframe(pd.DataFrame(
+                    sorted(resumo['atendimentos'].items(), key=lambda item: -item[1]),
+                    columns=["Barbeiro", "Serviço(s)"]), hide_index=True)
+            else:
+                st.info("Nenhum atendimento no período.")
+        with col_pag:
+            st.subheader("Formas de Pagamento")
+            if resumo['pagamentos']:
+                pagamentos = pd.DataFrame(
+                    sorted(resumo['pagamentos'].items(), key=lambda item: -item[1]),
+                    columns=["Forma de Pagamento", "Valor (R$)"])
+                total_pago = pagamentos["Valor (R$)"].sum()
+                pagamentos["Participação"] = (pagamentos["Valor (R$)"] / total_pago * 100).map("{:.1f}%".format) if total_pago else "-"
+                pagamentos["Valor (R$)"] = "R$ " + pagamentos["Valor (R$)"].map("{:.2f}".format)
+                st.dataframe(pagamentos, hide_index=True)
+            else:
+                st.info("Nenhum pagamento no período.")
 
-    st.markdown("---")
+        st.subheader("Ocupação da Agenda")
+        matriz = ocupacao_periodo(
+            st.session_state.agendamentos, inicio, fim, horarios_disponiveis, opcoes_barbeiros,
+            st.session_state.carimbos, matrizes_ocupacao, carregar_meses=carregar_meses,
+        )
+        if not matriz.any():
+            st.info("Nenhum agendamento no período.")
+        else:
+            taxas = taxas_por_horario(matriz)
+            utilizacao = utilizacao_por_barbeiro(matriz, opcoes_barbeiros)
+            for coluna, linha in zip(st.columns(len(utilizacao)), utilizacao.itertuples(index=False)):
+                coluna.metric(f"Ocupação ({linha.Barbeiro})", f"{linha.Ocupação:.0%}",
+                              f"{linha.Agendamentos} agendamento(s)", delta_color="off")
+            st.caption("Fração dos dias de expediente (dias com algum agendamento) em que cada horário estava ocupado.")
+            st.altair_chart(mapa_de_calor(taxas.T, opcoes_barbeiros, "Barbeiro", horarios_disponiveis, "Horário"))
+            barbeiro_semana = st.selectbox("Por dia da semana", ["Todos"] + opcoes_barbeiros, key="barbeiro_ocupacao")
+            posicao = None if barbeiro_semana == "Todos" else opcoes_barbeiros.index(barbeiro_semana)
+            st.altair_chart(mapa_de_calor(taxas_por_dia_da_semana(matriz, inicio, posicao),
+                                          DIAS_DA_SEMANA, "Dia", horarios_disponiveis, "Horário"))
+
+            lotados, ociosos = horarios_cronicos(taxas, horarios_disponiveis, opcoes_barbeiros)
+            col_pico, col_lotados, col_ociosos = st.columns(3)
+            percentual = {"Ocupação": st.column_config.NumberColumn(format="percent")}
+            with col_pico:
+                st.markdown("**Horários de pico**")
+                st.dataframe(horarios_de_pico(taxas, horarios_disponiveis), hide_index=True, column_config=percentual)
+            with col_lotados:
+                st.markdown("**Sempre cheios**")
+                st.dataframe(lotados, hide_index=True, column_config=percentual)
+            with col_ociosos:
+                st.markdown("**Sempre vazios**")
+                st.dataframe(ociosos, hide_index=True, column_config=percentual)
+
+    # --- IMPORTAÇÃO E EXPORTAÇÃO ---
+    with tab5, metricas.etapa('aba importar/exportar'):
+        st.header("Importar registros antigos")
+        st.caption("CSV (vírgula ou ponto e vírgula) ou XLSX com as mesmas colunas da planilha; "
+                   "as linhas passam pelas mesmas regras dos formulários.")
+        aba_importacao = st.selectbox("Tipo de registro", ABAS_DADOS, key="aba_importacao")
+        arquivo = st.file_uploader("Arquivo", type=["csv", "xlsx"], key="arquivo_importacao")
+        importados = st.session_state.setdefault('arquivos_importados', set())
+        if arquivo is not None and arquivo.file_id in importados:
+            st.info("Este arquivo já foi importado nesta sessão.")
+        elif st.button("📥 Importar", disabled=arquivo is None):
+            try:
+                aceitas, recusadas, motivos = importar_arquivo(aba_importacao, arquivo)
+            except Exception as e:
+                st.error(f"Não foi possível ler o arquivo: {e}")
+            else:
+                importados.add(arquivo.file_id)
+                st.success(f"{aceitas} registro(s) importado(s) e enviados para gravação; {recusadas} recusado(s).")
+                if motivos:
+                    st.dataframe(pd.DataFrame(motivos, columns=["Linha", "Motivo"]), hide_index=True)
 
-# Exibição da contagem de serviços por barbeiro
-    st.subheader("Produtividade")
-    servicos_totais = servicos_lucas + servicos_aluizio + servicos_erik
-    col_lucas, col_aluizio, col_erik, col_total = st.columns(4)
-    
-    col_lucas.metric("Atendimentos (Lucas Borges)", f"{servicos_lucas} Serviço(s)")
-    col_aluizio.metric("Atendimentos (Aluízio)", f"{servicos_aluizio} Serviço(s)")
-    col_erik.metric("Atendimentos (Erik)", f"{servicos_erik} Serviço(s)")
-    col_total.metric("Atendimentos Totais", f"{servicos_totais} Serviço(s)")
+        st.markdown("---")
+        st.header("Exportar registros")
+        aba_exportacao = st.selectbox("Tipo de registro", ABAS_DADOS, key="aba_exportacao")
+        intervalo_exportacao = st.date_input("Período", value=(data_selecionada.replace(day=1), data_selecionada),
+                                             format="DD/MM/YYYY", key="intervalo_exportacao")
+        inicio_exp, fim_exp = (intervalo_exportacao if len(intervalo_exportacao) == 2
+                               else (intervalo_exportacao[0], intervalo_exportacao[0]))
+        # O arquivo só é montado no clique, numa thread à parte, lendo alguns meses por vez do armazenamento
+        st.download_button(
+            "📤 Exportar CSV",
+            lambda: exportar_csv(armazenamento, aba_exportacao, inicio_exp, fim_exp),
+            file_name=f"{aba_exportacao}_{inicio_exp:%Y-%m-%d}_{fim_exp:%Y-%m-%d}.csv",
+            mime="text/csv",
+        )
 
+    # --- RESUMO FINANCEIRO ---
+    with metricas.etapa('relatório diário'):
+        st.markdown("---")
+        st.header("📊 Relatório Diário")
+        ag = st.session_state.agendamentos
+        sai = st.session_state.saidas
+        ven = st.session_state.vendas
 
+        total_ag = ag.total_do_dia(data_selecionada)
+        total_sai = sai.total_do_dia(data_selecionada)
+        total_ven = ven.total_do_dia(data_selecionada)
 
+        lucro = total_ag + total_ven - total_sai
 
+        st.subheader("Financeiro")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("💼 Agendamentos", f"R$ {total_ag:.2f}")
+        col2.metric("💼 Vendas", f"R$ {total_ven:.2f}")
+        col3.metric("💸 Saídas", f"R$ {total_sai:.2f}")
+        col4.metric("📈 Lucro Líquido", f"R$ {lucro:.2f}")
 
+        st.markdown("---")
 
+    # Exibição da contagem de serviços por barbeiro
+        st.subheader("Produtividade")
+        # Contagens mantidas pela tabela a cada inclusão/remoção; os barbeiros vêm dos próprios registros
+        atendimentos = ag.atendimentos_do_dia(data_selecionada)
+        colunas_produtividade = st.columns(len(atendimentos) + 1)
+        for coluna, barbeiro in zip(colunas_produtividade, sorted(atendimentos)):
+            coluna.metric(f"Atendimentos ({barbeiro})", f"{atendimentos[barbeiro]} Serviço(s)")
+        colunas_produtividade[-1].metric("Atendimentos Totais", f"{sum(atendimentos.values())} Serviço(s)")
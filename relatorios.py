@@ -0,0 +1,171 @@
+"""Relatórios por período (semana, mês, ano ou intervalo livre) com resumos mensais guardados na planilha."""
+import calendar
+import hashlib
+import json
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from dados import MARCA_BARBA
+
+
+def resumo_vazio():
+    return {'agendamentos': 0.0, 'vendas': 0.0, 'saidas': 0.0, 'atendimentos': {}, 'pagamentos': {}}
+
+
+def pesos_atendimento(servicos):
+    """Atendimentos que cada serviço conta na produtividade: 2 com barba, 1 sem."""
+    return np.where(servicos.str.contains(MARCA_BARBA, regex=False).to_numpy(dtype=bool), 2, 1)
+
+
+def _somar_em(destino, origem):
+    for chave, valor in origem.items():
+        destino[chave] = round(destino.get(chave, 0) + valor, 2)
+
+
+def somar_resumos(resumos):
+    total = resumo_vazio()
+    for resumo in resumos:
+        for chave in ('agendamentos', 'vendas', 'saidas'):
+            total[chave] = round(total[chave] + resumo[chave], 2)
+        _somar_em(total['atendimentos'], resumo['atendimentos'])
+        _somar_em(total['pagamentos'], resumo['pagamentos'])
+    return total
+
+
+def resumos_por_mes(ag, sai, ven):
+    """{'AAAA-MM': resumo} de cada mês presente nos DataFrames, com um groupby por figura."""
+    resumos = {}
+
+    def _mes(df):
+        return df['Data'].dt.to_period('M').astype(str)
+
+    def _resumo(mes):
+        return resumos.setdefault(mes, resumo_vazio())
+
+    for chave, df in (('agendamentos', ag), ('vendas', ven), ('saidas', sai)):
+        for mes, total in df.groupby(_mes(df))['Valor (R$)'].sum().items():
+            _resumo(mes)[chave] = round(float(total), 2)
+
+    meses_ag = _mes(ag)
+    atendimentos = pd.Series(pesos_atendimento(ag['Serviço']), index=ag.index).groupby([meses_ag, ag['Barbeiro']]).sum()
+    for (mes, barbeiro), quantidade in atendimentos.items():
+        _resumo(mes)['atendimentos'][barbeiro] = int(quantidade)
+    pagamentos = ag.groupby([meses_ag, ag['Pagamento']])['Valor (R$)'].sum()
+    for (mes, forma), total in pagamentos.items():
+        _resumo(mes)['pagamentos'][forma] = round(float(total), 2)
+    return resumos
+
+
+def assinatura_do_mes(carimbos, mes):
+    """Resumo dos carimbos das datas do mês: muda sempre que alguma data do mês é gravada."""
+    do_mes = sorted((aba, data, carimbo) for (aba, data), carimbo in carimbos.items() if data.startswith(mes))
+    return hashlib.sha1(json.dumps(do_mes).encode('utf-8')).hexdigest()[:12]
+
+
+def meses_do_intervalo(inicio, fim):
+    """(primeiro_dia, ultimo_dia, 'AAAA-MM') de cada mês que toca o intervalo, cortado nos limites dele."""
+    atual = inicio.replace(day=1)
+    while atual <= fim:
+        ultimo = atual.replace(day=calendar.monthrange(atual.year, atual.month)[1])
+        yield max(atual, inicio), min(ultimo, fim), atual.strftime('%Y-%m')
+        atual = ultimo + timedelta(days=1)
+
+
+class ResumosMensais:
+    """Resumos de meses fechados, na memória do processo e no armazenamento.
+
+    Os guardados são lidos numa thread na criação; até lá (ou se falhar) os
+    relatórios só calculam tudo a partir dos registros. Cada resumo guarda a
+    assinatura dos carimbos do mês, então uma gravação naquele mês o invalida.
+    """
+
+    def __init__(self, armazenamento):
+        self.armazenamento = armazenamento
+        self._lock = threading.Lock()
+        self._resumos = {}
+        threading.Thread(target=self._carregar, daemon=True).start()
+
+    def _carregar(self):
+        try:
+            with self.armazenamento.metricas.etapa('resumos'):
+                guardados = self.armazenamento.ler_resumos()
+        except Exception:
+            return
+        with self._lock:
+            for mes, (assinatura, resumo) in guardados.items():
+                try:
+                    self._resumos.setdefault(mes, (assinatura, json.loads(resumo)))
+                except ValueError:
+                    continue
+
+    def obter(self, mes, assinatura):
+        with self._lock:
+            guardado = self._resumos.get(mes)
+        return guardado[1] if guardado and guardado[0] == assinatura else None
+
+    def guardar(self, novos):
+        """Guarda {mes: (assinatura, resumo)} na memória e no armazenamento, em segundo plano."""
+        with self._lock:
+            self._resumos.update(novos)
+        threading.Thread(target=self._gravar, args=(dict(novos),), daemon=True).start()
+
+    def _gravar(self, novos):
+        try:
+            with self.armazenamento.metricas.etapa('resumos'):
+                self.armazenamento.gravar_resumos({
+                    mes: (assinatura, json.dumps(resumo, ensure_ascii=False))
+                    for mes, (assinatura, resumo) in novos.items()
+                })
+        except Exception:
+            pass  # O resumo continua na memória; outra sessão volta a gravá-lo
+
+
+def resumo_periodo(tabelas, inicio, fim, carimbos, cache, hoje=None, carregar_meses=None):
+    """Resumo de [inicio, fim] a partir de (agendamentos, saídas, vendas).
+
+    Meses inteiros e já fechados vêm do cache quando a assinatura confere;
+    só os demais dias são lidos dos registros, em uma passada por tabela, e os
+    meses fechados calculados agora vão para o cache. Meses com alterações
+    desta sessão ainda não refletidas nos carimbos nunca usam nem alimentam o cache.
+    'carregar_meses', se dado, recebe os meses lidos dos registros antes da
+    leitura, para trazer os que ainda não estão nas tabelas, e retorna os que
+    não conseguiu trazer: esses entram no total como estiverem, mas não no cache.
+    """
+    hoje = hoje or date.today()
+    alteradas = {d.strftime('%Y-%m') for tabela in tabelas for d in tabela.datas_alteradas}
+    do_cache, intervalos, fechados, lidos = [], [], {}, []
+    for primeiro, ultimo, mes in meses_do_intervalo(inicio, fim):
+        mes_inteiro = primeiro.day == 1 and (ultimo + timedelta(days=1)).day == 1
+        if mes_inteiro and ultimo < hoje.replace(day=1) and mes not in alteradas:
+            assinatura = assinatura_do_mes(carimbos, mes)
+            guardado = cache.obter(mes, assinatura)
+            if guardado is not None:
+                do_cache.append(guardado)
+                continue
+            fechados[mes] = assinatura
+        lidos.append(mes)
+        # Dias vizinhos sem resumo são lidos juntos
+        if intervalos and intervalos[-1][1] + timedelta(days=1) == primeiro:
+            intervalos[-1][1] = ultimo
+        else:
+            intervalos.append([primeiro, ultimo])
+
+    calculados = {}
+    if lidos and carregar_meses is not None:
+        falharam = set(carregar_meses(lidos))
+        # Assinaturas refeitas depois da leitura, que pode ter trazido os carimbos do mês; um mês
+        # que não veio daria um resumo zerado guardado com a assinatura certa, e nunca seria refeito
+        fechados = {mes: assinatura_do_mes(carimbos, mes) for mes in fechados if mes not in falharam}
+    if intervalos:
+        ag, sai, ven = (
+            pd.concat([tabela.dataframe_periodo(a, b) for a, b in intervalos], ignore_index=True)
+            for tabela in tabelas
+        )
+        calculados = resumos_por_mes(ag, sai, ven)
+    novos = {mes: (assinatura, calculados.get(mes, resumo_vazio())) for mes, assinatura in fechados.items()}
+    if novos:
+        cache.guardar(novos)
+    return somar_resumos(do_cache + list(calculados.values()))
@@ -1,32 +1,129 @@
 // sw.js
 
+// Trocar a versão ao mudar este arquivo ou os ícones/manifesto: o 'activate' apaga os caches das versões anteriores.
+const VERSAO = 'v4';
+const PREFIXO = 'registro-lb-';
+// Os arquivos do app ficam num cache à parte do dos pacotes: só o dos pacotes é aparado.
+const CACHE_APP = `${PREFIXO}app-${VERSAO}`;
+const CACHE_ESTATICOS = `${PREFIXO}estaticos-${VERSAO}`;
+const CACHE_SHELL = `${PREFIXO}shell-${VERSAO}`;
+const CACHES_ATUAIS = [CACHE_APP, CACHE_ESTATICOS, CACHE_SHELL];
+
+// Arquivos do próprio app, guardados já na instalação.
+const ARQUIVOS_DO_APP = ['manifest.json', 'icone_192.png', 'icone_512.png'];
+// Pacotes do Streamlit têm hash no nome (Audio.Cwcr9Jeu.js, DataFrame.DUkanX9_.css; o Vite usa
+// base64url, não só hexadecimal), então nunca mudam de conteúdo.
+const ESTATICO_COM_HASH = /\/static\/(js|css|media)\/[^/]+\.[A-Za-z0-9_-]{8,}\.[^/]+$/;
+// Limite de pacotes guardados: versões novas do Streamlit trazem nomes novos e os velhos sairiam só na troca de VERSAO.
+const MAXIMO_ESTATICOS = 80;
+
 /**
  * @description Adiciona um ouvinte para o evento 'install'.
- * Este evento é disparado quando o Service Worker é instalado pela primeira vez.
- * É um bom lugar para preparar caches.
+ * Guarda os arquivos do app e a página inicial (o "shell"), para que o
+ * app instalado abra sem esperar a rede.
  */
 self.addEventListener('install', (event) => {
-  console.log('Service Worker: Evento de instalação em progresso.');
-  // self.skipWaiting() força o novo service worker a se tornar ativo imediatamente.
-  self.skipWaiting();
+  event.waitUntil((async () => {
+    const app = await caches.open(CACHE_APP);
+    const shell = await caches.open(CACHE_SHELL);
+    // Um arquivo que falhe não impede a instalação; ele entra no cache na primeira vez que for pedido.
+    await Promise.allSettled([
+      ...ARQUIVOS_DO_APP.map((arquivo) => app.add(arquivo)),
+      shell.add('./'),
+    ]);
+    // self.skipWaiting() força o novo service worker a se tornar ativo imediatamente.
+    await self.skipWaiting();
+  })());
 });
 
 /**
  * @description Adiciona um ouvinte para o evento 'activate'.
- * Este evento é disparado quando o Service Worker é ativado.
- * É um bom lugar para limpar caches antigos.
+ * Apaga os caches de versões anteriores deste service worker e assume as
+ * abas já abertas.
  */
 self.addEventListener('activate', (event) => {
-  console.log('Service Worker: Evento de ativação em progresso.');
+  event.waitUntil((async () => {
+    const nomes = await caches.keys();
+    await Promise.all(
+      nomes
+        .filter((nome) => nome.startsWith(PREFIXO) && !CACHES_ATUAIS.includes(nome))
+        .map((nome) => caches.delete(nome)),
+    );
+    await self.clients.claim();
+  })());
 });
 
+/**
+ * @description Apaga as entradas mais antigas do cache até sobrarem 'maximo'.
+ */
+async function aparar(cache, maximo) {
+  const chaves = await cache.keys();
+  await Promise.all(chaves.slice(0, Math.max(0, chaves.length - maximo)).map((chave) => cache.delete(chave)));
+}
+
+/**
+ * @description Cache primeiro: responde do cache 'nome' e só vai à rede (guardando a resposta) se não houver cópia.
+ * Com 'maximo', o cache é aparado depois de cada resposta guardada.
+ */
+async function cachePrimeiro(event, nome, maximo) {
+  const cache = await caches.open(nome);
+  const guardada = await cache.match(event.request);
+  if (guardada) {
+    return guardada;
+  }
+  const resposta = await fetch(event.request);
+  if (resposta.ok) {
+    const guardar = cache.put(event.request, resposta.clone());
+    event.waitUntil(maximo ? guardar.then(() => aparar(cache, maximo)) : guardar);
+  }
+  return resposta;
+}
+
+/**
+ * @description Stale-while-revalidate: responde na hora com a cópia guardada (se houver)
+ * e atualiza o cache pela rede em segundo plano, para a próxima abertura.
+ */
+async function copiaEnquantoAtualiza(event, chave) {
+  const cache = await caches.open(CACHE_SHELL);
+  const guardada = await cache.match(chave);
+  const daRede = fetch(event.request).then((resposta) => {
+    if (resposta.ok) {
+      return cache.put(chave, resposta.clone()).then(() => resposta);
+    }
+    return resposta;
+  });
+  if (guardada) {
+    // Sem rede, a atualização falha em silêncio e a cópia guardada continua valendo.
+    event.waitUntil(daRede.catch(() => undefined));
+    return guardada;
+  }
+  return daRede;
+}
+
 /**
  * @description Adiciona um ouvinte para o evento 'fetch'.
- * Este evento é disparado para cada requisição de rede feita pela página.
- * É o que permite que o aplicativo funcione offline, interceptando requisições.
- * Nesta versão básica, ele simplesmente repassa a requisição para a rede.
+ * Só GETs do próprio site passam pelo cache: pacotes com hash e arquivos do
+ * app vêm do cache primeiro, a página inicial usa stale-while-revalidate e
+ * o resto (a conexão com o servidor em /_stcore/, outros sites) segue direto
+ * para a rede, sem passar pelo service worker.
  */
 self.addEventListener('fetch', (event) => {
-  console.log('Service Worker: Buscando recurso:', event.request.url);
-  event.respondWith(fetch(event.request));
+  const pedido = event.request;
+  if (pedido.method !== 'GET') {
+    return;
+  }
+  const url = new URL(pedido.url);
+  if (url.origin !== self.location.origin || url.pathname.includes('/_stcore/')) {
+    return;
+  }
+
+  const arquivo = url.pathname.split('/').pop();
+  if (ARQUIVOS_DO_APP.includes(arquivo)) {
+    event.respondWith(cachePrimeiro(event, CACHE_APP));
+  } else if (ESTATICO_COM_HASH.test(url.pathname)) {
+    event.respondWith(cachePrimeiro(event, CACHE_ESTATICOS, MAXIMO_ESTATICOS));
+  } else if (pedido.mode === 'navigate') {
+    // Toda navegação do app abre a mesma página; a chave ignora a query string (?embed=true etc.).
+    event.respondWith(copiaEnquantoAtualiza(event, new URL('./', self.registration.scope).href));
+  }
 });